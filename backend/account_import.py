@@ -0,0 +1,228 @@
+"""Streaming import of accounts from a CSV upload.
+
+The upload is read in fixed-size chunks and parsed incrementally; valid rows
+are inserted into the ``accounts`` table in batched transactions, so memory
+use does not depend on the size of the file.
+
+With several shards a batch is split by the shards of the new account ids.
+The other shards are written first and shard 0, which holds the job's
+checkpoint, last; ids of a job's accounts are derived from the job id and the
+row number, so a batch repeated after a crash between the two does not
+create the same accounts twice.
+"""
+import asyncio
+import functools
+import logging
+import os
+import shutil
+import sqlite3
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from starlette.datastructures import UploadFile
+
+from money import to_minor
+from streams import aiter_csv_rows, aiter_lines, aiter_upload
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+# Каталог, куда загрузки сохраняются до окончания фонового импорта
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploads")
+MAX_REPORTED_ERRORS = 1000
+REQUIRED_COLUMNS = ("name", "balance")
+
+
+class ImportResult:
+    def __init__(self, state: Optional[Dict] = None):
+        state = state or {}
+        # Номер последней строки, вошедшей в зафиксированный батч
+        self.row = state.get("row", 0)
+        self.inserted = state.get("inserted", 0)
+        self.skipped = state.get("skipped", 0)
+        self.errors: List[Dict] = list(state.get("errors", []))
+
+    def skip(self, row_number: int, error: str):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": error})
+
+    def state(self) -> Dict:
+        return {"row": self.row, "inserted": self.inserted, "skipped": self.skipped, "errors": self.errors}
+
+    def to_dict(self) -> Dict:
+        return {
+            "inserted": self.inserted,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "errors_truncated": self.skipped > len(self.errors),
+        }
+
+
+def parse_account_row(values: Dict[str, str]) -> Tuple[str, int]:
+    """Validate one CSV record, raising ValueError with a readable message"""
+    name = (values.get("name") or "").strip()
+    if not name:
+        raise ValueError("Empty name")
+    raw_balance = (values.get("balance") or "").strip()
+    try:
+        balance = to_minor(raw_balance)
+    except ValueError:
+        raise ValueError(f"Invalid balance: {raw_balance!r}")
+    if balance < 0:
+        raise ValueError("Balance cannot be negative")
+    return name, balance
+
+
+def insert_accounts(conn: sqlite3.Connection, rows: List[Tuple[str, str, int]],
+                    checkpoint: Optional[Callable] = None) -> int:
+    """Insert one batch of (id, name, balance in kopecks) rows in a single transaction.
+
+    Ids already present are left as they are. ``checkpoint(conn)`` runs
+    inside the transaction, right before the commit.
+    """
+    conn.executemany("INSERT OR IGNORE INTO accounts (id, name, balance) VALUES (?, ?, ?)", rows)
+    if checkpoint is not None:
+        checkpoint(conn)
+    conn.commit()
+    return len(rows)
+
+
+async def insert_by_shard(fn, rows: List[Tuple[str, str, int]], checkpoint: Optional[Callable] = None) -> int:
+    """``insert_accounts`` through the writers of the rows' shards; the checkpoint goes with shard 0"""
+    from database import shard_count, shard_for
+    from db_executor import run_write, run_write_on
+
+    if shard_count() == 1:
+        return await run_write(fn, rows, checkpoint)
+    parts = defaultdict(list)
+    for row in rows:
+        parts[shard_for(row[0])].append(row)
+    inserted = sum(await asyncio.gather(*(
+        run_write_on(shard, fn, part) for shard, part in parts.items() if shard != 0
+    )))
+    return inserted + await run_write(fn, parts.get(0, []), checkpoint)
+
+
+async def import_accounts(file, write=None, batch_size: int = BATCH_SIZE,
+                          resume_from: Optional[Dict] = None,
+                          progress: Optional[Callable[[ImportResult], None]] = None,
+                          checkpoint: Optional[Callable[[sqlite3.Connection, Dict], None]] = None,
+                          id_namespace: Optional[uuid.UUID] = None) -> ImportResult:
+    """Stream ``file`` (an UploadFile) into the accounts table.
+
+    ``write`` awaits ``fn(conn, *args)`` on the writer connection and defaults
+    to ``insert_by_shard``. ``resume_from`` is a state previously passed
+    to ``checkpoint``, which is called inside every batch's transaction; rows
+    up to the checkpoint are skipped. With ``id_namespace`` the id of the
+    account from row N is ``uuid5(id_namespace, N)``, otherwise random.
+    Raises ValueError if the header lacks required columns.
+    """
+    if write is None:
+        write = insert_by_shard
+
+    result = ImportResult(resume_from)
+    resume_row = result.row
+    header = None
+    row_number = 0
+    batch: List[Tuple[str, str, int]] = []
+    # Построчный отладочный лог: уровень проверяется один раз, поток записей ограничен log_config
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    async def flush():
+        result.row = row_number
+        state = dict(result.state(), inserted=result.inserted + len(batch))
+        save = functools.partial(checkpoint, state=state) if checkpoint is not None else None
+        result.inserted += await write(insert_accounts, batch, save)
+        if progress is not None:
+            progress(result)
+
+    async for values in aiter_csv_rows(aiter_lines(aiter_upload(file))):
+        if header is None:
+            header = [name.strip() for name in values]
+            missing = [name for name in REQUIRED_COLUMNS if name not in header]
+            if missing:
+                raise ValueError(f"CSV header is missing columns: {', '.join(missing)}")
+            continue
+        row_number += 1
+        if row_number <= resume_row:
+            continue
+        if debug:
+            logger.debug("Row %d: %r", row_number, values)
+        try:
+            name, balance = parse_account_row(dict(zip(header, values)))
+        except ValueError as e:
+            if debug:
+                logger.debug("Skipping row %d: %s", row_number, e)
+            result.skip(row_number, str(e))
+            continue
+        account_id = uuid.uuid5(id_namespace, str(row_number)) if id_namespace is not None else uuid.uuid4()
+        batch.append((str(account_id), name, balance))
+        if len(batch) >= batch_size:
+            await flush()
+            batch = []
+    if batch:
+        await flush()
+    result.row = row_number
+    return result
+
+
+def spool_upload(file, filename: str) -> str:
+    """Copy an uploaded file object to UPLOAD_DIR and return its path"""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}.csv")
+    file.seek(0)
+    with open(path, "wb") as out:
+        shutil.copyfileobj(file, out, 1024 * 1024)
+    return path
+
+
+def remove_upload(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def run_job(job) -> Dict:
+    """Background job handler (see jobs.JobRunner) for a spooled upload.
+
+    Progress is measured in bytes of the file; rows up to the checkpoint are
+    skipped on resume. The spooled file is kept only while the job can still
+    continue from its checkpoint: when the process stops (the job resumes at
+    the next start) or the database fails with an OperationalError (busy,
+    I/O), which a resume can get past. A completed, cancelled or otherwise
+    failed import removes it, and cannot be resumed afterwards.
+    """
+    path = job.params["path"]
+    if not os.path.exists(path):
+        raise ValueError("The uploaded file of this import was removed; upload it again")
+    resumable = False
+    try:
+        total = os.path.getsize(path)
+        with open(path, "rb") as f:
+            upload = UploadFile(job.params.get("filename") or os.path.basename(path), file=f,
+                                content_type="text/csv")
+
+            def checkpoint(conn, state):
+                job.save(conn, state, f.tell(), total, "bytes")
+
+            def progress(result):
+                job.raise_if_cancelled()
+
+            result = await import_accounts(
+                upload, resume_from=job.checkpoint, progress=progress, checkpoint=checkpoint,
+                id_namespace=uuid.UUID(job.id)
+            )
+    except (asyncio.CancelledError, sqlite3.OperationalError):
+        resumable = True
+        raise
+    finally:
+        # Файл нужен только задаче, которую можно продолжить
+        if not resumable:
+            remove_upload(path)
+    logger.info(
+        f"Accounts imported from {job.params.get('filename')}: {result.inserted} inserted, {result.skipped} skipped"
+    )
+    return result.to_dict()
@@ -0,0 +1,106 @@
+"""Point-in-time account balances.
+
+The balance of an account at the end of a day is the opening balance of that
+day's month, read from the ``monthly_balances`` checkpoint, plus the sum of the
+month's transactions up to the day. Both parts are index seeks, so the cost of
+a lookup does not grow with the length of the account's history.
+"""
+import sqlite3
+from datetime import date as datetime_date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from database import TRANSACTION_COLUMNS
+from money import to_major, transaction_to_api
+
+# Пар (счет, дата) в одном запросе; 4 параметра на пару
+BATCH_SIZE = 300
+MAX_REPORT_TRANSACTIONS = 100
+
+# Остаток на начало месяца: закрытие предыдущего снимка, иначе открытие
+# ближайшего следующего, иначе текущий баланс (по счету не было операций)
+_BALANCE_AS_OF_EXPR = """
+    COALESCE(
+        (SELECT closing FROM monthly_balances
+         WHERE account_id = q.account_id AND month < q.month
+         ORDER BY month DESC LIMIT 1),
+        (SELECT opening FROM monthly_balances
+         WHERE account_id = q.account_id AND month >= q.month
+         ORDER BY month LIMIT 1),
+        a.balance
+    ) + COALESCE(
+        (SELECT SUM(amount) FROM transactions
+         WHERE account_id = q.account_id AND date >= q.month || '-01' AND date <= q.date),
+        0
+    )
+"""
+
+BALANCES_AS_OF_SQL = """
+    WITH q(position, account_id, date, month) AS (VALUES {values})
+    SELECT q.position, q.account_id, q.date, a.id IS NOT NULL AS found,
+           {expr} AS balance
+    FROM q
+    LEFT JOIN accounts a ON a.id = q.account_id
+""".replace("{expr}", _BALANCE_AS_OF_EXPR)
+
+REPORT_TRANSACTIONS_SQL = f"""
+    SELECT {TRANSACTION_COLUMNS}
+    FROM transactions
+    WHERE account_id = ? AND date <= ?
+    ORDER BY date DESC, id DESC
+    LIMIT ?
+"""
+
+
+def validate_date(value: str) -> str:
+    try:
+        if not isinstance(value, str) or len(value) != 10 or value[4] != "-" or value[7] != "-":
+            raise ValueError(value)
+        datetime_date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date: {value!r}, expected YYYY-MM-DD")
+    return value
+
+
+def balances_as_of(conn: sqlite3.Connection, queries: Iterable[Tuple[str, str]]) -> List[Dict]:
+    """Balances in rubles for many (account_id, date) pairs, in input order.
+
+    ``balance`` is None for accounts that do not exist.
+    """
+    queries = [(account_id, validate_date(date)) for account_id, date in queries]
+    results = []
+    for start in range(0, len(queries), BATCH_SIZE):
+        batch = queries[start:start + BATCH_SIZE]
+        params = []
+        for position, (account_id, date) in enumerate(batch):
+            params.extend((position, account_id, date, date[:7]))
+        sql = BALANCES_AS_OF_SQL.format(values=", ".join("(?, ?, ?, ?)" for _ in batch))
+        rows = sorted(conn.execute(sql, params), key=lambda row: row["position"])
+        results.extend(
+            {
+                "account_id": row["account_id"],
+                "date": row["date"],
+                "balance": to_major(row["balance"]) if row["found"] else None,
+            }
+            for row in rows
+        )
+    return results
+
+
+def balance_as_of(conn: sqlite3.Connection, account_id: str, date: str) -> Optional[float]:
+    """Balance at the end of ``date``, or None if the account is missing"""
+    return balances_as_of(conn, [(account_id, date)])[0]["balance"]
+
+
+def account_report(conn: sqlite3.Connection, account_id: str, date: str,
+                   limit: int = MAX_REPORT_TRANSACTIONS) -> Optional[Dict]:
+    """Balance as of ``date`` and the latest transactions up to it"""
+    balance = balance_as_of(conn, account_id, date)
+    if balance is None:
+        return None
+    transactions = conn.execute(REPORT_TRANSACTIONS_SQL, (account_id, date, limit))
+    return {
+        "account_id": account_id,
+        "date": date,
+        "balance": balance,
+        "transactions": [transaction_to_api(row) for row in transactions],
+    }
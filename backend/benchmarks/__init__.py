@@ -0,0 +1,6 @@
+"""Performance benchmarks for the banking service.
+
+Run from the backend directory, e.g. ``python -m benchmarks.bench_dashboard``.
+``benchmarks.synthetic`` generates books of any size and ``benchmarks.load``
+load-tests every endpoint against a JSON baseline.
+"""
@@ -0,0 +1,78 @@
+"""Streaming account import of a large generated CSV.
+
+    python -m benchmarks.bench_account_import --megabytes 300
+
+Generates the file on disk, streams it through account_import as an UploadFile
+and reports rows/second and peak RSS; memory must stay flat as the file grows.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import time
+
+from starlette.datastructures import UploadFile
+
+import account_import
+from db_pool import ConnectionPool
+from benchmarks.common import temporary_database
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в килобайтах на Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def generate_csv(path: str, megabytes: int) -> int:
+    target = megabytes * 1024 * 1024
+    rows = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("name,balance\n")
+        written = 0
+        while written < target:
+            lines = "".join(
+                f"\"Клиент {rows + i}, накопительный\",{(rows + i) % 100000}.{(rows + i) % 100:02d}\n"
+                for i in range(10000)
+            )
+            f.write(lines)
+            written += len(lines.encode("utf-8"))
+            rows += 10000
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--megabytes", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=account_import.BATCH_SIZE)
+    args = parser.parse_args()
+
+    with temporary_database() as path:
+        csv_path = os.path.join(os.path.dirname(path), "accounts.csv")
+        rows = generate_csv(csv_path, args.megabytes)
+        size_mb = os.path.getsize(csv_path) / 1024 / 1024
+        rss_before = peak_rss_mb()
+
+        pool = ConnectionPool(path, readers=1)
+
+        async def write(fn, *fn_args):
+            with pool.writer() as conn:
+                return fn(conn, *fn_args)
+
+        async def run():
+            with open(csv_path, "rb") as f:
+                upload = UploadFile("accounts.csv", file=f, content_type="text/csv")
+                return await account_import.import_accounts(upload, write=write, batch_size=args.batch_size)
+
+        started = time.perf_counter()
+        result = asyncio.run(run())
+        elapsed = time.perf_counter() - started
+        pool.close()
+        os.remove(csv_path)
+
+        assert result.inserted == rows, (result.inserted, rows, result.errors[:5])
+        print(f"file {size_mb:.0f} MB, {rows} rows imported in {elapsed:.1f} s ({rows / elapsed:.0f} rows/s)")
+        print(f"peak RSS {peak_rss_mb():.0f} MB (before import {rss_before:.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Balance-as-of-date lookups on a long account history: checkpoints vs full scan.
+
+    python -m benchmarks.bench_balances --transactions 1000000 --lookups 1000
+"""
+import argparse
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+from balances import balances_as_of
+from money import to_major
+from benchmarks.common import percentile, populate, temporary_database, timed
+
+
+def scan_balance_as_of(conn, account_id, date):
+    """Current balance minus every later transaction, the pre-checkpoint approach"""
+    row = conn.execute("""
+        SELECT a.balance - COALESCE(
+            (SELECT SUM(amount) FROM transactions WHERE account_id = a.id AND date > ?), 0
+        ) AS balance
+        FROM accounts a WHERE a.id = ?
+    """, (date, account_id)).fetchone()
+    return to_major(row["balance"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transactions", type=int, default=1_000_000, help="transactions on the measured account")
+    parser.add_argument("--days", type=int, default=3 * 365, help="history length in days")
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--scan-lookups", type=int, default=50, help="lookups for the full-scan baseline")
+    args = parser.parse_args()
+
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        print(f"populating {args.transactions} transactions ...")
+        [account_id] = populate(conn, 1, args.transactions, days=args.days)
+        populate(conn, 1000, 20, seed=1)
+        conn.execute("ANALYZE")
+
+        rnd = random.Random(0)
+        today = datetime.now()
+        dates = [(today - timedelta(days=rnd.randrange(args.days))).strftime("%Y-%m-%d")
+                 for _ in range(args.lookups)]
+
+        latencies = []
+        for date in dates:
+            elapsed, _ = timed(balances_as_of, conn, [(account_id, date)])
+            latencies.append(elapsed * 1000)
+        print(f"checkpoint  single  p50 {percentile(latencies, 0.5):8.3f} ms  "
+              f"p99 {percentile(latencies, 0.99):8.3f} ms")
+
+        elapsed, batch = timed(balances_as_of, conn, [(account_id, date) for date in dates])
+        print(f"checkpoint  batch   {len(dates)} lookups in {elapsed * 1000:8.1f} ms")
+
+        latencies = []
+        mismatches = 0
+        for date, result in zip(dates[:args.scan_lookups], batch):
+            elapsed, balance = timed(scan_balance_as_of, conn, account_id, date)
+            latencies.append(elapsed * 1000)
+            mismatches += balance != result["balance"]
+        print(f"full scan   single  p50 {percentile(latencies, 0.5):8.3f} ms  "
+              f"p99 {percentile(latencies, 0.99):8.3f} ms")
+        print(f"mismatches against full scan: {mismatches}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
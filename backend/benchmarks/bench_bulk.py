@@ -0,0 +1,118 @@
+"""Throughput of transaction ingestion: one posting per call vs bulk chunks.
+
+    python -m benchmarks.bench_bulk --rows 200000
+
+Prints rows/second for the per-row path (the logic behind POST /api/transactions),
+for bulk_ingest in-process and for POST /api/transactions/bulk over HTTP (NDJSON).
+"""
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import bulk_ingest
+import repository
+from db_pool import ConnectionPool
+from money import to_minor
+from benchmarks.common import populate, temporary_database
+from benchmarks.http_client import HttpClient
+from benchmarks.server import running_server
+
+
+def make_records(account_ids, rows, seed=0):
+    rnd = random.Random(seed)
+    today = datetime.now()
+    return [
+        {
+            "account_id": rnd.choice(account_ids),
+            "amount": round(rnd.uniform(-500, 500), 2),
+            "date": (today - timedelta(days=rnd.randrange(365))).strftime("%Y-%m-%d"),
+            "comment": "выписка",
+        }
+        for _ in range(rows)
+    ]
+
+
+def bench_per_row(path, records):
+    pool = ConnectionPool(path, readers=1)
+    started = time.perf_counter()
+    with pool.writer() as conn:
+        for record in records:
+            repository.post_transaction(conn, record["account_id"], to_minor(record["amount"]),
+                                        record["date"], record["comment"])
+    elapsed = time.perf_counter() - started
+    pool.close()
+    return elapsed
+
+
+def bench_bulk(path, records, chunk_size):
+    pool = ConnectionPool(path, readers=1)
+
+    async def write(fn, *args):
+        with pool.writer() as conn:
+            return fn(conn, *args)
+
+    started = time.perf_counter()
+    result = asyncio.run(bulk_ingest.ingest(
+        bulk_ingest.aiter_records(enumerate(records, start=1)), write=write, chunk_size=chunk_size
+    ))
+    elapsed = time.perf_counter() - started
+    pool.close()
+    assert result.failed == 0, result.errors[:5]
+    return elapsed
+
+
+def bench_http(path, records):
+    body = "\n".join(json.dumps(record, ensure_ascii=False) for record in records).encode("utf-8")
+
+    async def post(port):
+        client = HttpClient(port=port)
+        status, _, response = await client.request(
+            "POST", "/api/transactions/bulk", body=body,
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+        await client.close()
+        assert status == 200, response[:200]
+        return json.loads(response)
+
+    with running_server(path) as port:
+        started = time.perf_counter()
+        summary = asyncio.run(post(port))
+        elapsed = time.perf_counter() - started
+    assert summary["failed"] == 0, summary["errors"][:5]
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--per-row-max", type=int, default=20_000,
+                        help="rows pushed through the per-row path (it is slow)")
+    parser.add_argument("--chunk-size", type=int, default=bulk_ingest.CHUNK_SIZE)
+    parser.add_argument("--skip-http", action="store_true")
+    args = parser.parse_args()
+
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        account_ids = populate(conn, args.accounts, 0)
+        conn.close()
+        records = make_records(account_ids, args.rows)
+
+        per_row = records[:args.per_row_max]
+        elapsed = bench_per_row(path, per_row)
+        print(f"{'per-row commit':>16}: {len(per_row):>9} rows  {len(per_row) / elapsed:>10.0f} rows/s")
+
+        elapsed = bench_bulk(path, records, args.chunk_size)
+        print(f"{'bulk in-process':>16}: {len(records):>9} rows  {len(records) / elapsed:>10.0f} rows/s")
+
+        if not args.skip_http:
+            elapsed = bench_http(path, records)
+            print(f"{'bulk over HTTP':>16}: {len(records):>9} rows  {len(records) / elapsed:>10.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Account / rate lookups through the read cache and conditional dashboard requests.
+
+    python -m benchmarks.bench_cache --accounts 10000 --lookups 20000
+
+In-process: ``repository`` lookups vs the cached ones on a pooled reader,
+with a hot set of accounts. Over HTTP: GET /api/accounts with and without a
+current If-None-Match, and the cache counters afterwards.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import time
+
+import cache
+import database
+import repository
+from benchmarks.common import percentile, populate, temporary_database
+from benchmarks.http_client import HttpClient
+from benchmarks.server import running_server
+
+
+def lookups(path, account_ids, count, hot):
+    # Пул процесса открывается на временной базе
+    database.DATABASE_URL = path
+    rnd = random.Random(0)
+    keys = [rnd.choice(account_ids[:hot]) for _ in range(count)]
+    months = ["2024-01", "2024-02", "2024-03"]
+    with database.get_db() as conn:
+        for label, get_account, get_rates in (
+            ("repository", repository.get_account, repository.get_interest_rates),
+            ("cache", cache.get_account, cache.get_interest_rates),
+        ):
+            started = time.perf_counter()
+            for account_id in keys:
+                get_account(conn, account_id)
+            account_us = (time.perf_counter() - started) / count * 1e6
+            started = time.perf_counter()
+            for _ in range(count):
+                get_rates(conn, months)
+            rate_us = (time.perf_counter() - started) / count * 1e6
+            print(f"{label:>10}  account {account_us:7.2f} us/lookup  rates {rate_us:7.2f} us/lookup")
+    print(f"cache stats: {json.dumps(cache.stats()['accounts'])}")
+    database.close_pool()
+
+
+async def dashboard(port, requests):
+    http = HttpClient(port=port)
+    try:
+        status, headers, body = await http.request("GET", "/api/accounts")
+        etag = headers["etag"]
+        print(f"dashboard body {len(body) / 1024:.0f} KiB, ETag {etag}")
+        for label, extra in (("full", {}), ("If-None-Match", {"If-None-Match": etag})):
+            latencies = []
+            for _ in range(requests):
+                started = time.perf_counter()
+                status, _, _ = await http.request("GET", "/api/accounts", headers=extra)
+                latencies.append((time.perf_counter() - started) * 1000)
+            print(f"{label:>14}  status {status}  p50 {percentile(latencies, 0.5):8.2f} ms  "
+                  f"p99 {percentile(latencies, 0.99):8.2f} ms")
+    finally:
+        await http.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=10000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--hot", type=int, default=1000, help="distinct accounts looked up")
+    parser.add_argument("--requests", type=int, default=50, help="dashboard requests per mode")
+    args = parser.parse_args()
+
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        account_ids = populate(conn, args.accounts, 5)
+        conn.close()
+        lookups(path, account_ids, args.lookups, args.hot)
+        with running_server(path) as port:
+            asyncio.run(dashboard(port, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Interest capitalization: per-account loop vs set-based chunks.
+
+    python -m benchmarks.bench_capitalization --accounts 1000000
+
+The per-account loop (one UPDATE and one INSERT per row) is only run up to
+``--legacy-max`` accounts and extrapolated beyond that.
+"""
+import argparse
+import asyncio
+import sqlite3
+import time
+import uuid
+from datetime import datetime
+
+import capitalization
+from db_pool import ConnectionPool
+from benchmarks.common import populate, temporary_database
+
+MONTH = "2024-01"
+
+
+def legacy_capitalize(conn, rate):
+    """The previous endpoint body (with the missing ``type`` column dropped), in kopecks"""
+    for account in conn.execute("SELECT id, balance FROM accounts").fetchall():
+        interest = round(account[1] * rate)
+        conn.execute("UPDATE accounts SET balance = ? WHERE id = ?", (account[1] + interest, account[0]))
+        conn.execute(
+            "INSERT INTO transactions (id, account_id, amount, date) VALUES (?, ?, ?, ?)",
+            (str(uuid.uuid4()), account[0], interest, datetime.now().strftime("%Y-%m-%d"))
+        )
+    conn.commit()
+
+
+def prepare(path, accounts):
+    conn = sqlite3.connect(path)
+    populate(conn, accounts, 0)
+    conn.execute("INSERT OR REPLACE INTO interest_rates (rate, month) VALUES (12.0, ?)", (MONTH,))
+    conn.commit()
+    conn.close()
+
+
+def bench_set_based(path, chunk_size):
+    pool = ConnectionPool(path, readers=1)
+
+    async def write(fn, *args):
+        with pool.writer() as conn:
+            return fn(conn, *args)
+
+    def progress(state):
+        print(f"    {state['processed']:>9}/{state['total_accounts']} accounts", end="\r")
+
+    started = time.perf_counter()
+    result = asyncio.run(capitalization.capitalize(MONTH, write=write, chunk_size=chunk_size, progress=progress))
+    elapsed = time.perf_counter() - started
+    print(" " * 40, end="\r")
+
+    # Повторный запуск ничего не начисляет
+    rerun = asyncio.run(capitalization.capitalize(MONTH, write=write, chunk_size=chunk_size))
+    pool.close()
+    assert rerun["capitalized"] == 0, rerun
+    return elapsed, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=1_000_000)
+    parser.add_argument("--legacy-max", type=int, default=100_000)
+    parser.add_argument("--chunk-size", type=int, default=capitalization.CHUNK_SIZE)
+    args = parser.parse_args()
+
+    with temporary_database() as path:
+        prepare(path, args.accounts)
+        elapsed, result = bench_set_based(path, args.chunk_size)
+        print(f"set-based: {result['capitalized']} accounts in {elapsed:.2f} s "
+              f"({result['capitalized'] / elapsed:.0f} accounts/s)")
+
+    legacy_accounts = min(args.accounts, args.legacy_max)
+    with temporary_database() as path:
+        prepare(path, legacy_accounts)
+        conn = sqlite3.connect(path)
+        started = time.perf_counter()
+        legacy_capitalize(conn, 0.01)
+        elapsed = time.perf_counter() - started
+        conn.close()
+        estimate = elapsed * args.accounts / legacy_accounts
+        print(f"per-account loop: {legacy_accounts} accounts in {elapsed:.2f} s "
+              f"(~{estimate:.0f} s for {args.accounts})")
+
+
+if __name__ == "__main__":
+    main()
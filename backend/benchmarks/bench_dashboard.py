@@ -0,0 +1,71 @@
+"""Query count and latency of GET /api/accounts: N+1 loop vs set-based dashboard.
+
+    python -m benchmarks.bench_dashboard --sizes 100 10000 100000
+"""
+import argparse
+import sqlite3
+from datetime import datetime, timedelta
+
+from dashboard import build_accounts_dashboard
+from benchmarks.common import count_queries, populate, temporary_database, timed
+
+
+def legacy_dashboard(conn):
+    """The per-account implementation the dashboard engine replaced"""
+    accounts = [dict(row) for row in conn.execute("SELECT * FROM accounts").fetchall()]
+    three_months_ago = (datetime.now() - timedelta(days=90)).strftime("%Y-%m-%d")
+    for account in accounts:
+        cursor = conn.execute(
+            "SELECT * FROM transactions WHERE account_id = ? AND date >= ? ORDER BY date DESC",
+            (account["id"], three_months_ago)
+        )
+        account["transactions"] = [dict(row) for row in cursor.fetchall()]
+        monthly_balances = {}
+        for i in range(3):
+            month_key = (datetime.now() - timedelta(days=30 * i)).strftime("%Y-%m")
+            rate = conn.execute("SELECT rate FROM interest_rates WHERE month = ?", (month_key,)).fetchone()
+            total = conn.execute(
+                "SELECT SUM(amount) as total FROM transactions "
+                "WHERE account_id = ? AND strftime('%Y-%m', date) = ?",
+                (account["id"], month_key)
+            ).fetchone()
+            monthly_balances[month_key] = {
+                "balance": float(total["total"] or 0),
+                "interest_rate": rate["rate"] if rate else 0.0,
+            }
+        account["monthly_balances"] = monthly_balances
+    return accounts
+
+
+def run(size: int, transactions_per_account: int, legacy_max: int):
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        populate(conn, size, transactions_per_account)
+
+        with count_queries(conn) as counter:
+            elapsed, _ = timed(build_accounts_dashboard, conn)
+        print(f"{size:>8} accounts  set-based  {counter['queries']:>8} queries  {elapsed * 1000:>10.1f} ms")
+
+        if size <= legacy_max:
+            with count_queries(conn) as counter:
+                elapsed, _ = timed(legacy_dashboard, conn)
+            print(f"{size:>8} accounts  N+1        {counter['queries']:>8} queries  {elapsed * 1000:>10.1f} ms")
+        else:
+            print(f"{size:>8} accounts  N+1        skipped (--legacy-max {legacy_max})")
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000])
+    parser.add_argument("--transactions-per-account", type=int, default=3)
+    parser.add_argument("--legacy-max", type=int, default=10_000,
+                        help="largest book the N+1 implementation is run against")
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.transactions_per_account, args.legacy_max)
+
+
+if __name__ == "__main__":
+    main()
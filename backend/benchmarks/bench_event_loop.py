@@ -0,0 +1,92 @@
+"""Latency of GET /api/accounts/{id} while heavy GET /api/accounts requests run.
+
+Starts uvicorn against a synthetic book and measures the light endpoint alone
+and then alongside a stream of dashboard requests:
+
+    python -m benchmarks.bench_event_loop --accounts 20000 --seconds 10
+
+``--backend-dir`` points the benchmark at another checkout (e.g. the revision
+before the async data-access layer) for comparison.
+"""
+import argparse
+import asyncio
+import sqlite3
+import time
+
+from benchmarks.common import percentile, populate, temporary_database
+from benchmarks.http_client import HttpClient
+from benchmarks.server import BACKEND_DIR, running_server
+
+
+async def light_load(port, account_ids, seconds, clients):
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def worker(offset):
+        client = HttpClient(port=port)
+        i = offset
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            status, _, _ = await client.request("GET", f"/api/accounts/{account_ids[i % len(account_ids)]}")
+            latencies.append(time.perf_counter() - started)
+            assert status == 200, status
+            i += clients
+            await asyncio.sleep(0.005)
+        await client.close()
+
+    await asyncio.gather(*(worker(n) for n in range(clients)))
+    return latencies
+
+
+async def heavy_load(port, stop: asyncio.Event, counter):
+    client = HttpClient(port=port)
+    while not stop.is_set():
+        await client.request("GET", "/api/accounts")
+        counter["heavy"] += 1
+    await client.close()
+
+
+async def scenario(port, account_ids, seconds, clients, heavy_clients):
+    stop = asyncio.Event()
+    counter = {"heavy": 0}
+    heavy = [asyncio.create_task(heavy_load(port, stop, counter)) for _ in range(heavy_clients)]
+    latencies = await light_load(port, account_ids, seconds, clients)
+    stop.set()
+    await asyncio.gather(*heavy)
+    return latencies, counter["heavy"]
+
+
+def report(label, latencies, heavy):
+    print(
+        f"{label:>22}: {len(latencies):>6} requests  "
+        f"p50 {percentile(latencies, 0.5) * 1000:8.2f} ms  "
+        f"p99 {percentile(latencies, 0.99) * 1000:8.2f} ms  "
+        f"max {max(latencies) * 1000:8.2f} ms  (dashboards served: {heavy})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=20_000)
+    parser.add_argument("--transactions-per-account", type=int, default=5)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--heavy-clients", type=int, default=1)
+    parser.add_argument("--backend-dir", default=BACKEND_DIR)
+    args = parser.parse_args()
+
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        account_ids = populate(conn, args.accounts, args.transactions_per_account)
+        conn.close()
+        with running_server(path, backend_dir=args.backend_dir) as port:
+            latencies, heavy = asyncio.run(scenario(port, account_ids, args.seconds, args.clients, 0))
+            report("idle", latencies, heavy)
+            latencies, heavy = asyncio.run(
+                scenario(port, account_ids, args.seconds, args.clients, args.heavy_clients)
+            )
+            report("with heavy dashboard", latencies, heavy)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Throughput and server peak RSS of GET /api/transactions/export.
+
+    python -m benchmarks.bench_export --accounts 1000 --transactions-per-account 1000
+
+Peak RSS is the server's VmHWM from /proc (Linux), read after startup and
+after every export; a streaming export should leave it flat as rows grow.
+"""
+import argparse
+import http.client
+import os
+import sqlite3
+import time
+import zlib
+
+from benchmarks.common import populate, temporary_database
+from benchmarks.server import running_server
+
+
+def server_pid() -> int:
+    """Pid of the uvicorn child process of this benchmark"""
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                command = f.read()
+        except (OSError, IndexError, ValueError):
+            continue
+        if parent == os.getpid() and b"uvicorn" in command:
+            return int(entry)
+    raise RuntimeError("uvicorn process not found")
+
+
+def peak_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def export(port: int, fmt: str, gzip: bool):
+    """Stream the export, returning (rows, bytes on the wire, seconds)"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+    headers = {"Accept-Encoding": "gzip"} if gzip else {"Accept-Encoding": "identity"}
+    started = time.perf_counter()
+    connection.request("GET", f"/api/transactions/export?format={fmt}", headers=headers)
+    response = connection.getresponse()
+    decompressor = zlib.decompressobj(31) if gzip else None
+    lines = 0
+    wire_bytes = 0
+    while True:
+        chunk = response.read(1 << 16)
+        if not chunk:
+            break
+        wire_bytes += len(chunk)
+        lines += (decompressor.decompress(chunk) if decompressor else chunk).count(b"\n")
+    elapsed = time.perf_counter() - started
+    connection.close()
+    rows = lines - 1 if fmt == "csv" else lines
+    return rows, wire_bytes, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--transactions-per-account", type=int, default=1000)
+    args = parser.parse_args()
+
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        total = args.accounts * args.transactions_per_account
+        print(f"populating {total} transactions ...")
+        populate(conn, args.accounts, args.transactions_per_account, days=365)
+        conn.close()
+
+        with running_server(path) as port:
+            pid = server_pid()
+            print(f"server peak RSS after startup: {peak_rss_mb(pid):8.1f} MB")
+            for fmt in ("ndjson", "csv"):
+                for gzip in (False, True):
+                    rows, wire_bytes, elapsed = export(port, fmt, gzip)
+                    label = f"{fmt}{'+gzip' if gzip else ''}"
+                    print(f"{label:>12}  {rows:>10} rows  {wire_bytes / 1e6:8.1f} MB  "
+                          f"{rows / elapsed:>10.0f} rows/s  peak RSS {peak_rss_mb(pid):8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""POST /api/transactions throughput: per-request commit vs group commit.
+
+    python -m benchmarks.bench_group_commit --postings 5000 --concurrency 64
+
+Runs each mode against a fresh database with synchronous=NORMAL and FULL
+(fsync on every commit) and prints postings per second, latency percentiles
+and, for group commit, the writer's batch metrics. The ``in-process`` rows
+drive the same code paths without HTTP, which shows the database-side gain
+once request handling is not the bottleneck.
+
+With ``--poison-every N`` every N-th in-process posting carries an amount
+too large for SQLite INTEGER, which fails with OverflowError rather than a
+sqlite3 error; exactly those postings must fail, and their batch neighbours
+must still be committed.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import group_commit
+import reconcile
+import repository
+from db_pool import ConnectionPool
+from benchmarks.common import percentile, populate, temporary_database
+from benchmarks.http_client import HttpClient
+from benchmarks.server import running_server
+
+# Больше INTEGER SQLite: запись падает с OverflowError, а не sqlite3.Error
+POISON_AMOUNT = 2 ** 63
+
+
+async def post_all(port, account_ids, postings, concurrency):
+    rnd = random.Random(0)
+    today = datetime.now().strftime("%Y-%m-%d")
+    queue = asyncio.Queue()
+    for _ in range(postings):
+        queue.put_nowait({"account_id": rnd.choice(account_ids), "amount": rnd.randint(-10000, 10000) / 100,
+                          "date": today})
+    latencies = []
+    failures = 0
+
+    async def client():
+        nonlocal failures
+        http = HttpClient(port=port)
+        try:
+            while not queue.empty():
+                body = queue.get_nowait()
+                started = time.perf_counter()
+                status, _, _ = await http.request("POST", "/api/transactions", body)
+                latencies.append((time.perf_counter() - started) * 1000)
+                failures += status != 200
+        finally:
+            await http.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    http = HttpClient(port=port)
+    _, _, body = await http.request("GET", "/api/db/group-commit-stats")
+    await http.close()
+    return elapsed, latencies, failures, json.loads(body)
+
+
+def run(mode, synchronous, args):
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        account_ids = populate(conn, args.accounts, 0)
+        conn.close()
+        env = {
+            "GROUP_COMMIT": "1" if mode == "group" else "0",
+            "GROUP_COMMIT_MAX_BATCH": str(args.max_batch),
+            "GROUP_COMMIT_MAX_DELAY_MS": str(args.max_delay_ms),
+            "DB_SYNCHRONOUS": synchronous,
+        }
+        with running_server(path, env=env) as port:
+            result = asyncio.run(post_all(port, account_ids, args.postings, args.concurrency))
+        report(f"{mode} http", synchronous, args, path, *result)
+
+
+async def post_in_process(path, account_ids, mode, synchronous, args):
+    pool = ConnectionPool(path, readers=1, synchronous=synchronous)
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    async def write(fn, *fn_args):
+        return await asyncio.get_running_loop().run_in_executor(executor, pool.run_write, fn, *fn_args)
+
+    writer = group_commit.GroupCommitWriter(args.max_batch, args.max_delay_ms, write=write)
+    await writer.start()
+    rnd = random.Random(0)
+    today = datetime.now().strftime("%Y-%m-%d")
+    postings = [(rnd.choice(account_ids), rnd.randint(-10000, 10000), today, None) for _ in range(args.postings)]
+    if args.poison_every:
+        for i in range(0, len(postings), args.poison_every):
+            postings[i] = (postings[i][0], POISON_AMOUNT, today, None)
+    latencies = []
+    failures = 0
+
+    async def client(chunk):
+        nonlocal failures
+        for posting in chunk:
+            started = time.perf_counter()
+            try:
+                if mode == "group":
+                    await writer.submit(*posting)
+                else:
+                    await write(repository.post_transaction, *posting)
+            except OverflowError:
+                failures += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(postings[i::args.concurrency]) for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    await writer.stop()
+    stats = dict(writer.stats(), enabled=mode == "group")
+    executor.shutdown()
+    pool.close()
+    return elapsed, latencies, failures, stats
+
+
+def run_in_process(mode, synchronous, args):
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        account_ids = populate(conn, args.accounts, 0)
+        conn.close()
+        result = asyncio.run(post_in_process(path, account_ids, mode, synchronous, args))
+        report(f"{mode} in-process", synchronous, args, path, *result)
+        poisoned = len(range(0, args.postings, args.poison_every)) if args.poison_every else 0
+        if result[2] != poisoned:
+            print(f"  FAIL: {result[2]} postings failed, expected the {poisoned} poisoned ones")
+
+
+def report(label, synchronous, args, path, elapsed, latencies, failures, stats):
+    conn = sqlite3.connect(path)
+    discrepancies = len(reconcile.find_discrepancies(conn))
+    conn.close()
+    line = (f"{label:>22}  {synchronous:>6}  {args.postings / elapsed:>8.0f} postings/s  "
+            f"p50 {percentile(latencies, 0.5):6.1f} ms  p99 {percentile(latencies, 0.99):6.1f} ms  "
+            f"failures {failures}  discrepancies {discrepancies}")
+    if stats.get("enabled"):
+        line += (f"  batch avg {stats['batch_size_avg']} max {stats['batch_size_max']}  "
+                 f"queue wait p99 {stats['queue_wait_p99_ms']} ms")
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--postings", type=int, default=5000)
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--max-delay-ms", type=float, default=2.0)
+    parser.add_argument("--poison-every", type=int, default=0, help="fail every N-th in-process posting")
+    args = parser.parse_args()
+
+    for synchronous in ("NORMAL", "FULL"):
+        for mode in ("per-request", "group"):
+            run(mode, synchronous, args)
+        for mode in ("per-request", "group"):
+            run_in_process(mode, synchronous, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""GET /api/accounts/history page latency at 100k accounts.
+
+    python -m benchmarks.bench_history --accounts 100000
+
+Measures ``history.accounts_history`` on pages at random cursors for several
+page sizes and month counts, then walks the whole book page by page. Exits
+non-zero when the p99 of a default page (100 accounts, 12 months) misses
+TARGET_P99_MS.
+"""
+import argparse
+import random
+import sqlite3
+import sys
+import time
+
+import history
+from benchmarks.common import percentile, populate, temporary_database
+
+# Цель: p99 страницы из 100 счетов за 12 месяцев при 100k счетов
+TARGET_P99_MS = 25.0
+
+
+def page_latencies(conn, ids, limit, months, pages):
+    rnd = random.Random(0)
+    latencies = []
+    for _ in range(pages):
+        cursor = rnd.choice(ids)
+        started = time.perf_counter()
+        history.accounts_history(conn, months, limit, cursor)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=100_000)
+    parser.add_argument("--tx-per-account", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=200, help="measured pages per configuration")
+    args = parser.parse_args()
+
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        print(f"populating {args.accounts} accounts x {args.tx_per_account} transactions over a year ...")
+        populate(conn, args.accounts, args.tx_per_account, days=365)
+        conn.execute("ANALYZE")
+        ids = [row[0] for row in conn.execute("SELECT id FROM accounts")]
+
+        target_p99 = None
+        for limit, months in ((100, 3), (100, 12), (100, 60), (1000, 12)):
+            latencies = page_latencies(conn, ids, limit, months, args.pages)
+            p99 = percentile(latencies, 0.99)
+            if (limit, months) == (100, 12):
+                target_p99 = p99
+            print(f"page {limit:>5} accounts  {months:>3} months  p50 {percentile(latencies, 0.5):7.2f} ms  "
+                  f"p99 {p99:7.2f} ms")
+
+        started = time.perf_counter()
+        cursor, pages = None, 0
+        while True:
+            _, cursor = history.accounts_history(conn, 12, history.MAX_PAGE_SIZE, cursor)
+            pages += 1
+            if cursor is None:
+                break
+        print(f"whole book, 12 months: {pages} pages in {time.perf_counter() - started:.2f} s")
+        conn.close()
+
+    ok = target_p99 <= TARGET_P99_MS
+    print(f"target p99 <= {TARGET_P99_MS} ms for 100 accounts x 12 months: {'PASS' if ok else 'FAIL'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Account import throughput with the old synchronous logging and with log_config.
+
+    python -m benchmarks.bench_logging --rows 200000
+
+Imports the same CSV (1% invalid rows) in process, with the per-row debug
+logs of ``account_import`` enabled, under:
+
+- sync DEBUG: the former ``logging.basicConfig(level=DEBUG)`` with a plain
+  FileHandler; every record is written by the thread that logs it
+- queue DEBUG, no limit: log_config with the rate limit off
+- queue DEBUG, limited: log_config with the default per-call-site limit
+- queue INFO: log_config at its default level (per-row logs disabled)
+
+Only files are written (no console) so the terminal does not skew the
+numbers. Reported: rows per second, records in the file, and how long the
+writer thread needed to drain the queue after the import.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from starlette.datastructures import UploadFile
+
+import account_import
+import log_config
+from benchmarks.common import temporary_database
+
+
+def write_csv(path, rows):
+    rnd = random.Random(0)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("name,balance\n")
+        for i in range(rows):
+            balance = "oops" if rnd.random() < 0.01 else f"{rnd.randint(0, 10_000_000) / 100:.2f}"
+            f.write(f"Customer {i},{balance}\n")
+
+
+async def import_file(conn, path):
+    async def write(fn, *args):
+        return fn(conn, *args)
+
+    with open(path, "rb") as f:
+        upload = UploadFile("accounts.csv", file=f, content_type="text/csv")
+        return await account_import.import_accounts(upload, write=write)
+
+
+def setup_sync(log_path):
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[logging.FileHandler(log_path, encoding="utf-8")],
+        force=True,
+    )
+
+
+def teardown_sync():
+    for handler in logging.getLogger().handlers[:]:
+        handler.close()
+        logging.getLogger().removeHandler(handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="banking-log-bench-")
+    csv_path = os.path.join(workdir, "accounts.csv")
+    write_csv(csv_path, args.rows)
+
+    scenarios = [
+        ("sync DEBUG", lambda path: setup_sync(path), teardown_sync),
+        ("queue DEBUG, no limit", lambda path: log_config.configure("DEBUG", filename=path, console=False,
+                                                                   rate_limit=0), log_config.shutdown),
+        ("queue DEBUG, limited", lambda path: log_config.configure("DEBUG", filename=path, console=False),
+         log_config.shutdown),
+        ("queue INFO", lambda path: log_config.configure("INFO", filename=path, console=False),
+         log_config.shutdown),
+    ]
+    print(f"{args.rows} rows")
+    with temporary_database() as db_path:
+        conn = sqlite3.connect(db_path)
+        for name, setup, teardown in scenarios:
+            conn.execute("DELETE FROM accounts")
+            conn.commit()
+            log_path = os.path.join(workdir, name.replace(" ", "_").replace(",", "") + ".log")
+            setup(log_path)
+            started = time.perf_counter()
+            result = asyncio.run(import_file(conn, csv_path))
+            elapsed = time.perf_counter() - started
+            teardown()
+            drained = time.perf_counter() - started - elapsed
+            with open(log_path, encoding="utf-8") as f:
+                records = sum(1 for _ in f)
+            print(f"{name:>24}  {result.inserted / elapsed:10.0f} rows/s  {records:>8} records  "
+                  f"{os.path.getsize(log_path) / 1e6:7.1f} MB  drain {drained * 1000:6.1f} ms")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
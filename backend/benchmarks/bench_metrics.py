@@ -0,0 +1,81 @@
+"""Overhead of request and SQL metrics.
+
+    python -m benchmarks.bench_metrics --accounts 20000 --seconds 5
+
+In process, times point lookups and a full scan of the accounts table on a
+plain sqlite3 connection and on ``metrics.TracedConnection``. Over HTTP,
+measures GET /api/accounts/{id} and GET /api/accounts latency with SQL
+metrics off and on (the request middleware runs in both).
+"""
+import argparse
+import asyncio
+import random
+import sqlite3
+import time
+
+import metrics
+from benchmarks.common import percentile, populate, temporary_database, timed
+from benchmarks.http_client import HttpClient
+from benchmarks.server import running_server
+
+
+def point_lookups(conn, ids):
+    for account_id in ids:
+        conn.execute("SELECT * FROM accounts WHERE id = ?", (account_id,)).fetchone()
+
+
+def full_scan(conn):
+    return sum(1 for _ in conn.execute("SELECT * FROM accounts"))
+
+
+async def http_latency(port, ids, seconds, path_of):
+    client = HttpClient(port=port)
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    i = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        status, _, _ = await client.request("GET", path_of(ids[i % len(ids)]))
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert status == 200, status
+        i += 1
+    await client.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=20_000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        populate(conn, args.accounts, 5)
+        ids = [row[0] for row in conn.execute("SELECT id FROM accounts")]
+        conn.close()
+        random.Random(0).shuffle(ids)
+        sample = ids[:args.lookups]
+
+        print(f"{'connection':>12}  {'point lookups':>16}  {'full scan':>10}")
+        for name, factory in (("plain", sqlite3.Connection), ("traced", metrics.TracedConnection)):
+            conn = sqlite3.connect(path, factory=factory)
+            conn.row_factory = sqlite3.Row
+            lookups, _ = timed(point_lookups, conn, sample, repeat=3)
+            scan, _ = timed(full_scan, conn, repeat=3)
+            print(f"{name:>12}  {lookups / len(sample) * 1e6:13.2f} us  {scan * 1000:7.1f} ms")
+            conn.close()
+
+        for enabled in ("0", "1"):
+            with running_server(path, env={"SQL_METRICS": enabled}) as port:
+                point = asyncio.run(http_latency(port, ids, args.seconds, lambda i: f"/api/accounts/{i}"))
+                # If-None-Match не отправляется: каждый ответ дашборда собирается заново
+                dashboard = asyncio.run(http_latency(port, ids, args.seconds, lambda i: "/api/accounts"))
+            print(f"SQL_METRICS={enabled}  GET /api/accounts/{{id}} p50 {percentile(point, 0.5):6.2f} ms  "
+                  f"p99 {percentile(point, 0.99):6.2f} ms  ({len(point)} requests)  "
+                  f"GET /api/accounts p50 {percentile(dashboard, 0.5):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
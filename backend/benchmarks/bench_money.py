@@ -0,0 +1,80 @@
+"""Integer-kopeck aggregates vs the previous REAL ruble sums on a large table.
+
+    python -m benchmarks.bench_money --rows 5000000 --accounts 10000
+
+Builds the same postings twice, as REAL rubles and as INTEGER kopecks, then
+times SUM / GROUP BY over both and reports how far the REAL results drift
+from the exact integer ones. Also replays running balances the way the old
+``float(balance) + amount`` code did.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+
+from benchmarks.common import timed
+
+
+def build(conn, rows, accounts, seed=0):
+    rnd = random.Random(seed)
+    conn.execute("CREATE TABLE real_postings (account_id INTEGER NOT NULL, amount REAL NOT NULL)")
+    conn.execute("CREATE TABLE minor_postings (account_id INTEGER NOT NULL, amount INTEGER NOT NULL)")
+    batch = []
+    for _ in range(rows):
+        batch.append((rnd.randrange(accounts), rnd.randint(-5_000_000, 5_000_000)))
+        if len(batch) == 100_000:
+            conn.executemany("INSERT INTO minor_postings VALUES (?, ?)", batch)
+            conn.executemany("INSERT INTO real_postings VALUES (?, ?)", ((a, k / 100) for a, k in batch))
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO minor_postings VALUES (?, ?)", batch)
+        conn.executemany("INSERT INTO real_postings VALUES (?, ?)", ((a, k / 100) for a, k in batch))
+    conn.commit()
+
+
+def group_sums(conn, table):
+    return dict(conn.execute(f"SELECT account_id, SUM(amount) FROM {table} GROUP BY account_id"))
+
+
+def running_balances(conn, table):
+    """Balances accumulated posting by posting in Python, like the old endpoint"""
+    balances = {}
+    for account_id, amount in conn.execute(f"SELECT account_id, amount FROM {table} ORDER BY rowid"):
+        balances[account_id] = balances.get(account_id, 0) + amount
+    return balances
+
+
+def drift(real, minor):
+    """(accounts not equal to the exact value, accounts off by at least half a kopeck, max error in kopecks)"""
+    inexact = sum(real[key] != minor[key] / 100 for key in minor)
+    errors = [abs(real[key] * 100 - minor[key]) for key in minor]
+    return inexact, sum(error >= 0.5 for error in errors), max(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--accounts", type=int, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="banking-bench-") as directory:
+        conn = sqlite3.connect(os.path.join(directory, "money.db"))
+        print(f"building {args.rows} postings ...")
+        build(conn, args.rows, args.accounts)
+
+        for table in ("real_postings", "minor_postings"):
+            elapsed, total = timed(lambda: conn.execute(f"SELECT SUM(amount) FROM {table}").fetchone()[0], repeat=3)
+            print(f"{table:>15}  SUM       {elapsed * 1000:>9.1f} ms  total {total}")
+            elapsed, _ = timed(group_sums, conn, table, repeat=3)
+            print(f"{table:>15}  GROUP BY  {elapsed * 1000:>9.1f} ms")
+
+        for label, collect in (("per-account sums", group_sums), ("running balances", running_balances)):
+            inexact, off, worst = drift(collect(conn, "real_postings"), collect(conn, "minor_postings"))
+            print(f"REAL {label}: {inexact}/{args.accounts} accounts not exact, "
+                  f"{off} off by >= 0.5 kopeck, max error {worst:.6f} kopeck")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
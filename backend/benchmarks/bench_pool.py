@@ -0,0 +1,117 @@
+"""Concurrent reads while transactions are being written.
+
+Compares connect-per-request with the default rollback journal against the
+pooled WAL connections:
+
+    python -m benchmarks.bench_pool --readers 8 --seconds 5
+"""
+import argparse
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from database import ACCOUNT_TRANSACTIONS_SQL
+from db_pool import ConnectionPool
+from benchmarks.common import percentile, populate, temporary_database
+
+
+class ConnectPerRequest:
+    """The previous get_db(): a fresh connection for every request"""
+
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    reader = writer = _connect
+
+    def stats(self):
+        return {}
+
+
+def run(mode: str, readers: int, seconds: float, accounts: int):
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        account_ids = populate(conn, accounts, 50)
+        conn.close()
+
+        pool = ConnectionPool(path, readers=readers) if mode == "pool" else ConnectPerRequest(path)
+        stop = threading.Event()
+        read_latencies, write_latencies, errors = [], [], []
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        def write_loop():
+            i = 0
+            while not stop.is_set():
+                account_id = account_ids[i % len(account_ids)]
+                started = time.perf_counter()
+                try:
+                    with pool.writer() as db:
+                        db.execute(
+                            "INSERT INTO transactions (id, account_id, amount, date, comment) VALUES (?, ?, ?, ?, ?)",
+                            (str(uuid.uuid4()), account_id, 1.0, today, "bench")
+                        )
+                        db.execute("UPDATE accounts SET balance = balance + 1 WHERE id = ?", (account_id,))
+                        db.commit()
+                except sqlite3.Error as e:
+                    errors.append(str(e))
+                write_latencies.append(time.perf_counter() - started)
+                i += 1
+
+        def read_loop(offset):
+            i = offset
+            while not stop.is_set():
+                account_id = account_ids[i % len(account_ids)]
+                started = time.perf_counter()
+                try:
+                    with pool.reader() as db:
+                        db.execute("SELECT * FROM accounts WHERE id = ?", (account_id,)).fetchone()
+                        db.execute(ACCOUNT_TRANSACTIONS_SQL, (account_id,)).fetchall()
+                except sqlite3.Error as e:
+                    errors.append(str(e))
+                read_latencies.append(time.perf_counter() - started)
+                i += 7
+
+        threads = [threading.Thread(target=write_loop)]
+        threads += [threading.Thread(target=read_loop, args=(n,)) for n in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        print(
+            f"{mode:>8}: reads {len(read_latencies) / seconds:>9.0f}/s "
+            f"p50 {percentile(read_latencies, 0.5) * 1000:7.2f} ms "
+            f"p99 {percentile(read_latencies, 0.99) * 1000:7.2f} ms | "
+            f"writes {len(write_latencies) / seconds:>7.0f}/s "
+            f"p99 {percentile(write_latencies, 0.99) * 1000:7.2f} ms | errors {len(errors)}"
+        )
+        if mode == "pool":
+            print(f"          pool stats: {pool.stats()}")
+            pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--accounts", type=int, default=1000)
+    args = parser.parse_args()
+    for mode in ("connect", "pool"):
+        run(mode, args.readers, args.seconds, args.accounts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Month-end / year-end projections of the whole book: per-account loop vs NumPy.
+
+    python -m benchmarks.bench_projections --accounts 1000000
+
+Times the legacy ``calculate_future_balance`` loop (one Pydantic ``Account``
+at a time, daily compounding of a fraction rate), the projection model
+applied account by account in Python and the vectorized NumPy pass, plus
+loading the book and the complete ``projections.compute``. The Python and
+NumPy projections must agree to the kopeck.
+"""
+import argparse
+import calendar
+import sqlite3
+from datetime import datetime
+
+from pydantic import BaseModel
+
+import database
+import projections
+import repository
+from benchmarks.common import populate, temporary_database, timed
+
+
+class Account(BaseModel):
+    """The fields of the legacy main.Account the loop touched"""
+    id: str
+    name: str
+    balance: float
+    initial_balance: float
+    interest_rate: float = 0.0
+
+
+def legacy_projection(rows, interest_rate):
+    """The removed per-account calculate_future_balance"""
+    current_date = datetime.now()
+    days_in_month = calendar.monthrange(current_date.year, current_date.month)[1]
+    days_remaining = days_in_month - current_date.day
+    result = []
+    for account_id, balance in rows:
+        account = Account(id=account_id, name="", balance=balance / 100, initial_balance=balance / 100,
+                          interest_rate=interest_rate)
+        daily_interest = account.interest_rate / 365
+        result.append(round(account.balance * (1 + daily_interest) ** days_remaining, 2))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=1_000_000)
+    parser.add_argument("--legacy-max", type=int, default=200_000,
+                        help="accounts for the legacy loop; its time is scaled up to --accounts")
+    args = parser.parse_args()
+
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        print(f"populating {args.accounts} accounts ...")
+        populate(conn, args.accounts, 0)
+        today = datetime.now()
+        months = projections.remaining_months(today)
+        for month, rate in zip(months, (7.5, 7.0, 6.5, 8.0, 8.5, 9.0, 9.5, 10.0, 10.5, 11.0, 11.5, 12.0)):
+            repository.set_interest_rate(conn, month, rate)
+        conn.close()
+
+        database.DATABASE_URL = path
+        with database.get_db() as conn:
+            elapsed, (ids, balances, _) = timed(projections.load_book, conn, [])
+            print(f"load book            {elapsed * 1000:10.1f} ms  ({len(ids)} accounts)")
+            rates = list(repository.get_interest_rates(conn, months).values())
+            done = [None] * len(rates)
+
+            sample = min(args.legacy_max, len(ids))
+            elapsed, _ = timed(legacy_projection, list(zip(ids[:sample], balances[:sample])), rates[0])
+            print(f"legacy loop          {elapsed * len(ids) / sample * 1000:10.1f} ms  "
+                  f"(month end only, measured on {sample} accounts)")
+
+            elapsed, expected = timed(projections.project_python, balances, rates, done)
+            print(f"python loop          {elapsed * 1000:10.1f} ms  ({len(rates)} months)")
+            if projections.load_numpy() is None:
+                print("numpy is not installed")
+            else:
+                elapsed, result = timed(projections.project_numpy, balances, rates, done, repeat=3)
+                status = "ok" if result == expected else "MISMATCH"
+                print(f"numpy                {elapsed * 1000:10.1f} ms  ({len(rates)} months)  {status}")
+
+            elapsed, _ = timed(projections.compute, conn, today)
+            print(f"compute end to end   {elapsed * 1000:10.1f} ms")
+        database.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Encode time and size of 100k transactions: dict-per-row JSONResponse vs serialization.
+
+    python -m benchmarks.bench_serialization --transactions 100000
+
+Rows are read once as sqlite3.Row objects, as the handlers get them. The
+baselines are what the endpoints did before: ``transaction_to_api`` per row
+with starlette's JSONResponse, and per-row ``json.dumps`` for NDJSON exports.
+Every available encoder is then timed in every table format of
+``serialization.encode_rows``.
+"""
+import argparse
+import json
+import sqlite3
+
+import serialization
+from database import TRANSACTION_COLUMNS, TRANSACTION_FIELDS
+from fastapi.responses import JSONResponse
+from money import to_major, transaction_to_api
+from benchmarks.common import populate, temporary_database, timed
+
+
+def baseline(rows) -> bytes:
+    return JSONResponse(content=[transaction_to_api(row) for row in rows]).body
+
+
+def baseline_ndjson(rows) -> bytes:
+    """The per-row json.dumps the export used before"""
+    return "".join(
+        json.dumps(transaction_to_api(zip(TRANSACTION_FIELDS, row)), ensure_ascii=False) + "\n" for row in rows
+    ).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transactions", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        populate(conn, 1000, args.transactions // 1000)
+        rows = conn.execute(f"SELECT {TRANSACTION_COLUMNS} FROM transactions").fetchall()
+        conn.close()
+
+    expected = json.loads(baseline(rows))
+    elapsed, body = timed(baseline, rows, repeat=args.repeat)
+    print(f"{len(rows)} transactions")
+    print(f"{'baseline':>8}  {'json':>8}  {elapsed * 1000:8.1f} ms  {len(body):>10} bytes")
+    elapsed, body = timed(baseline_ndjson, rows, repeat=args.repeat)
+    print(f"{'baseline':>8}  {'ndjson':>8}  {elapsed * 1000:8.1f} ms  {len(body):>10} bytes")
+
+    for name, dumps in serialization.DUMPS.items():
+        serialization.dumps = dumps
+        for fmt in serialization.MEDIA_TYPES:
+            elapsed, body = timed(
+                serialization.encode_rows, TRANSACTION_FIELDS, rows, fmt, {"amount": to_major}, repeat=args.repeat
+            )
+            # Все форматы должны описывать те же данные, что и базовый ответ
+            if fmt == "json":
+                decoded = json.loads(body)
+            elif fmt == "ndjson":
+                decoded = [json.loads(line) for line in body.splitlines()]
+            else:
+                columns = json.loads(body)
+                decoded = [dict(zip(columns, values)) for values in zip(*columns.values())]
+            status = "ok" if decoded == expected else "MISMATCH"
+            print(f"{name:>8}  {fmt:>8}  {elapsed * 1000:8.1f} ms  {len(body):>10} bytes  {status}")
+
+
+if __name__ == "__main__":
+    main()
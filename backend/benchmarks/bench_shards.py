@@ -0,0 +1,174 @@
+"""Posting throughput as the number of shards grows.
+
+    python -m benchmarks.bench_shards --shards 1 2 4 --processes 4 --seconds 5
+
+For every shard count a fresh database is created with that many shards
+(``database.init_shards``) and the same accounts, then several OS processes
+post random amounts to random accounts for a fixed time. Each process opens
+a connection pool per shard and runs ``repository.post_transaction`` on the
+account's shard, as POST /api/transactions does. Postings to different shards
+take different write locks, so they commit in parallel instead of queueing
+for the one lock of a single file.
+
+With ``--http`` the same is measured through a multi-worker uvicorn. Every
+shard must reconcile afterwards and hold exactly the accepted postings;
+exits non-zero otherwise.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import reconcile
+import repository
+from database import init_shards
+from db_pool import ConnectionPool
+from shards import ShardMap
+from benchmarks.common import percentile
+from benchmarks.http_client import HttpClient
+from benchmarks.server import running_server
+
+OPENING_BALANCE = 100000
+
+
+def create_database(directory, shards, accounts, seed=0):
+    """Database of ``shards`` shards with ``accounts`` accounts; returns (path, account ids)"""
+    path = os.path.join(directory, "banking.db")
+    shard_map = init_shards(path, shards)
+    rnd = random.Random(seed)
+    account_ids = [str(uuid.UUID(int=rnd.getrandbits(128))) for _ in range(accounts)]
+    for shard, shard_path in enumerate(shard_map.paths):
+        with sqlite3.connect(shard_path) as conn:
+            conn.executemany(
+                "INSERT INTO accounts (id, name, balance) VALUES (?, ?, ?)",
+                ((account_id, f"Счет {i}", OPENING_BALANCE) for i, account_id in enumerate(account_ids)
+                 if shard_map.shard_of(account_id) == shard)
+            )
+        conn.close()
+    return path, account_ids
+
+
+def post_for(args):
+    """Worker process: post for ``seconds``, return (accepted, busy retries)"""
+    path, account_ids, seconds, seed, synchronous = args
+    shard_map = ShardMap.load(path)
+    pools = [ConnectionPool(shard_path, readers=1, busy_retries=20, retry_backoff=0.001, synchronous=synchronous)
+             for shard_path in shard_map.paths]
+    rnd = random.Random(seed)
+    today = datetime.now().strftime("%Y-%m-%d")
+    accepted = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        account_id = rnd.choice(account_ids)
+        pool = pools[shard_map.shard_of(account_id)]
+        if pool.run_write(repository.post_transaction, account_id, rnd.randint(-10000, 10000), today, "bench"):
+            accepted += 1
+    retries = sum(pool.stats()["busy_retries"] for pool in pools)
+    for pool in pools:
+        pool.close()
+    return accepted, retries
+
+
+def run_processes(path, account_ids, processes, seconds, synchronous):
+    started = time.perf_counter()
+    with multiprocessing.Pool(processes) as workers:
+        results = workers.map(post_for, [(path, account_ids, seconds, seed, synchronous) for seed in range(processes)])
+    elapsed = time.perf_counter() - started
+    return sum(result[0] for result in results), sum(result[1] for result in results), elapsed
+
+
+async def run_http(port, account_ids, seconds, concurrency):
+    rnd = random.Random(1)
+    today = datetime.now().strftime("%Y-%m-%d")
+    latencies = []
+    accepted = 0
+    deadline = time.perf_counter() + seconds
+
+    async def client():
+        nonlocal accepted
+        http = HttpClient(port=port)
+        try:
+            while time.perf_counter() < deadline:
+                body = {"account_id": rnd.choice(account_ids), "amount": rnd.randint(-10000, 10000) / 100,
+                        "date": today, "comment": "bench"}
+                started = time.perf_counter()
+                status, _, _ = await http.request("POST", "/api/transactions", body)
+                latencies.append((time.perf_counter() - started) * 1000)
+                assert status == 200, status
+                accepted += 1
+        finally:
+            await http.close()
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return accepted, latencies
+
+
+def verify(path, expected_postings) -> bool:
+    ok = True
+    stored = 0
+    for shard_path in ShardMap.load(path).paths:
+        with sqlite3.connect(shard_path) as conn:
+            stored += conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+            discrepancies = reconcile.find_discrepancies(conn)
+        conn.close()
+        if discrepancies:
+            print(f"  {shard_path}: {len(discrepancies)} discrepancies, first: {discrepancies[0]}")
+            ok = False
+    if stored != expected_postings:
+        print(f"  stored {stored} postings, expected {expected_postings}")
+        ok = False
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--accounts", type=int, default=10_000)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--synchronous", default="NORMAL", help="PRAGMA synchronous of the posting processes")
+    parser.add_argument("--http", action="store_true", help="also post through a multi-worker uvicorn")
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn workers")
+    parser.add_argument("--concurrency", type=int, default=32, help="parallel HTTP clients")
+    args = parser.parse_args()
+
+    print(f"{args.processes} processes, {args.accounts} accounts, synchronous={args.synchronous}, "
+          f"{os.cpu_count()} CPUs")
+    ok = True
+    baseline = None
+    for shards in args.shards:
+        directory = tempfile.mkdtemp(prefix="banking-shards-bench-")
+        try:
+            path, account_ids = create_database(directory, shards, args.accounts)
+            accepted, retries, elapsed = run_processes(path, account_ids, args.processes, args.seconds,
+                                                       args.synchronous)
+            rate = accepted / elapsed
+            baseline = baseline or rate
+            line = (f"{shards:>2} shards  processes: {rate:8.0f} postings/s  x{rate / baseline:4.2f}  "
+                    f"{retries} busy retries")
+            if args.http:
+                with running_server(path, workers=args.workers,
+                                    env={"LOG_CONSOLE": "0", "DB_SYNCHRONOUS": args.synchronous}) as port:
+                    http_accepted, latencies = asyncio.run(run_http(port, account_ids, args.seconds,
+                                                                    args.concurrency))
+                accepted += http_accepted
+                line += (f"  http: {http_accepted / args.seconds:7.0f} postings/s  "
+                         f"p50 {percentile(latencies, 0.5):6.1f} ms  p99 {percentile(latencies, 0.99):6.1f} ms")
+            print(line)
+            ok &= verify(path, accepted)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    print("PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""Time from a cold process to the first request served.
+
+    python -m benchmarks.bench_startup --runs 5
+
+Each run is a new Python process that imports ``main``, starts the
+application (the lifespan hook: logging, schema, jobs) and serves
+GET /api/interest-rate by calling the ASGI app directly, reporting the time
+of each step. Three database states are measured:
+
+- current: the schema is up to date, so startup only reads ``schema_version``
+- legacy: ``schema_version`` is dropped before every run, so every migration
+  runs again, which is what each boot cost before versioning
+- new: an empty file, so the whole schema is created
+
+The same is then measured end to end through ``uvicorn main:create_app
+--factory``: from spawning the server to the first 200 response.
+
+Finally every migration is checked to survive a crash: a child process
+migrates a database in the pre-versioning format (REAL rubles) and is killed
+(``os._exit``) as it starts one of the ``CRASH_POINTS`` statements; the
+next ``init_db`` must bring it to the current version with the same money,
+no leftover tables and nothing for ``reconcile`` to report.
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+import urllib.request
+
+import migrations
+import reconcile
+from database import init_db
+from benchmarks.common import percentile, populate, temporary_database
+from benchmarks.server import BACKEND_DIR, free_port
+
+CHILD = r"""
+import asyncio, json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def request(app, path):
+    scope = {"type": "http", "http_version": "1.1", "method": "GET", "scheme": "http", "path": path,
+             "raw_path": path.encode(), "root_path": "", "query_string": b"", "headers": [],
+             "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 80)}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]["status"]
+
+async def run():
+    lifespan = main.app.router.lifespan_context(main.app)
+    await lifespan.__anext__()
+    ready = time.perf_counter()
+    status = await request(main.app, "/api/interest-rate")
+    served = time.perf_counter()
+    try:
+        await lifespan.__anext__()
+    except StopAsyncIteration:
+        pass
+    return ready, served, status
+
+ready, served, status = asyncio.run(run())
+print(json.dumps({"import": imported - started, "startup": ready - imported,
+                  "first_request": served - ready, "status": status}))
+"""
+
+# Схема до версионирования: деньги в REAL рублях
+LEGACY_SCHEMA = """
+    CREATE TABLE accounts (id TEXT PRIMARY KEY, name TEXT NOT NULL, balance REAL NOT NULL DEFAULT 0.0);
+    CREATE TABLE transactions (id TEXT PRIMARY KEY, account_id TEXT NOT NULL, amount REAL NOT NULL,
+                               date TEXT NOT NULL, comment TEXT, FOREIGN KEY (account_id) REFERENCES accounts (id));
+    CREATE TABLE interest_rates (id INTEGER PRIMARY KEY AUTOINCREMENT, rate REAL NOT NULL, month TEXT NOT NULL,
+                                 UNIQUE(month));
+"""
+
+# Процесс миграции завершается, как только начинает выполняться оператор с этим текстом
+CRASH_POINTS = [
+    "INSERT INTO accounts_minor",
+    "DROP TABLE accounts",
+    "INSERT INTO transactions_minor",
+    "ALTER TABLE transactions_minor RENAME",
+    "idx_transactions_account_date_id",
+    "idx_transactions_month",
+    "INSERT INTO monthly_balances",
+    "CREATE TABLE IF NOT EXISTS jobs",
+    "ADD COLUMN owner",
+    "INSERT INTO schema_version",
+]
+
+CRASH_CHILD = r"""
+import os, sqlite3, sys
+import migrations
+path, marker = sys.argv[1], sys.argv[2]
+conn = sqlite3.connect(path)
+conn.set_trace_callback(lambda sql: os._exit(3) if marker in sql else None)
+migrations.migrate(conn)
+"""
+
+
+def legacy_database(path, accounts, transactions_per_account):
+    """A pre-versioning database; returns (accounts, transactions, total balance in kopecks)"""
+    with sqlite3.connect(path) as conn:
+        conn.executescript(LEGACY_SCHEMA)
+        total = 0
+        for a in range(accounts):
+            account_id = f"account-{a:06d}"
+            amounts = [((a * 31 + t * 17) % 20001 - 10000) / 100 for t in range(transactions_per_account)]
+            conn.executemany(
+                "INSERT INTO transactions (id, account_id, amount, date, comment) VALUES (?, ?, ?, ?, NULL)",
+                [(f"{account_id}-{t}", account_id, amount, f"2025-{t % 12 + 1:02d}-15")
+                 for t, amount in enumerate(amounts)]
+            )
+            balance = sum(round(amount * 100) for amount in amounts)
+            conn.execute("INSERT INTO accounts (id, name, balance) VALUES (?, ?, ?)",
+                         (account_id, f"Счет {a}", balance / 100))
+            total += balance
+        conn.execute("INSERT INTO interest_rates (rate, month) VALUES (5.5, '2025-04')")
+    conn.close()
+    return accounts, accounts * transactions_per_account, total
+
+
+def check_crash(legacy, marker, expected, env):
+    """Crash a migration of a copy of ``legacy`` at ``marker``, restart it; returns a problem or None"""
+    path = legacy + ".crash"
+    for suffix in ("", "-journal", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    shutil.copy(legacy, path)
+    child = subprocess.run([sys.executable, "-c", CRASH_CHILD, path, marker], env=env, capture_output=True, text=True)
+    if child.returncode != 3:
+        return f"the migration did not reach the crash point (exit code {child.returncode}) {child.stderr[-200:]}"
+    with sqlite3.connect(path) as conn:
+        crashed_at = migrations.current_version(conn)
+    conn.close()
+    try:
+        init_db(path)
+    except sqlite3.Error as e:
+        return f"restart after a crash at version {crashed_at} failed: {str(e)}"
+    with sqlite3.connect(path) as conn:
+        version = migrations.current_version(conn)
+        accounts, transactions = (conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                                  for table in ("accounts", "transactions"))
+        total = conn.execute("SELECT SUM(balance) FROM accounts").fetchone()[0]
+        leftovers = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE name IN ('accounts_minor', 'transactions_minor')"
+        )]
+        discrepancies = reconcile.find_discrepancies(conn)
+    conn.close()
+    if version != migrations.SCHEMA_VERSION:
+        return f"version {version} after restart"
+    if (accounts, transactions, total) != expected:
+        return f"{accounts} accounts, {transactions} transactions, {total} kopecks, expected {expected}"
+    if leftovers:
+        return f"leftover tables: {', '.join(leftovers)}"
+    if discrepancies:
+        return f"{len(discrepancies)} discrepancies, e.g. {discrepancies[0]}"
+    return None
+
+
+def prepare(path, state):
+    if state == "new":
+        for suffix in ("", "-wal", "-shm", ".shards.json"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    elif state == "legacy":
+        with sqlite3.connect(path) as conn:
+            conn.execute("DROP TABLE IF EXISTS schema_version")
+        conn.close()
+
+
+def run_child(path, env):
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", CHILD], cwd=os.path.dirname(path), env=env,
+                            capture_output=True, text=True, check=True).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings["total"] = time.perf_counter() - started
+    return timings
+
+
+def run_uvicorn(path, env):
+    port = free_port()
+    command = [sys.executable, "-m", "uvicorn", "main:create_app", "--factory", "--host", "127.0.0.1",
+               "--port", str(port), "--log-level", "warning", "--app-dir", BACKEND_DIR]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=os.path.dirname(path), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/interest-rate", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+                time.sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait(timeout=15)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--accounts", type=int, default=5000)
+    parser.add_argument("--transactions", type=int, default=20, help="history per account")
+    args = parser.parse_args()
+
+    ok = True
+    with temporary_database() as path:
+        with sqlite3.connect(path) as conn:
+            populate(conn, args.accounts, args.transactions)
+        conn.close()
+        env = dict(os.environ, DATABASE_URL=path, LOG_CONSOLE="0", PYTHONPATH=BACKEND_DIR)
+        print(f"{args.accounts} accounts x {args.transactions} transactions, median of {args.runs} runs (ms)")
+        print(f"{'state':8} {'import':>8} {'startup':>8} {'request':>8} {'process':>8} {'uvicorn':>8}")
+        for state in ("current", "legacy", "new"):
+            runs = []
+            served = []
+            for _ in range(args.runs):
+                prepare(path, state)
+                timings = run_child(path, env)
+                ok &= timings["status"] == 200
+                runs.append(timings)
+                prepare(path, state)
+                served.append(run_uvicorn(path, env))
+            line = f"{state:8}"
+            for key in ("import", "startup", "first_request", "total"):
+                line += f" {percentile([run[key] for run in runs], 0.5) * 1000:8.1f}"
+            line += f" {percentile(served, 0.5) * 1000:8.1f}"
+            print(line)
+
+        legacy = os.path.join(os.path.dirname(path), "legacy.db")
+        expected = legacy_database(legacy, 200, 10)
+        print(f"crash during migration of a pre-versioning database ({expected[0]} accounts)")
+        for marker in CRASH_POINTS:
+            problem = check_crash(legacy, marker, expected, env)
+            ok &= problem is None
+            print(f"  {marker:40} {problem or 'recovered'}")
+    print("PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
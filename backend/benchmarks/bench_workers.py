@@ -0,0 +1,160 @@
+"""Requests per second as the number of uvicorn workers grows.
+
+    python -m benchmarks.bench_workers --workers 1 4 8 --seconds 10 [--writer]
+
+For every worker count a fresh database with the same accounts and history is
+served by ``uvicorn main:app --workers N`` and a pool of async clients sends
+a mixed workload for a fixed time: GET /api/accounts/{id}, a page of
+GET /api/accounts/{id}/transactions and POST /api/transactions, in the
+proportions given by ``--mix``. With ``--writer`` every count is measured a
+second time with the workers' writes funneled through the writer process
+(writer_service.py, DB_WRITER_SOCKET).
+
+Afterwards the database must reconcile and hold exactly the accepted
+postings; exits non-zero otherwise. Throughput only grows with workers when
+there are CPUs for them: the workers, the clients and, with ``--writer``, the
+writer process share the machine, so compare ``os.cpu_count()`` in the header.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import reconcile
+from benchmarks.common import percentile, populate
+from benchmarks.http_client import HttpClient
+from benchmarks.server import running_server, running_writer
+from database import init_db
+
+KINDS = ("account", "transactions", "post")
+
+
+def create_database(directory, accounts, transactions_per_account):
+    path = os.path.join(directory, "banking.db")
+    init_db(path)
+    with sqlite3.connect(path) as conn:
+        account_ids = populate(conn, accounts, transactions_per_account)
+    conn.close()
+    return path, account_ids
+
+
+def stored_postings(path) -> int:
+    with sqlite3.connect(path) as conn:
+        count = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    conn.close()
+    return count
+
+
+async def drive(port, account_ids, mix, seconds, concurrency, seed=0):
+    """Send the mixed workload; returns (latencies by kind, accepted postings, errors)"""
+    rnd = random.Random(seed)
+    today = datetime.now().strftime("%Y-%m-%d")
+    latencies = {kind: [] for kind in KINDS}
+    accepted = 0
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def client():
+        nonlocal accepted, errors
+        http = HttpClient(port=port)
+        try:
+            while time.perf_counter() < deadline:
+                kind = rnd.choices(KINDS, weights=mix)[0]
+                account_id = rnd.choice(account_ids)
+                started = time.perf_counter()
+                if kind == "account":
+                    status, _, _ = await http.request("GET", f"/api/accounts/{account_id}")
+                elif kind == "transactions":
+                    status, _, _ = await http.request("GET", f"/api/accounts/{account_id}/transactions?limit=50")
+                else:
+                    body = {"account_id": account_id, "amount": rnd.randint(-10000, 10000) / 100,
+                            "date": today, "comment": "bench"}
+                    status, _, _ = await http.request("POST", "/api/transactions", body)
+                latencies[kind].append((time.perf_counter() - started) * 1000)
+                if status != 200:
+                    errors += 1
+                elif kind == "post":
+                    accepted += 1
+        finally:
+            await http.close()
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, accepted, errors
+
+
+def measure(args, workers, writer) -> bool:
+    directory = tempfile.mkdtemp(prefix="banking-workers-bench-")
+    try:
+        path, account_ids = create_database(directory, args.accounts, args.transactions)
+        before = stored_postings(path)
+        env = {"LOG_CONSOLE": "0", "LOG_FILE": "app-{pid}.log"}
+        socket_path = os.path.join(directory, "writer.sock")
+        if writer:
+            env["DB_WRITER_SOCKET"] = socket_path
+            with running_writer(path, socket_path, env={"LOG_CONSOLE": "0", "LOG_FILE": "writer.log"}):
+                with running_server(path, workers=workers, env=env) as port:
+                    latencies, accepted, errors = asyncio.run(
+                        drive(port, account_ids, args.mix, args.seconds, args.concurrency))
+        else:
+            with running_server(path, workers=workers, env=env) as port:
+                latencies, accepted, errors = asyncio.run(
+                    drive(port, account_ids, args.mix, args.seconds, args.concurrency))
+
+        total = sum(len(values) for values in latencies.values())
+        every = [value for values in latencies.values() for value in values]
+        line = (f"{workers:>2} workers  {'writer' if writer else 'direct':6}  {total / args.seconds:7.0f} req/s  "
+                f"p50 {percentile(every, 0.5):6.1f} ms  p99 {percentile(every, 0.99):6.1f} ms")
+        for kind in KINDS:
+            if latencies[kind]:
+                line += f"  {kind} p99 {percentile(latencies[kind], 0.99):6.1f}"
+        print(line)
+
+        ok = True
+        if errors:
+            print(f"  {errors} requests failed")
+            ok = False
+        stored = stored_postings(path) - before
+        if stored != accepted:
+            print(f"  stored {stored} postings, {accepted} accepted")
+            ok = False
+        with sqlite3.connect(path) as conn:
+            discrepancies = reconcile.find_discrepancies(conn)
+        conn.close()
+        if discrepancies:
+            print(f"  {len(discrepancies)} discrepancies, first: {discrepancies[0]}")
+            ok = False
+        return ok
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--transactions", type=int, default=20, help="history per account")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=32, help="parallel HTTP clients")
+    parser.add_argument("--mix", type=float, nargs=3, default=[70, 20, 10], metavar=("ACCOUNT", "PAGE", "POST"),
+                        help="weights of GET account, GET transactions page and POST transaction")
+    parser.add_argument("--writer", action="store_true", help="also measure with the writer process")
+    args = parser.parse_args()
+
+    print(f"{args.accounts} accounts, mix {args.mix}, {args.concurrency} clients, {os.cpu_count()} CPUs")
+    ok = True
+    for workers in args.workers:
+        ok &= measure(args, workers, writer=False)
+        if args.writer:
+            ok &= measure(args, workers, writer=True)
+    print("PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Fail when a hot query stops using an index on the transactions table.
+
+    python -m benchmarks.check_query_plans
+
+Exits with a non-zero status if EXPLAIN QUERY PLAN reports a full scan of
+the checked table for any of the queries below.
+"""
+import sqlite3
+import sys
+
+import monthly_balances
+from balances import BALANCES_AS_OF_SQL
+from dashboard import MONTHLY_TOTALS_SQL
+from database import ACCOUNT_TRANSACTIONS_SQL
+from export import export_query
+from history import history_query
+from benchmarks.common import populate, temporary_database
+
+MONTHS = ["2024-03", "2024-02", "2024-01"]
+PLACEHOLDERS = ", ".join("?" for _ in MONTHS)
+BALANCE_AS_OF = BALANCES_AS_OF_SQL.format(values="(?, ?, ?, ?)")
+BALANCE_AS_OF_PARAMS = (0, "account-id", "2024-02-15", "2024-02")
+HISTORY = history_query(MONTHS[::-1], "account-id", 100)
+
+# название: (запрос, параметры, таблица, которую нельзя сканировать целиком)
+CHECKED_QUERIES = {
+    "dashboard monthly totals": (
+        MONTHLY_TOTALS_SQL.format(placeholders=PLACEHOLDERS), MONTHS, "monthly_balances"
+    ),
+    "account transactions": (ACCOUNT_TRANSACTIONS_SQL.format(filters=""), ("account-id", 100), "transactions"),
+    "account transactions next page": (
+        ACCOUNT_TRANSACTIONS_SQL.format(filters=" AND (date, id) < (?, ?) AND amount >= ?"),
+        ("account-id", "2024-02-15", "transaction-id", 0, 100),
+        "transactions",
+    ),
+    "export of an account": (*export_query("account-id", "2024-01-01"), "transactions"),
+    "export by date range": (*export_query(None, "2024-01-01", "2024-02-01"), "transactions"),
+    "balance as of date": (BALANCE_AS_OF, BALANCE_AS_OF_PARAMS, "transactions"),
+    "balance as of date checkpoint": (BALANCE_AS_OF, BALANCE_AS_OF_PARAMS, "monthly_balances"),
+    "accounts history page": (*HISTORY, "accounts"),
+    "accounts history snapshots": (*HISTORY, "monthly_balances"),
+    "accounts history interest": (*HISTORY, "transactions"),
+}
+
+
+def full_scans(conn: sqlite3.Connection, sql: str, params, table: str):
+    """Plan lines that scan ``table`` without any index"""
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    return [
+        detail for detail in plan
+        if detail.startswith(f"SCAN {table}") and "INDEX" not in detail
+    ]
+
+
+def main() -> int:
+    failures = 0
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        populate(conn, 200, 20)
+        conn.execute("ANALYZE")
+        monthly_balances.rebuild(conn)
+        for name, (sql, params, table) in CHECKED_QUERIES.items():
+            scans = full_scans(conn, sql, params, table)
+            status = "FAIL" if scans else "ok"
+            print(f"{status:>4}  {name}" + (f": {'; '.join(scans)}" if scans else ""))
+            failures += bool(scans)
+        conn.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Shared helpers for the benchmarks: synthetic databases, timers, query counters."""
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import monthly_balances
+from database import init_db
+
+
+@contextmanager
+def temporary_database():
+    """Path to a fresh database with the service schema, removed on exit"""
+    directory = tempfile.mkdtemp(prefix="banking-bench-")
+    path = os.path.join(directory, "banking.db")
+    init_db(path)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def populate(conn: sqlite3.Connection, accounts: int, transactions_per_account: int,
+             days: int = 120, seed: int = 0):
+    """Fill the database with deterministic synthetic accounts and transactions (amounts in kopecks)"""
+    rnd = random.Random(seed)
+    today = datetime.now()
+    account_ids = [str(uuid.UUID(int=rnd.getrandbits(128))) for _ in range(accounts)]
+    conn.executemany(
+        "INSERT INTO accounts (id, name, balance) VALUES (?, ?, ?)",
+        ((account_id, f"Счет {i}", 100000) for i, account_id in enumerate(account_ids))
+    )
+
+    def rows():
+        for account_id in account_ids:
+            for _ in range(transactions_per_account):
+                date = today - timedelta(days=rnd.randrange(days))
+                yield (
+                    str(uuid.UUID(int=rnd.getrandbits(128))),
+                    account_id,
+                    rnd.randint(-50000, 50000),
+                    date.strftime("%Y-%m-%d"),
+                    "bench",
+                )
+
+    conn.executemany(
+        "INSERT INTO transactions (id, account_id, amount, date, comment) VALUES (?, ?, ?, ?, ?)",
+        rows()
+    )
+    conn.commit()
+    monthly_balances.rebuild(conn)
+    return account_ids
+
+
+@contextmanager
+def count_queries(conn: sqlite3.Connection):
+    """Count statements executed on a connection inside the block"""
+    counter = {"queries": 0}
+
+    def trace(statement):
+        counter["queries"] += 1
+
+    conn.set_trace_callback(trace)
+    try:
+        yield counter
+    finally:
+        conn.set_trace_callback(None)
+
+
+def timed(fn, *args, repeat: int = 1, **kwargs):
+    """Best wall time in seconds over ``repeat`` runs and the last result"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def percentile(values, fraction: float) -> float:
+    """Nearest-rank percentile, ``fraction`` in [0, 1]"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
@@ -0,0 +1,389 @@
+"""Load test of every endpoint with a JSON baseline for regression checks.
+
+    python -m benchmarks.load --accounts 10000 --seconds 20 --concurrency 32 --output baseline.json
+    python -m benchmarks.load --accounts 10000 --seconds 20 --concurrency 32 --compare baseline.json
+
+Without ``--port`` a synthetic book (benchmarks/synthetic.py) is generated
+into a temporary directory, or ``--database`` is used as is, and served by
+a uvicorn started for the run; with ``--port`` an already running service
+is loaded and its accounts are discovered through GET /api/accounts/history.
+
+``--concurrency`` clients, each with one keep-alive connection, send
+requests for ``--seconds`` after a ``--warmup``. Each request picks a
+scenario at random by weight (``SCENARIOS``; change weights with
+``--weights post_transaction=10,export_all=0.1``). Requests answered with a
+status the scenario does not expect count as errors.
+
+The result records throughput and p50/p95/p99 latency per scenario and in
+total, along with the machine and the arguments. ``--output`` writes it;
+``--compare`` reads an earlier result and fails (exit code 1) when a
+scenario got slower or its throughput dropped by more than ``--tolerance``,
+or when it had errors. Latency changes below ``--slack-ms`` are ignored,
+and so is a percentile with fewer than ``TAIL_SAMPLES`` requests above it
+(p99 needs 1000 requests, p95 200, p50 20): both are mostly noise.
+Compare results recorded with the same arguments on the same kind of
+machine; the defaults leave room for a shared CI runner, and on a
+dedicated one ``--tolerance 0.2`` with longer runs catches smaller changes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from benchmarks.common import percentile
+from benchmarks.http_client import HttpClient
+from benchmarks.server import running_server
+from benchmarks.synthetic import generate
+from shards import ShardMap
+
+RESULT_VERSION = 1
+ACCOUNT_SAMPLE = 10_000
+# Меньше запросов - перцентили сценария не сравниваются, это шум
+TAIL_SAMPLES = 10
+PERCENTILES = (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99))
+
+# (method, path, body, headers)
+Request = Tuple[str, str, Optional[object], Optional[Dict[str, str]]]
+
+
+class Scenario(NamedTuple):
+    weight: float
+    expected: Tuple[int, ...]
+    build: Callable[["Book", random.Random], Request]
+
+
+class Book:
+    """What the scenarios need to know about the data: account ids, dates, a job id"""
+
+    def __init__(self, account_ids: List[str], today: datetime):
+        self.account_ids = account_ids
+        self.today = today
+        self.job_id = "unknown"
+
+    def account(self, rnd: random.Random) -> str:
+        return rnd.choice(self.account_ids)
+
+    def date(self, rnd: random.Random, days: int = 365) -> str:
+        return (self.today - timedelta(days=rnd.randrange(days))).strftime("%Y-%m-%d")
+
+    def month(self, rnd: random.Random) -> str:
+        # Прошлые месяцы: текущий меняет дашборд и капитализацию сильнее, чем нужно для замера
+        return (self.today.replace(day=1) - timedelta(days=1 + 31 * rnd.randrange(11))).strftime("%Y-%m")
+
+
+def _posting(book: Book, rnd: random.Random) -> Dict:
+    return {"account_id": book.account(rnd), "amount": rnd.randint(-100000, 100000) / 100,
+            "date": book.date(rnd, 30), "comment": "load"}
+
+
+def _bulk(book: Book, rnd: random.Random) -> Request:
+    lines = "".join(json.dumps(_posting(book, rnd)) + "\n" for _ in range(100))
+    return "POST", "/api/transactions/bulk", lines.encode(), {"Content-Type": "application/x-ndjson"}
+
+
+def _upload(book: Book, rnd: random.Random) -> Request:
+    boundary = "loadtestboundary"
+    rows = "".join(f"Load {rnd.getrandbits(32)},{rnd.randint(0, 100000)}.00\n" for _ in range(10))
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"accounts.csv\"\r\n"
+            f"Content-Type: text/csv\r\n\r\nname,balance\n{rows}\r\n--{boundary}--\r\n")
+    return "POST", "/api/accounts/upload", body.encode(), {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def _batch_report(book: Book, rnd: random.Random) -> Request:
+    queries = [{"account_id": book.account(rnd), "date": book.date(rnd)} for _ in range(100)]
+    return "POST", "/api/accounts/report/batch", {"queries": queries}, None
+
+
+OK = (200,)
+SCENARIOS: Dict[str, Scenario] = {
+    "root": Scenario(0.5, OK, lambda b, r: ("GET", "/", None, None)),
+    "metrics": Scenario(0.2, OK, lambda b, r: ("GET", "/metrics", None, None)),
+    "pool_stats": Scenario(0.2, OK, lambda b, r: ("GET", "/api/db/pool-stats", None, None)),
+    "cache_stats": Scenario(0.2, OK, lambda b, r: ("GET", "/api/db/cache-stats", None, None)),
+    "group_commit_stats": Scenario(0.2, OK, lambda b, r: ("GET", "/api/db/group-commit-stats", None, None)),
+    "dashboard": Scenario(1, (200, 304), lambda b, r: ("GET", "/api/accounts", None, None)),
+    "account": Scenario(30, OK, lambda b, r: ("GET", f"/api/accounts/{b.account(r)}", None, None)),
+    "transactions_page": Scenario(15, OK, lambda b, r: (
+        "GET", f"/api/accounts/{b.account(r)}/transactions?limit=50", None, None)),
+    "transactions_filtered": Scenario(5, OK, lambda b, r: (
+        "GET", f"/api/accounts/{b.account(r)}/transactions?limit=20&date_from={b.date(r)}&amount_min=0",
+        None, None)),
+    "report": Scenario(5, OK, lambda b, r: (
+        "GET", f"/api/accounts/report?account_id={b.account(r)}&date={b.date(r)}", None, None)),
+    "report_batch": Scenario(2, OK, _batch_report),
+    "history": Scenario(1, OK, lambda b, r: ("GET", "/api/accounts/history?months=6&limit=100", None, None)),
+    "projections": Scenario(1, (200, 304), lambda b, r: ("GET", "/api/accounts/projections", None, None)),
+    "create_account": Scenario(2, OK, lambda b, r: (
+        "POST", "/api/accounts", {"name": f"Load {r.getrandbits(32)}", "balance": 100}, None)),
+    "rename_account": Scenario(2, OK, lambda b, r: (
+        "PUT", f"/api/accounts/{b.account(r)}", {"name": f"Load {r.getrandbits(32)}", "balance": 0}, None)),
+    "post_transaction": Scenario(15, OK, lambda b, r: ("POST", "/api/transactions", _posting(b, r), None)),
+    "bulk_transactions": Scenario(1, OK, _bulk),
+    "export_account": Scenario(2, OK, lambda b, r: (
+        "GET", f"/api/transactions/export?account_id={b.account(r)}", None, None)),
+    # Выгрузка всей книги: включается явно, на большой книге один запрос длится минуты
+    "export_all": Scenario(0, OK, lambda b, r: ("GET", "/api/transactions/export?format=csv", None, None)),
+    "interest_rate": Scenario(5, (200, 304), lambda b, r: ("GET", "/api/interest-rate", None, None)),
+    "set_interest_rate": Scenario(0.5, OK, lambda b, r: (
+        "PUT", f"/api/interest-rate?month={b.month(r)}", {"rate": r.randint(10, 150) / 10}, None)),
+    "capitalize": Scenario(0.2, (202,), lambda b, r: (
+        "POST", f"/api/capitalize-interest?month={b.month(r)}", None, None)),
+    "jobs": Scenario(1, OK, lambda b, r: ("GET", "/api/jobs?limit=20", None, None)),
+    "job": Scenario(1, OK, lambda b, r: ("GET", f"/api/jobs/{b.job_id}", None, None)),
+    "cancel_job": Scenario(0.2, OK, lambda b, r: ("POST", f"/api/jobs/{b.job_id}/cancel", None, None)),
+    "resume_job": Scenario(0.2, (200, 409), lambda b, r: ("POST", f"/api/jobs/{b.job_id}/resume", None, None)),
+    "upload_accounts": Scenario(0.2, (202,), _upload),
+}
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """``"a=1,b=0.5"`` -> {"a": 1.0, "b": 0.5}; names must be scenarios"""
+    weights = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, sep, value = item.partition("=")
+        name = name.strip()
+        if not sep or name not in SCENARIOS:
+            raise ValueError(f"Invalid weight {item.strip()!r}; scenarios: {', '.join(SCENARIOS)}")
+        weights[name] = float(value)
+    return weights
+
+
+def sample_accounts(database_url: str, limit: int = ACCOUNT_SAMPLE) -> List[str]:
+    """Up to ``limit`` account ids spread over every shard"""
+    account_ids = []
+    paths = ShardMap.load(database_url).paths
+    for path in paths:
+        with sqlite3.connect(path) as conn:
+            account_ids.extend(row[0] for row in conn.execute(
+                "SELECT id FROM accounts ORDER BY id LIMIT ?", (limit // len(paths) + 1,)
+            ))
+        conn.close()
+    return account_ids[:limit]
+
+
+async def discover_accounts(port: int, limit: int = ACCOUNT_SAMPLE) -> List[str]:
+    http = HttpClient(port=port)
+    account_ids = []
+    path = "/api/accounts/history?months=1&limit=1000"
+    try:
+        while len(account_ids) < limit:
+            status, headers, body = await http.request("GET", path)
+            if status != 200:
+                raise RuntimeError(f"GET {path}: {status}")
+            account_ids.extend(sorted({row["id"] for row in json.loads(body)}))
+            cursor = headers.get("x-next-cursor")
+            if cursor is None:
+                break
+            path = f"/api/accounts/history?months=1&limit=1000&cursor={cursor}"
+    finally:
+        await http.close()
+    return account_ids[:limit]
+
+
+async def drive(port: int, book: Book, weights: Dict[str, float], seconds: float, warmup: float,
+                concurrency: int, seed: int = 0) -> Dict:
+    """Run the mix; returns per-scenario latencies (ms) and error counts of the measured window"""
+    names = [name for name, weight in weights.items() if weight > 0]
+    mix = [weights[name] for name in names]
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    statuses: Dict[str, Dict[int, int]] = {name: {} for name in names}
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + seconds
+
+    # Задача для сценариев управления задачами
+    http = HttpClient(port=port)
+    try:
+        status, _, body = await http.request("POST", f"/api/capitalize-interest?month={book.month(random.Random(seed))}")
+        if status == 202:
+            book.job_id = json.loads(body)["id"]
+    finally:
+        await http.close()
+
+    async def client(index: int):
+        rnd = random.Random(seed * 1000 + index)
+        http = HttpClient(port=port)
+        try:
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                name = rnd.choices(names, weights=mix)[0]
+                method, path, body, headers = SCENARIOS[name].build(book, rnd)
+                request_started = time.perf_counter()
+                try:
+                    status, _, _ = await http.request(method, path, body, headers)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    status = 0
+                elapsed = time.perf_counter() - request_started
+                if request_started < measure_from:
+                    continue
+                latencies[name].append(elapsed * 1000)
+                statuses[name][status] = statuses[name].get(status, 0) + 1
+                if status not in SCENARIOS[name].expected:
+                    errors[name] += 1
+        finally:
+            await http.close()
+
+    await asyncio.gather(*(client(index) for index in range(concurrency)))
+    return {"latencies": latencies, "errors": errors, "statuses": statuses,
+            "seconds": time.perf_counter() - measure_from}
+
+
+def summarize(values: List[float], errors: int, seconds: float) -> Dict:
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput": round(len(values) / seconds, 1),
+        "p50_ms": round(percentile(values, 0.50), 2),
+        "p95_ms": round(percentile(values, 0.95), 2),
+        "p99_ms": round(percentile(values, 0.99), 2),
+    }
+
+
+def build_result(run: Dict, config: Dict) -> Dict:
+    scenarios = {
+        name: dict(summarize(values, run["errors"][name], run["seconds"]),
+                   statuses={str(status): count for status, count in sorted(run["statuses"][name].items())})
+        for name, values in run["latencies"].items()
+    }
+    every = [value for values in run["latencies"].values() for value in values]
+    return {
+        "version": RESULT_VERSION,
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "machine": {"cpus": os.cpu_count(), "python": platform.python_version(),
+                    "sqlite": sqlite3.sqlite_version, "platform": platform.platform()},
+        "config": config,
+        "total": summarize(every, sum(run["errors"].values()), run["seconds"]),
+        "scenarios": scenarios,
+    }
+
+
+def compare(result: Dict, baseline: Dict, tolerance: float, slack_ms: float) -> List[str]:
+    """Regressions of ``result`` against ``baseline``, one line each"""
+    regressions = []
+    rows = dict(baseline["scenarios"], total=baseline["total"])
+    current = dict(result["scenarios"], total=result["total"])
+    for name, before in rows.items():
+        after = current.get(name)
+        if after is None:
+            continue
+        if after["errors"]:
+            regressions.append(f"{name}: {after['errors']} errors")
+        requests = min(before["requests"], after["requests"])
+        for key, q in PERCENTILES:
+            # Перцентиль, выше которого меньше TAIL_SAMPLES запросов, - несколько случайных значений
+            if requests * (1 - q) < TAIL_SAMPLES:
+                continue
+            limit = before[key] * (1 + tolerance) + slack_ms
+            if after[key] > limit:
+                regressions.append(f"{name}: {key} {after[key]} > {before[key]} (+{tolerance:.0%} +{slack_ms} ms)")
+        # Пропускная способность сценария с малым весом - несколько запросов, сравнивается только общая
+        if name == "total" and after["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {after['throughput']}/s < {before['throughput']}/s "
+                               f"(-{tolerance:.0%})")
+    return regressions
+
+
+def print_result(result: Dict, baseline: Optional[Dict] = None):
+    print(f"{'scenario':24} {'req':>7} {'err':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    rows = sorted(result["scenarios"].items(), key=lambda item: -item[1]["requests"])
+    for name, row in rows + [("total", result["total"])]:
+        line = (f"{name:24} {row['requests']:7} {row['errors']:4} {row['throughput']:8.1f} "
+                f"{row['p50_ms']:8.2f} {row['p95_ms']:8.2f} {row['p99_ms']:8.2f}")
+        before = None
+        if baseline is not None:
+            before = baseline["total"] if name == "total" else baseline["scenarios"].get(name)
+        if before is not None and before["p95_ms"]:
+            line += f"  p95 {row['p95_ms'] / before['p95_ms'] - 1:+.0%}"
+        print(line)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=None, help="load a running service instead of starting one")
+    parser.add_argument("--database", default=None, help="serve this database instead of a generated one")
+    parser.add_argument("--accounts", type=int, default=10_000, help="size of the generated book")
+    parser.add_argument("--transactions", type=int, default=20, help="transactions per generated account")
+    parser.add_argument("--shards", type=int, default=1, help="shards of the generated book")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--concurrency", type=int, default=32, help="parallel clients")
+    parser.add_argument("--seconds", type=float, default=20.0, help="measured duration")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured duration before it")
+    parser.add_argument("--weights", default="", help="scenario weights, e.g. post_transaction=10,export_all=0.1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write the result as JSON")
+    parser.add_argument("--compare", default=None, help="JSON result to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative slowdown")
+    parser.add_argument("--slack-ms", type=float, default=2.0, help="latency change always allowed")
+    args = parser.parse_args()
+
+    try:
+        weights = {name: scenario.weight for name, scenario in SCENARIOS.items()}
+        weights.update(parse_weights(args.weights))
+    except ValueError as e:
+        print(e)
+        return 2
+    config = {key: getattr(args, key) for key in
+              ("accounts", "transactions", "shards", "workers", "concurrency", "seconds", "warmup", "seed")}
+    config["database"] = args.database
+    config["weights"] = weights
+    today = datetime.now()
+
+    if args.port is not None:
+        book = Book(asyncio.run(discover_accounts(args.port)), today)
+        run = asyncio.run(drive(args.port, book, weights, args.seconds, args.warmup, args.concurrency, args.seed))
+    else:
+        directory = None
+        try:
+            database_url = args.database
+            if database_url is None:
+                directory = tempfile.mkdtemp(prefix="banking-load-")
+                database_url = os.path.join(directory, "banking.db")
+                generated = generate(database_url, args.accounts, args.transactions, shards=args.shards,
+                                     seed=args.seed, log=lambda message: None)
+                print(f"generated {generated['accounts']} accounts, {generated['transactions']} transactions "
+                      f"in {generated['seconds']} s")
+            book = Book(sample_accounts(database_url), today)
+            env = {"LOG_CONSOLE": "0", "LOG_FILE": "app-{pid}.log"}
+            with running_server(database_url, workers=args.workers, env=env) as port:
+                run = asyncio.run(drive(port, book, weights, args.seconds, args.warmup, args.concurrency, args.seed))
+        finally:
+            if directory is not None:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    result = build_result(run, config)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_result(result, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"result written to {args.output}")
+
+    failed = result["total"]["errors"] > 0
+    if baseline is not None:
+        regressions = compare(result, baseline, args.tolerance, args.slack_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        failed |= bool(regressions)
+    print("FAIL" if failed else "PASS")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
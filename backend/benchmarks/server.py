@@ -0,0 +1,84 @@
+"""Run the API in a uvicorn subprocess against a benchmark database."""
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def running_server(database_url: str, backend_dir: str = BACKEND_DIR, workers: int = 1,
+                   env: dict = None, app: str = "main:app", startup_timeout: float = 60.0):
+    """Start uvicorn serving ``app`` from ``backend_dir`` and yield its port"""
+    port = free_port()
+    process_env = dict(os.environ, DATABASE_URL=database_url, **(env or {}))
+    command = [
+        sys.executable, "-m", "uvicorn", app,
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning",
+        "--app-dir", backend_dir,
+    ]
+    # Рабочий каталог - каталог базы, чтобы app.log не попадал в рабочую копию
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(database_url)), env=process_env,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL if not os.environ.get("BENCH_VERBOSE") else None)
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                    break
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+                if time.monotonic() > deadline:
+                    raise RuntimeError("uvicorn did not start in time")
+                time.sleep(0.1)
+        yield port
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+@contextmanager
+def running_writer(database_url: str, socket_path: str, backend_dir: str = BACKEND_DIR,
+                   env: dict = None, startup_timeout: float = 60.0):
+    """Start the writer process (writer_service.py) and yield once its socket accepts connections"""
+    process_env = dict(os.environ, DATABASE_URL=database_url, PYTHONPATH=backend_dir, **(env or {}))
+    process = subprocess.Popen([sys.executable, "-m", "writer_service", "--socket", socket_path],
+                               cwd=os.path.dirname(os.path.abspath(database_url)), env=process_env,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL if not os.environ.get("BENCH_VERBOSE") else None)
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.settimeout(0.5)
+                    sock.connect(socket_path)
+                    break
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError(f"writer process exited with code {process.returncode}")
+                if time.monotonic() > deadline:
+                    raise RuntimeError("writer process did not start in time")
+                time.sleep(0.1)
+        yield socket_path
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
@@ -0,0 +1,146 @@
+"""Concurrency stress test: thousands of parallel postings to a few hot accounts.
+
+    python -m benchmarks.stress_postings --postings 5000 --accounts 5 --workers 4
+
+Two phases against the same database:
+
+* ``processes``: several OS processes, each with its own connection pool,
+  call ``repository.post_transaction`` directly, so write transactions from
+  different connections really contend for the database lock;
+* ``http``: concurrent clients POST /api/transactions to a multi-worker
+  uvicorn.
+
+Afterwards every account's balance must equal its opening balance plus the
+sum of its transactions, every accepted posting must be stored exactly once
+and ``reconcile`` must find nothing. Exits non-zero otherwise.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+import reconcile
+import repository
+from db_pool import ConnectionPool
+from benchmarks.common import percentile, populate, temporary_database
+from benchmarks.http_client import HttpClient
+from benchmarks.server import running_server
+
+OPENING_BALANCE = 100000
+
+
+def post_many(args):
+    """Worker process: post ``count`` random amounts, return (accepted, busy retries)"""
+    path, account_ids, count, seed, busy_timeout_ms = args
+    rnd = random.Random(seed)
+    pool = ConnectionPool(path, readers=1, busy_timeout_ms=busy_timeout_ms, busy_retries=20, retry_backoff=0.001)
+    today = datetime.now().strftime("%Y-%m-%d")
+    accepted = 0
+    for _ in range(count):
+        amount = rnd.randint(-10000, 10000)
+        if pool.run_write(repository.post_transaction, rnd.choice(account_ids), amount, today, "stress") is not None:
+            accepted += 1
+    retries = pool.stats()["busy_retries"]
+    pool.close()
+    return accepted, retries
+
+
+def run_processes(path, account_ids, postings, processes, busy_timeout_ms):
+    per_process = postings // processes
+    started = time.perf_counter()
+    with multiprocessing.Pool(processes) as workers:
+        results = workers.map(post_many, [(path, account_ids, per_process, seed, busy_timeout_ms) for seed in range(processes)])
+    elapsed = time.perf_counter() - started
+    accepted = sum(result[0] for result in results)
+    retries = sum(result[1] for result in results)
+    print(f"  processes: {accepted} postings from {processes} processes in {elapsed:.2f} s "
+          f"({accepted / elapsed:.0f}/s), {retries} busy retries")
+    return accepted
+
+
+async def run_http(port, account_ids, postings, concurrency):
+    rnd = random.Random(1)
+    today = datetime.now().strftime("%Y-%m-%d")
+    queue = asyncio.Queue()
+    for _ in range(postings):
+        queue.put_nowait({"account_id": rnd.choice(account_ids), "amount": rnd.randint(-10000, 10000) / 100,
+                          "date": today, "comment": "stress"})
+    latencies = []
+    statuses = {}
+
+    async def client():
+        http = HttpClient(port=port)
+        try:
+            while not queue.empty():
+                body = queue.get_nowait()
+                started = time.perf_counter()
+                status, _, _ = await http.request("POST", "/api/transactions", body)
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            await http.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    print(f"  http: {postings} postings, {concurrency} clients in {elapsed:.2f} s ({postings / elapsed:.0f}/s), "
+          f"p50 {percentile(latencies, 0.5):.1f} ms  p99 {percentile(latencies, 0.99):.1f} ms  statuses {statuses}")
+    return statuses.get(200, 0)
+
+
+def verify(path, expected_postings) -> bool:
+    conn = sqlite3.connect(path)
+    ok = True
+    rows = conn.execute("""
+        SELECT a.id, a.balance, COALESCE(SUM(t.amount), 0), COUNT(t.id)
+        FROM accounts a LEFT JOIN transactions t ON t.account_id = a.id
+        GROUP BY a.id
+    """).fetchall()
+    stored = sum(row[3] for row in rows)
+    for account_id, balance, total, count in rows:
+        expected = OPENING_BALANCE + total
+        status = "ok" if balance == expected else "LOST UPDATE"
+        ok &= balance == expected
+        print(f"  {account_id}  {count:>6} postings  balance {balance:>12}  expected {expected:>12}  {status}")
+    if stored != expected_postings:
+        print(f"  stored {stored} postings, expected {expected_postings}")
+        ok = False
+    discrepancies = reconcile.find_discrepancies(conn)
+    if discrepancies:
+        print(f"  reconcile: {len(discrepancies)} discrepancies, first: {discrepancies[0]}")
+        ok = False
+    conn.close()
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--postings", type=int, default=5000, help="postings per phase")
+    parser.add_argument("--accounts", type=int, default=5, help="hot accounts")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn workers")
+    parser.add_argument("--concurrency", type=int, default=64, help="parallel HTTP clients")
+    parser.add_argument("--busy-timeout-ms", type=int, default=5000,
+                        help="busy timeout of the worker processes; a small value such as 20 exercises the retry path")
+    args = parser.parse_args()
+
+    with temporary_database() as path:
+        conn = sqlite3.connect(path)
+        account_ids = populate(conn, args.accounts, 0)
+        conn.close()
+
+        accepted = run_processes(path, account_ids, args.postings, args.processes, args.busy_timeout_ms)
+        with running_server(path, workers=args.workers) as port:
+            accepted += asyncio.run(run_http(port, account_ids, args.postings, args.concurrency))
+
+        ok = verify(path, accepted)
+    print("PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
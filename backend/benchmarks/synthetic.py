@@ -0,0 +1,198 @@
+"""Deterministic synthetic books generated straight into SQLite.
+
+    python -m benchmarks.synthetic --database book.db --accounts 1000000 --transactions 20 [--shards 4]
+    python -m benchmarks.synthetic --database banking.db --accounts 10    # a small book for development
+
+The same arguments always produce the same rows: ids are counters formatted
+as UUIDs, and amounts, dates, balances and rates are integer hashes of the
+row number and ``--seed``. The rows are produced by SQLite itself (a
+recursive counter joined with the accounts of a chunk) rather than by Python,
+and the ids grow in insertion order, so primary keys are appended instead of
+inserted at random. Secondary indexes of ``transactions`` and
+``monthly_balances`` are dropped for the load and rebuilt at the end, which
+sorts each one once. Snapshots are rebuilt
+from the generated history (``monthly_balances.rebuild``), so the book
+reconciles.
+
+The database must be new or empty. It is written with the journal and fsync
+turned off and switched to WAL at the end: a generation that is interrupted
+leaves a file that should be thrown away.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+import monthly_balances
+from database import init_shards
+
+# UUID из префикса (seed) и номера строки в 12 десятичных цифрах; конкатенация быстрее printf
+ACCOUNT_ID = ":account_prefix || substr(1000000000000 + {}, 2)"
+TRANSACTION_ID = ":transaction_prefix || substr(1000000000000 + {}, 2)"
+# Мультипликативный хеш Кнута; номер строки < 3e9, произведение помещается в 64 бита
+HASH = "((({}) + :seed) * 2654435761 % 4294967296)"
+COMMENTS = ("salary", "groceries", "transfer", "utilities")
+
+
+def generate_shard(conn: sqlite3.Connection, accounts: int, transactions_per_account: int, days: int,
+                   seed: int, today: str, shard_of: Optional[Callable[[str], bool]] = None,
+                   chunk_size: int = 100_000, progress: Callable[[int], None] = None) -> Dict:
+    """Generate the accounts for which ``shard_of(id)`` is true (all without it); returns row counts"""
+    if conn.execute("SELECT 1 FROM accounts LIMIT 1").fetchone() is not None:
+        raise ValueError("the database already holds accounts; generate into a new file")
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    if shard_of is not None:
+        conn.create_function("in_shard", 1, shard_of, deterministic=True)
+    started = time.perf_counter()
+    params = {"seed": seed, "per_account": transactions_per_account, "days": days, "today": today,
+              "account_prefix": f"{seed:08x}-0000-4000-a000-", "transaction_prefix": f"{seed:08x}-0000-4000-8000-"}
+
+    # Вторичные индексы строятся после загрузки: одна сортировка вместо вставок в случайные места
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master "
+        "WHERE type = 'index' AND tbl_name IN ('transactions', 'monthly_balances') AND sql IS NOT NULL"
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+
+    conn.execute("CREATE TEMP TABLE gen_accounts (idx INTEGER PRIMARY KEY, id TEXT NOT NULL)")
+    conn.execute("CREATE TEMP TABLE gen_seq (k INTEGER PRIMARY KEY)")
+    conn.execute(
+        "INSERT INTO gen_seq (k) WITH RECURSIVE seq(k) AS (SELECT 0 UNION ALL SELECT k + 1 FROM seq WHERE k + 1 < ?) "
+        "SELECT k FROM seq WHERE k < ?",
+        (transactions_per_account, transactions_per_account)
+    )
+
+    generated = {"accounts": 0, "transactions": 0}
+    for first in range(0, accounts, chunk_size):
+        last = min(first + chunk_size, accounts)
+        conn.execute("DELETE FROM gen_accounts")
+        conn.execute(
+            f"""
+            INSERT INTO gen_accounts (idx, id)
+            SELECT i, {ACCOUNT_ID.format('i')} FROM (
+                WITH RECURSIVE seq(i) AS (SELECT :first UNION ALL SELECT i + 1 FROM seq WHERE i + 1 < :last)
+                SELECT i FROM seq
+            )
+            {'WHERE in_shard(' + ACCOUNT_ID.format('i') + ')' if shard_of is not None else ''}
+            """,
+            dict(params, first=first, last=last)
+        )
+        cursor = conn.execute(
+            f"""
+            INSERT INTO accounts (id, name, balance)
+            SELECT id, 'Счет ' || idx, {HASH.format('idx')} % 10000000 FROM gen_accounts ORDER BY idx
+            """,
+            params
+        )
+        generated["accounts"] += cursor.rowcount
+        # Сумма - +-1000 рублей, дата - один из последних days дней; хеш берется от номера транзакции
+        cursor = conn.execute(
+            f"""
+            INSERT INTO transactions (id, account_id, amount, date, comment)
+            SELECT {TRANSACTION_ID.format('n')},
+                   account_id,
+                   h % 200001 - 100000,
+                   date(julianday(:today) - (h / 256) % :days),
+                   CASE h % 4 WHEN 0 THEN '{COMMENTS[0]}' WHEN 1 THEN '{COMMENTS[1]}'
+                              WHEN 2 THEN '{COMMENTS[2]}' ELSE '{COMMENTS[3]}' END
+            FROM (
+                SELECT a.id AS account_id, a.idx * :per_account + s.k AS n,
+                       {HASH.format('a.idx * :per_account + s.k')} AS h
+                FROM gen_accounts a CROSS JOIN gen_seq s
+                ORDER BY a.idx, s.k
+            )
+            """,
+            params
+        )
+        generated["transactions"] += cursor.rowcount
+        conn.commit()
+        if progress is not None:
+            progress(last)
+
+    conn.execute("DROP TABLE gen_accounts")
+    conn.execute("DROP TABLE gen_seq")
+    generated["load_seconds"] = time.perf_counter() - started
+    # Ставки: 5.0-14.9% годовых за каждый месяц истории
+    conn.execute(
+        f"""
+        INSERT INTO interest_rates (rate, month)
+        WITH RECURSIVE seq(k) AS (SELECT 0 UNION ALL SELECT k + 1 FROM seq WHERE k + 1 <= :days / 28 + 1)
+        SELECT 5 + {HASH.format('k')} % 100 / 10.0, strftime('%Y-%m', :today, 'start of month', -k || ' months')
+        FROM seq WHERE true
+        ON CONFLICT(month) DO UPDATE SET rate = excluded.rate
+        """,
+        params
+    )
+    conn.commit()
+    monthly_balances.rebuild(conn)
+    for _, sql in indexes:
+        conn.execute(sql)
+    conn.commit()
+    conn.execute("PRAGMA journal_mode=WAL")
+    generated["seconds"] = time.perf_counter() - started
+    return generated
+
+
+def generate(database_url: str, accounts: int, transactions_per_account: int, days: int = 365, seed: int = 0,
+             shards: int = 1, today: Optional[str] = None, chunk_size: int = 100_000,
+             log: Callable[[str], None] = print) -> Dict:
+    """Create a database of ``shards`` shards holding a synthetic book; returns row counts and timings"""
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    shard_map = init_shards(database_url, shards)
+    started = time.perf_counter()
+    totals = {"accounts": 0, "transactions": 0, "load_seconds": 0.0}
+    for shard, path in enumerate(shard_map.paths):
+
+        def in_shard(account_id, shard=shard):
+            return shard_map.shard_of(account_id) == shard
+
+        def progress(done, shard=shard):
+            if done % (chunk_size * 10) == 0:
+                log(f"  shard {shard}: {done}/{accounts} accounts")
+
+        with sqlite3.connect(path) as conn:
+            counts = generate_shard(conn, accounts, transactions_per_account, days, seed, today,
+                                    in_shard if len(shard_map) > 1 else None, chunk_size, progress)
+        conn.close()
+        for key in totals:
+            totals[key] += counts[key]
+    elapsed = time.perf_counter() - started
+    rows = totals["accounts"] + totals["transactions"]
+    return dict(totals, seconds=round(elapsed, 2), load_seconds=round(totals["load_seconds"], 2),
+                rows_per_second=round(rows / totals["load_seconds"]) if totals["load_seconds"] > 0 else None)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic book")
+    parser.add_argument("--database", required=True, help="new SQLite file (shard 0 with --shards)")
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=20, help="transactions per account")
+    parser.add_argument("--days", type=int, default=365, help="transactions are dated over the last DAYS days")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--today", default=None, help="date the history ends at (default: today)")
+    args = parser.parse_args()
+
+    if args.accounts * max(args.transactions, 1) >= 3_000_000_000:
+        print("at most 3e9 transactions")
+        return 1
+    try:
+        result = generate(args.database, args.accounts, args.transactions, args.days, args.seed, args.shards,
+                          args.today)
+    except (ValueError, sqlite3.Error) as e:
+        print(f"generation failed: {e}")
+        return 1
+    print(f"{result['accounts']} accounts, {result['transactions']} transactions: rows written in "
+          f"{result['load_seconds']} s ({result['rows_per_second']} rows/s), with indexes and snapshots "
+          f"{result['seconds']} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""Bulk transaction ingestion.
+
+Rows are validated one by one, then written in chunks: each chunk is a single
+transaction with one ``executemany`` insert and one balance update per
+account. Invalid rows are reported with their row number and skipped. With
+several shards a chunk is split by the accounts' shards and the parts are
+written in parallel, each in its own shard's transaction.
+"""
+import asyncio
+import json
+import sqlite3
+import uuid
+from collections import defaultdict
+from datetime import date as datetime_date, datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import monthly_balances
+from money import to_minor
+from streams import aiter_csv_rows
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+CSV_FIELDS = ("account_id", "amount", "date", "comment")
+# Ограничение SQLite на число параметров в одном запросе
+_IN_BATCH = 500
+
+# (номер строки, account_id, amount в копейках, date, comment)
+Row = Tuple[int, str, int, str, Optional[str]]
+
+
+class BulkResult:
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+
+    def add_error(self, row_number: int, error: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": error})
+
+    def to_dict(self) -> Dict:
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda error: error["row"]),
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def validate_row(row_number: int, raw, today=None) -> Row:
+    """Normalize one input record, raising ValueError with a readable message"""
+    if not isinstance(raw, dict):
+        raise ValueError("Row must be an object")
+    account_id = raw.get("account_id")
+    if not account_id or not isinstance(account_id, str):
+        raise ValueError("account_id is required")
+
+    amount = raw.get("amount")
+    if amount is None or amount == "" or isinstance(amount, bool):
+        raise ValueError("amount is required")
+    # Сумма переводится в копейки; больше двух знаков после запятой - ошибка строки
+    amount = to_minor(amount)
+
+    date = raw.get("date")
+    if not isinstance(date, str):
+        raise ValueError("date is required")
+    try:
+        # date.fromisoformat в разы быстрее strptime; формат проверяем явно
+        if len(date) != 10 or date[4] != "-" or date[7] != "-":
+            raise ValueError(date)
+        transaction_date = datetime_date.fromisoformat(date)
+    except ValueError:
+        raise ValueError(f"Invalid date: {date!r}, expected YYYY-MM-DD")
+    if transaction_date > (today or datetime.now().date()):
+        raise ValueError("Transaction date cannot be in the future")
+
+    comment = raw.get("comment")
+    if comment is not None and not isinstance(comment, str):
+        comment = str(comment)
+    return row_number, account_id, amount, date, comment or None
+
+
+def iter_json_array(body: bytes) -> Iterable[Tuple[int, object]]:
+    data = json.loads(body)
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of transactions")
+    return enumerate(data, start=1)
+
+
+async def aiter_ndjson(lines: AsyncIterator[str]):
+    row_number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, ValueError(f"Invalid JSON: {e.msg}")
+
+
+async def aiter_csv(lines: AsyncIterator[str]):
+    """CSV with a header row"""
+    header = None
+    row_number = 0
+    async for values in aiter_csv_rows(lines):
+        if header is None:
+            header = [name.strip() for name in values]
+            missing = [name for name in CSV_FIELDS[:3] if name not in header]
+            if missing:
+                raise ValueError(f"CSV header is missing columns: {', '.join(missing)}")
+            continue
+        row_number += 1
+        yield row_number, dict(zip(header, values))
+
+
+def ingest_chunk(conn: sqlite3.Connection, rows: List[Row]) -> Tuple[int, List[Tuple[int, str]]]:
+    """Write one chunk in a single transaction; returns (inserted, [(row, error)])"""
+    account_ids = list({row[1] for row in rows})
+    existing = set()
+    for start in range(0, len(account_ids), _IN_BATCH):
+        batch = account_ids[start:start + _IN_BATCH]
+        placeholders = ", ".join("?" for _ in batch)
+        cursor = conn.execute(f"SELECT id FROM accounts WHERE id IN ({placeholders})", batch)
+        existing.update(row[0] for row in cursor)
+
+    errors = []
+    values = []
+    deltas = defaultdict(int)
+    month_deltas = defaultdict(int)
+    for row_number, account_id, amount, date, comment in rows:
+        if account_id not in existing:
+            errors.append((row_number, "Account not found"))
+            continue
+        values.append((str(uuid.uuid4()), account_id, amount, date, comment))
+        deltas[account_id] += amount
+        month_deltas[(account_id, date[:7])] += amount
+
+    if values:
+        conn.executemany(
+            "INSERT INTO transactions (id, account_id, amount, date, comment) VALUES (?, ?, ?, ?, ?)",
+            values
+        )
+        monthly_balances.apply_deltas(
+            conn, [(account_id, month, delta) for (account_id, month), delta in month_deltas.items()]
+        )
+        # Баланс каждого счета обновляется один раз на чанк
+        conn.executemany(
+            "UPDATE accounts SET balance = balance + ? WHERE id = ?",
+            [(delta, account_id) for account_id, delta in deltas.items()]
+        )
+        conn.commit()
+    return len(values), errors
+
+
+async def aiter_records(records: Iterable[Tuple[int, object]]):
+    for record in records:
+        yield record
+
+
+async def write_by_shard(fn, rows: List[Row]) -> Tuple[int, List[Tuple[int, str]]]:
+    """``ingest_chunk`` through the writers of the rows' shards; results are combined"""
+    from database import shard_count, shard_for
+    from db_executor import run_write, run_write_on
+
+    if shard_count() == 1:
+        return await run_write(fn, rows)
+    parts = defaultdict(list)
+    for row in rows:
+        parts[shard_for(row[1])].append(row)
+    results = await asyncio.gather(*(run_write_on(shard, fn, part) for shard, part in parts.items()))
+    return sum(inserted for inserted, _ in results), [error for _, errors in results for error in errors]
+
+
+async def ingest(records, write=None, chunk_size: int = CHUNK_SIZE) -> BulkResult:
+    """Validate ``(row_number, record)`` pairs and write them chunk by chunk.
+
+    ``write`` awaits ``fn(conn, *args)`` on the writer connection and defaults
+    to ``write_by_shard``.
+    """
+    if write is None:
+        write = write_by_shard
+
+    result = BulkResult()
+    today = datetime.now().date()
+    chunk: List[Row] = []
+
+    async def flush():
+        inserted, errors = await write(ingest_chunk, list(chunk))
+        result.inserted += inserted
+        for row_number, error in errors:
+            result.add_error(row_number, error)
+        chunk.clear()
+
+    async for row_number, raw in records:
+        if isinstance(raw, Exception):
+            result.add_error(row_number, str(raw))
+            continue
+        try:
+            chunk.append(validate_row(row_number, raw, today))
+        except ValueError as e:
+            result.add_error(row_number, str(e))
+            continue
+        if len(chunk) >= chunk_size:
+            await flush()
+    if chunk:
+        await flush()
+    return result
@@ -0,0 +1,160 @@
+"""Read-through cache for interest rates and account rows, and ETags.
+
+Entries live in bounded in-process LRU maps. Before every lookup the cache
+reads the database commit counter (``ConnectionPool.data_version``); when it
+has moved, i.e. anything was committed by this process or another worker —
+an interest rate update, a posting, an account update, a capitalization
+chunk, an import — every entry is dropped. A cached value is therefore never
+older than the last commit the lookup could have seen.
+
+With several shards the version is the tuple of the counters of all
+shards, so a commit to any of them counts.
+
+The same counter versions the ETag of responses built from many rows (the
+dashboard), so clients sending If-None-Match get a 304 while nothing has been
+committed.
+"""
+import os
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import repository
+from database import get_pools
+
+ACCOUNT_CACHE_SIZE = int(os.environ.get("ACCOUNT_CACHE_SIZE", "10000"))
+RATE_CACHE_SIZE = int(os.environ.get("RATE_CACHE_SIZE", "256"))
+
+# Отличает ETag этого процесса: счетчик коммитов сравним только внутри него
+_INSTANCE = uuid.uuid4().hex[:8]
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=_MISSING):
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+accounts = LRUCache(ACCOUNT_CACHE_SIZE)
+rates = LRUCache(RATE_CACHE_SIZE)
+
+_lock = threading.Lock()
+_pools = None
+_version = None
+_invalidations = 0
+
+
+def _sync() -> Tuple[int, ...]:
+    """Drop every entry if something was committed since the last lookup; caller holds _lock"""
+    global _pools, _version, _invalidations
+    pools = get_pools()
+    version = tuple(pool.data_version() for pool in pools)
+    if pools != _pools or version != _version:
+        if _version is not None:
+            _invalidations += 1
+        accounts.clear()
+        rates.clear()
+        _pools, _version = pools, version
+    return version
+
+
+def _store(cache: LRUCache, version: Tuple[int, ...], items: Dict):
+    # Значение, прочитанное до чужой инвалидации, в кэш не попадает
+    with _lock:
+        if _version == version:
+            for key, value in items.items():
+                cache.put(key, value)
+
+
+def get_account(conn: sqlite3.Connection, account_id: str) -> Optional[Dict]:
+    """``repository.get_account`` through the cache; unknown ids are cached as None"""
+    with _lock:
+        version = _sync()
+        account = accounts.get(account_id)
+    if account is _MISSING:
+        account = repository.get_account(conn, account_id)
+        _store(accounts, version, {account_id: account})
+    return None if account is None else dict(account)
+
+
+def get_interest_rates(conn: sqlite3.Connection, months: Iterable[str]) -> Dict[str, float]:
+    """Rates of ``months`` (0.0 when not set), reading only the uncached ones"""
+    months = list(months)
+    with _lock:
+        version = _sync()
+        found = {month: rates.get(month) for month in months}
+    missing = [month for month, rate in found.items() if rate is _MISSING]
+    if missing:
+        loaded = repository.get_interest_rates(conn, missing)
+        _store(rates, version, loaded)
+        found.update(loaded)
+    return found
+
+
+def get_interest_rate(conn: sqlite3.Connection, month: str) -> float:
+    return get_interest_rates(conn, [month])[month]
+
+
+def etag(scope: str = "") -> str:
+    """ETag of everything derived from the current database state and ``scope`` (no commas)"""
+    with _lock:
+        version = _sync()
+    return f'"{_INSTANCE}-{".".join(map(str, version))}-{scope}"'
+
+
+def etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    """True when an If-None-Match header lists ``tag`` (weak comparison) or is ``*``"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == tag for candidate in candidates)
+
+
+def stats() -> Dict:
+    with _lock:
+        return {
+            "data_version": list(_version) if _version is not None else None,
+            "invalidations": _invalidations,
+            "accounts": accounts.stats(),
+            "rates": rates.stats(),
+        }
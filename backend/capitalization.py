@@ -0,0 +1,314 @@
+"""Set-based, resumable interest capitalization.
+
+Accounts are processed in chunks by rowid. Each chunk is one transaction: the
+interest of every account in the chunk is computed into a temporary table,
+posted with a single ``INSERT ... SELECT`` and applied with a single UPDATE.
+Interest transactions have deterministic ids (month + account), so accounts
+already capitalized for the month are skipped and a crashed run can simply
+be started again. Interest is rounded to whole kopecks per account.
+
+With several shards every shard is capitalized by its own chunk loop, all in
+parallel. A shard's chunk and the job checkpoint (in shard 0) are then two
+commits; a chunk committed just before a crash is simply repeated on resume,
+finding its accounts already capitalized.
+"""
+import asyncio
+import calendar
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import monthly_balances
+from money import to_major
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 100000
+
+INTEREST_ID_PREFIX = "interest"
+
+
+def interest_transaction_id(month: str, account_id: str) -> str:
+    return f"{INTEREST_ID_PREFIX}-{month}-{account_id}"
+
+
+def validate_month(month: str, today: Optional[datetime] = None) -> str:
+    """A YYYY-MM month no later than the current one"""
+    try:
+        datetime.strptime(month, "%Y-%m")
+    except ValueError:
+        raise ValueError(f"Invalid month: {month!r}, expected YYYY-MM")
+    # Проценты за будущий месяц датировались бы сегодняшним днем чужого месяца
+    if month > (today or datetime.now()).strftime("%Y-%m"):
+        raise ValueError(f"Cannot capitalize a future month: {month}")
+    return month
+
+
+def posting_date(month: str, today: Optional[datetime] = None) -> str:
+    """Last day of the month, or today for the current month"""
+    today = today or datetime.now()
+    year, month_number = map(int, month.split("-"))
+    last_day = datetime(year, month_number, calendar.monthrange(year, month_number)[1])
+    return min(last_day, today).strftime("%Y-%m-%d")
+
+
+def month_rate(conn: sqlite3.Connection, month: str) -> float:
+    row = conn.execute("SELECT rate FROM interest_rates WHERE month = ?", (month,)).fetchone()
+    return row[0] if row else 0.0
+
+
+def count_accounts(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+
+
+def capitalize_chunk(conn: sqlite3.Connection, month: str, rate: float, after_rowid: int,
+                     chunk_size: int = CHUNK_SIZE,
+                     checkpoint: Optional[Callable] = None) -> Tuple[Optional[int], int, int, int]:
+    """Capitalize the next chunk of accounts after ``after_rowid``.
+
+    Returns (last rowid of the chunk or None when done, accounts in chunk,
+    accounts capitalized, total interest in kopecks). ``checkpoint(conn, *result)`` runs
+    inside the chunk's transaction, right before the commit.
+    """
+    row = conn.execute(
+        "SELECT MAX(rowid), COUNT(*) FROM (SELECT rowid FROM accounts WHERE rowid > ? ORDER BY rowid LIMIT ?)",
+        (after_rowid, chunk_size)
+    ).fetchone()
+    last_rowid, chunk_accounts = row[0], row[1]
+    if last_rowid is None:
+        return None, 0, 0, 0
+
+    # Ставка годовая, в процентах; капитализация ежемесячная
+    monthly_rate = rate / 100 / 12
+    prefix = f"{INTEREST_ID_PREFIX}-{month}-"
+    date = posting_date(month)
+
+    conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS capitalization_chunk (
+            account_rowid INTEGER PRIMARY KEY,
+            account_id TEXT NOT NULL,
+            interest INTEGER NOT NULL
+        )
+    """)
+    conn.execute("DELETE FROM capitalization_chunk")
+    conn.execute(
+        """
+        INSERT INTO capitalization_chunk (account_rowid, account_id, interest)
+        SELECT chunk.rowid, chunk.id, chunk.interest FROM (
+            SELECT rowid, id, CAST(ROUND(balance * ?) AS INTEGER) AS interest FROM accounts
+            WHERE rowid > ? AND rowid <= ?
+        ) AS chunk
+        WHERE chunk.interest != 0
+          AND NOT EXISTS (SELECT 1 FROM transactions WHERE transactions.id = ? || chunk.id)
+        """,
+        (monthly_rate, after_rowid, last_rowid, prefix)
+    )
+    conn.execute(
+        """
+        INSERT INTO transactions (id, account_id, amount, date, comment)
+        SELECT ? || account_id, account_id, interest, ?, ?
+        FROM capitalization_chunk
+        ORDER BY account_id
+        """,
+        (prefix, date, f"Капитализация процентов за {month}")
+    )
+    # Снимок - по месяцу даты проводки, как у любой другой транзакции
+    monthly_balances.stage_deltas_from(
+        conn, "SELECT account_id, ?, interest FROM capitalization_chunk", (date[:7],)
+    )
+    monthly_balances.apply_staged_deltas(conn)
+    conn.execute(
+        """
+        UPDATE accounts
+        SET balance = balance + chunk.interest
+        FROM capitalization_chunk AS chunk
+        WHERE accounts.rowid > ? AND accounts.rowid <= ?
+          AND accounts.rowid = chunk.account_rowid
+        """,
+        (after_rowid, last_rowid)
+    )
+    capitalized, total = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(interest), 0) FROM capitalization_chunk"
+    ).fetchone()
+    if checkpoint is not None:
+        checkpoint(conn, last_rowid, chunk_accounts, capitalized, total)
+    conn.commit()
+    return last_rowid, chunk_accounts, capitalized, total
+
+
+def start_capitalization(conn: sqlite3.Connection, month: str) -> Tuple[float, int]:
+    """Rate of the month and number of accounts to process"""
+    return month_rate(conn, month), count_accounts(conn)
+
+
+def advance(state: Dict, last_rowid: int, chunk_accounts: int, capitalized: int, interest: int) -> Dict:
+    """Progress state after one committed chunk"""
+    total_interest_minor = state["total_interest_minor"] + interest
+    return dict(
+        state,
+        last_rowid=last_rowid,
+        processed=state["processed"] + chunk_accounts,
+        capitalized=state["capitalized"] + capitalized,
+        total_interest_minor=total_interest_minor,
+        total_interest=to_major(total_interest_minor),
+    )
+
+
+async def capitalize(month: str, write=None, chunk_size: int = CHUNK_SIZE,
+                     resume_from: Optional[Dict] = None,
+                     progress: Optional[Callable[[Dict], None]] = None,
+                     checkpoint: Optional[Callable[[sqlite3.Connection, Dict], None]] = None) -> Dict:
+    """Capitalize interest for ``month`` chunk by chunk.
+
+    ``write`` awaits ``fn(conn, *args)`` on the writer connection and defaults
+    to ``db_executor.run_write``. ``resume_from`` is a state previously passed
+    to ``checkpoint``, which is called inside every chunk's transaction;
+    ``progress`` is called after every commit.
+    """
+    if write is None:
+        from db_executor import run_write as write
+
+    validate_month(month)
+    started = datetime.now()
+    rate, total_accounts = await write(start_capitalization, month)
+    state = {
+        "month": month,
+        "rate": rate,
+        "total_accounts": total_accounts,
+        "processed": 0,
+        "capitalized": 0,
+        "total_interest": 0.0,
+        "total_interest_minor": 0,
+        "last_rowid": 0,
+    }
+    if resume_from:
+        # Ставку берем из контрольной точки: продолжение идет по той же ставке
+        state.update(resume_from, total_accounts=total_accounts)
+        rate = state["rate"]
+
+    def save(conn, *chunk_result):
+        checkpoint(conn, advance(state, *chunk_result))
+
+    while True:
+        chunk_result = await write(
+            capitalize_chunk, month, rate, state["last_rowid"], chunk_size,
+            save if checkpoint is not None else None
+        )
+        if chunk_result[0] is None:
+            break
+        state = advance(state, *chunk_result)
+        if progress is not None:
+            progress(dict(state))
+    state["duration_ms"] = round((datetime.now() - started).total_seconds() * 1000, 1)
+    return state
+
+
+def combine(states: List[Dict]) -> Dict:
+    """Progress state of the whole book from the states of every shard"""
+    total_interest_minor = sum(state["total_interest_minor"] for state in states)
+    return {
+        "month": states[0]["month"],
+        "rate": states[0]["rate"],
+        "total_accounts": sum(state["total_accounts"] for state in states),
+        "processed": sum(state["processed"] for state in states),
+        "capitalized": sum(state["capitalized"] for state in states),
+        "total_interest": to_major(total_interest_minor),
+        "total_interest_minor": total_interest_minor,
+        "shards": states,
+    }
+
+
+def _commit_checkpoint(conn: sqlite3.Connection, checkpoint: Callable, state: Dict):
+    checkpoint(conn, state)
+    conn.commit()
+
+
+async def capitalize_shards(month: str, chunk_size: int = CHUNK_SIZE,
+                            resume_from: Optional[Dict] = None,
+                            progress: Optional[Callable[[Dict], None]] = None,
+                            checkpoint: Optional[Callable[[sqlite3.Connection, Dict], None]] = None) -> Dict:
+    """``capitalize`` over every shard of the database, the shards in parallel.
+
+    The state passed to ``checkpoint`` (on the writer of shard 0, after each
+    chunk's commit) and ``progress`` is ``combine`` of the shards' states.
+    """
+    from database import shard_count
+    from db_executor import run_write, run_write_all, run_write_on
+
+    shards = shard_count()
+    if shards == 1:
+        return await capitalize(month, None, chunk_size, resume_from, progress, checkpoint)
+
+    validate_month(month)
+    started = datetime.now()
+    starts = await run_write_all(start_capitalization, month)
+    # Ставки во всех шардах одинаковые
+    rate = starts[0][0]
+    states = [
+        {
+            "month": month,
+            "rate": rate,
+            "total_accounts": total_accounts,
+            "processed": 0,
+            "capitalized": 0,
+            "total_interest": 0.0,
+            "total_interest_minor": 0,
+            "last_rowid": 0,
+        }
+        for _, total_accounts in starts
+    ]
+    saved = (resume_from or {}).get("shards")
+    if saved and len(saved) == shards:
+        rate = resume_from["rate"]
+        states = [{**state, **shard_state, "total_accounts": state["total_accounts"]}
+                  for state, shard_state in zip(states, saved)]
+    elif resume_from:
+        # Число шардов изменилось: проход начинается заново, уже начисленное пропускается
+        rate = resume_from["rate"]
+        for state in states:
+            state["rate"] = rate
+
+    async def run(shard: int):
+        while True:
+            chunk_result = await run_write_on(
+                shard, capitalize_chunk, month, rate, states[shard]["last_rowid"], chunk_size
+            )
+            if chunk_result[0] is None:
+                break
+            states[shard] = advance(states[shard], *chunk_result)
+            state = combine(states)
+            if checkpoint is not None:
+                await run_write(_commit_checkpoint, checkpoint, state)
+            if progress is not None:
+                progress(dict(state))
+
+    tasks = [asyncio.ensure_future(run(shard)) for shard in range(shards)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # Отмена или ошибка в одном шарде останавливает остальные
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    state = combine(states)
+    state["duration_ms"] = round((datetime.now() - started).total_seconds() * 1000, 1)
+    return state
+
+
+async def run_job(job) -> Dict:
+    """Background job handler (see jobs.JobRunner) for ``{"month": "YYYY-MM"}``"""
+
+    def checkpoint(conn, state):
+        job.save(conn, state, state["processed"], state["total_accounts"], "accounts")
+
+    def progress(state):
+        logger.info(
+            f"Capitalization {state['month']}: {state['processed']}/{state['total_accounts']} accounts"
+        )
+        job.raise_if_cancelled()
+
+    return await capitalize_shards(
+        job.params["month"], resume_from=job.checkpoint, progress=progress, checkpoint=checkpoint
+    )
@@ -0,0 +1,80 @@
+"""Set-based assembly of the GET /api/accounts dashboard.
+
+The dashboard is a summary built from a constant number of queries
+regardless of the number of accounts: accounts, the monthly snapshots of the
+displayed months and their rates. Transactions are not inlined; clients page
+through GET /api/accounts/{id}/transactions. With several shards every
+shard builds its part in parallel and the parts are concatenated.
+"""
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import cache
+import repository
+from money import account_to_api, to_major
+
+# Количество месяцев на дашборде
+DASHBOARD_MONTHS = 3
+
+MONTHLY_TOTALS_SQL = """
+    SELECT account_id, month, net_change AS total
+    FROM monthly_balances
+    WHERE month IN ({placeholders})
+"""
+
+def dashboard_months(now: datetime) -> List[str]:
+    """Month keys shown on the dashboard, newest first"""
+    return [
+        (now - timedelta(days=30 * i)).strftime("%Y-%m")
+        for i in range(DASHBOARD_MONTHS)
+    ]
+
+
+def build_accounts_dashboard(conn: sqlite3.Connection, now: Optional[datetime] = None,
+                             rates: Optional[Dict[str, float]] = None) -> List[Dict]:
+    """Accounts with their monthly sums; ``rates`` are read when not given"""
+    now = now or datetime.now()
+    months = dashboard_months(now)
+    placeholders = ", ".join("?" for _ in months)
+
+    accounts = [account_to_api(row) for row in conn.execute("SELECT * FROM accounts")]
+
+    # Процентные ставки за отображаемые месяцы
+    if rates is None:
+        rates = repository.get_interest_rates(conn, months)
+
+    # Движение по счетам за месяц берется из помесячных остатков
+    totals = {}
+    cursor = conn.execute(MONTHLY_TOTALS_SQL.format(placeholders=placeholders), months)
+    for row in cursor:
+        totals[(row["account_id"], row["month"])] = row["total"]
+
+    for account in accounts:
+        account_id = account["id"]
+        account["monthly_balances"] = {
+            month: {
+                "balance": to_major(totals.get((account_id, month)) or 0),
+                "interest_rate": rates[month],
+            }
+            for month in months
+        }
+
+    return accounts
+
+
+async def dashboard_if_changed(if_none_match: Optional[str],
+                               now: Optional[datetime] = None) -> Tuple[str, Optional[List[Dict]]]:
+    """ETag of the dashboard and the dashboard, or None when the client's copy is current"""
+    from db_executor import offload, run_read, run_read_all
+
+    now = now or datetime.now()
+    months = dashboard_months(now)
+    # Набор месяцев тоже входит в ETag: он меняется со сменой даты
+    tag = await offload(cache.etag, ".".join(months))
+    if cache.etag_matches(if_none_match, tag):
+        return tag, None
+    # Ставки одинаковы во всех шардах
+    rates = await run_read(cache.get_interest_rates, months)
+    parts = await run_read_all(build_accounts_dashboard, now, rates)
+    return tag, [account for part in parts for account in part]
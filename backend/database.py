@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import metrics
+import migrations
+from db_pool import ConnectionPool
+from shards import ShardMap
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Database configuration
+DATABASE_URL = os.environ.get("DATABASE_URL", "banking.db")
+DB_POOL_READERS = int(os.environ.get("DB_POOL_READERS", "4"))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_BUSY_RETRIES = int(os.environ.get("DB_BUSY_RETRIES", "5"))
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+# Число файлов-шардов для новой базы; у существующей его задает карта шардов (см. shards.py)
+DB_SHARDS = int(os.environ.get("DB_SHARDS", "1"))
+# Сокет процесса-писателя (см. writer_service.py); пусто - каждый воркер пишет сам
+DB_WRITER_SOCKET = os.environ.get("DB_WRITER_SOCKET", "")
+
+# Денежные колонки (accounts.balance, transactions.amount, monthly_balances)
+# хранят целые копейки, см. money.py
+
+# Публичные колонки транзакции (без вычисляемой колонки month)
+TRANSACTION_COLUMNS = "id, account_id, amount, date, comment"
+TRANSACTION_FIELDS = [column.strip() for column in TRANSACTION_COLUMNS.split(",")]
+
+# Страница выписки счета, новые сначала; {filters} - дополнительные условия
+ACCOUNT_TRANSACTIONS_SQL = f"""
+    SELECT {TRANSACTION_COLUMNS} FROM transactions
+    WHERE account_id = ?{{filters}}
+    ORDER BY date DESC, id DESC
+    LIMIT ?
+"""
+
+
+# Database initialization
+def init_db(database_url: str = DATABASE_URL) -> List[int]:
+    """Create or upgrade the schema of one database file (see migrations.py); returns the versions applied"""
+    with sqlite3.connect(database_url) as conn:
+        applied = migrations.migrate(conn)
+    conn.close()
+    return applied
+
+
+def schema_current(database_url: str) -> bool:
+    """True when the file exists and has every migration; reads one row"""
+    if not os.path.exists(database_url):
+        return False
+    with sqlite3.connect(database_url) as conn:
+        version = migrations.current_version(conn)
+    conn.close()
+    return version >= migrations.SCHEMA_VERSION
+
+
+@contextmanager
+def migration_lock(database_url: str):
+    """Exclusive lock on ``<database_url>.lock`` for the duration of a schema change.
+
+    Workers starting together create and migrate the schema one at a time:
+    the first one does the work, the others find the schema current.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(database_url + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def init_shards(database_url: Optional[str] = None, count: Optional[int] = None) -> ShardMap:
+    """Create or upgrade every shard of the database and store its shard map.
+
+    A new database gets ``count`` (DB_SHARDS) shards. An existing one keeps
+    its map; a single-file database that already holds accounts is not split
+    implicitly, that is done by ``python -m rebalance --shards N``.
+    """
+    database_url = database_url or DATABASE_URL
+    shard_map = ShardMap.load(database_url, count or DB_SHARDS)
+    # Схема всех шардов актуальна: ни блокировки, ни записи
+    if (shard_map.saved or len(shard_map) == 1) and all(schema_current(path) for path in shard_map.paths):
+        return shard_map
+    with migration_lock(database_url):
+        return _init_shards(database_url, count or DB_SHARDS)
+
+
+def _init_shards(database_url: str, count: int) -> ShardMap:
+    shard_map = ShardMap.load(database_url, count)
+    init_db(shard_map.paths[0])
+    if not shard_map.saved and len(shard_map) > 1:
+        with sqlite3.connect(shard_map.paths[0]) as conn:
+            if conn.execute("SELECT 1 FROM accounts LIMIT 1").fetchone() is not None:
+                raise RuntimeError(
+                    f"{database_url} already holds accounts; split it with python -m rebalance --shards {len(shard_map)}"
+                )
+        shard_map.save(database_url)
+    for path in shard_map.paths[1:]:
+        init_db(path)
+    return shard_map
+
+
+_pools: Dict[int, ConnectionPool] = {}
+_shard_map: Optional[ShardMap] = None
+_pool_lock = threading.Lock()
+
+
+def get_shard_map() -> ShardMap:
+    """Shard map of DATABASE_URL, read on first use"""
+    global _shard_map
+    if _shard_map is None:
+        with _pool_lock:
+            if _shard_map is None:
+                _shard_map = ShardMap.load(DATABASE_URL, DB_SHARDS)
+    return _shard_map
+
+
+def shard_count() -> int:
+    return len(get_shard_map())
+
+
+def shard_for(account_id: str) -> int:
+    """Shard holding an account, its transactions and monthly snapshots"""
+    return get_shard_map().shard_of(account_id)
+
+
+def get_pool(shard: int = 0) -> ConnectionPool:
+    """Process-wide connection pool of a shard, opened on first use"""
+    pool = _pools.get(shard)
+    if pool is None:
+        path = get_shard_map().paths[shard]
+        with _pool_lock:
+            pool = _pools.get(shard)
+            if pool is None:
+                pool = _pools[shard] = ConnectionPool(
+                    path,
+                    readers=DB_POOL_READERS,
+                    busy_timeout_ms=DB_BUSY_TIMEOUT_MS,
+                    busy_retries=DB_BUSY_RETRIES,
+                    synchronous=DB_SYNCHRONOUS,
+                    connection_factory=metrics.connection_factory(),
+                )
+    return pool
+
+
+def get_pools() -> List[ConnectionPool]:
+    """Pools of all shards, in shard order"""
+    return [get_pool(shard) for shard in range(shard_count())]
+
+
+def close_pool():
+    """Close the pools of all shards; the shard map is read again on next use"""
+    global _shard_map
+    with _pool_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+        _shard_map = None
+
+
+@contextmanager
+def get_db(write: bool = False, shard: int = 0):
+    """Pooled connection to a shard: the shared writer for writes, a reader otherwise"""
+    pool = get_pool(shard)
+    with (pool.writer() if write else pool.reader()) as conn:
+        yield conn
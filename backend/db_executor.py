@@ -0,0 +1,158 @@
+"""Awaitable access to the database from async handlers.
+
+Blocking sqlite3 calls run on dedicated thread pools: reader threads matching
+the reader connections of all shards and one writer thread per shard, since
+each shard's pool has exactly one writer connection. ``run_read`` and
+``run_write`` use shard 0, which also holds jobs; the ``_for`` variants route
+by account and the ``_all`` variants fan out to every shard in parallel.
+With DB_WRITER_SOCKET set, writes go to the writer process (writer_service.py).
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, TypeVar
+
+import metrics
+from database import DB_POOL_READERS, DB_WRITER_SOCKET, get_db, get_pool, shard_count, shard_for
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+_read_executor: Optional[ThreadPoolExecutor] = None
+_write_executors: List[ThreadPoolExecutor] = []
+
+
+def _executors():
+    """Read executor and per-shard write executors, created for the current shard count"""
+    global _read_executor, _write_executors
+    if _read_executor is None:
+        with _lock:
+            if _read_executor is None:
+                shards = shard_count()
+                _write_executors = [
+                    ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"db-write-{shard}")
+                    for shard in range(shards)
+                ]
+                _read_executor = ThreadPoolExecutor(max_workers=DB_POOL_READERS * shards,
+                                                    thread_name_prefix="db-read")
+    return _read_executor, _write_executors
+
+
+def _call(fn: Callable[..., T], write: bool, shard: int, args, kwargs) -> T:
+    if write:
+        if DB_WRITER_SOCKET:
+            from writer_service import WriterUnavailable, client
+
+            writer = client(DB_WRITER_SOCKET)
+            request = writer.encode(shard, fn, args, kwargs)
+            if request is not None:
+                try:
+                    return writer.send(request)
+                except WriterUnavailable:
+                    pass
+        # Запись повторяется целиком, если база занята другим процессом
+        return get_pool(shard).run_write(fn, *args, **kwargs)
+    with get_db(shard=shard) as conn:
+        return fn(conn, *args, **kwargs)
+
+
+async def _submit(fn, write: bool, shard: int, args, kwargs):
+    read_executor, write_executors = _executors()
+    executor = write_executors[shard] if write else read_executor
+    loop = asyncio.get_running_loop()
+    # Контекст запроса (contextvars) переносится в поток БД
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, metrics.call_in_thread, _call, time.perf_counter(), False,
+                             fn, write, shard, args, kwargs)
+    return await loop.run_in_executor(executor, call)
+
+
+async def run_read(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Run ``fn(conn, *args, **kwargs)`` on a reader connection of shard 0 off the event loop"""
+    return await _submit(fn, False, 0, args, kwargs)
+
+
+async def run_write(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Run ``fn(conn, *args, **kwargs)`` on the writer connection of shard 0 off the event loop.
+
+    ``fn`` runs in a BEGIN IMMEDIATE transaction and is retried on SQLITE_BUSY.
+    """
+    return await _submit(fn, True, 0, args, kwargs)
+
+
+async def run_read_on(shard: int, fn: Callable[..., T], *args, **kwargs) -> T:
+    return await _submit(fn, False, shard, args, kwargs)
+
+
+async def run_write_on(shard: int, fn: Callable[..., T], *args, **kwargs) -> T:
+    return await _submit(fn, True, shard, args, kwargs)
+
+
+async def run_read_for(account_id: str, fn: Callable[..., T], *args, **kwargs) -> T:
+    """``run_read`` on the shard of ``account_id``; the id is not passed to ``fn``"""
+    return await _submit(fn, False, shard_for(account_id), args, kwargs)
+
+
+async def run_write_for(account_id: str, fn: Callable[..., T], *args, **kwargs) -> T:
+    """``run_write`` on the shard of ``account_id``; the id is not passed to ``fn``"""
+    return await _submit(fn, True, shard_for(account_id), args, kwargs)
+
+
+async def run_read_all(fn: Callable[..., T], *args, **kwargs) -> List[T]:
+    """Run ``fn`` on every shard in parallel; results in shard order"""
+    return list(await asyncio.gather(*(
+        _submit(fn, False, shard, args, kwargs) for shard in range(shard_count())
+    )))
+
+
+async def run_write_all(fn: Callable[..., T], *args, **kwargs) -> List[T]:
+    """Run ``fn`` on the writer of every shard in parallel; each shard commits on its own"""
+    return list(await asyncio.gather(*(
+        _submit(fn, True, shard, args, kwargs) for shard in range(shard_count())
+    )))
+
+
+async def run_read_scattered(fn: Callable[..., List], items: Sequence, account_of: Callable) -> List:
+    """Run ``fn(conn, items)`` on the shards of the items' accounts, each shard
+    with its own items, and return the results in the order of ``items``.
+
+    ``fn`` must return one result per item, in the order given.
+    """
+    if shard_count() == 1:
+        return await run_read(fn, list(items))
+    positions = {}
+    for position, item in enumerate(items):
+        positions.setdefault(shard_for(account_of(item)), []).append(position)
+    parts = await asyncio.gather(*(
+        _submit(fn, False, shard, ([items[p] for p in shard_positions],), {})
+        for shard, shard_positions in positions.items()
+    ))
+    results = [None] * len(items)
+    for shard_positions, part in zip(positions.values(), parts):
+        for position, result in zip(shard_positions, part):
+            results[position] = result
+    return results
+
+
+async def offload(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Run CPU-bound work (e.g. encoding a large response) on a reader thread"""
+    read_executor, _ = _executors()
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, metrics.call_in_thread, fn, time.perf_counter(), True, *args, **kwargs)
+    return await loop.run_in_executor(read_executor, call)
+
+
+def shutdown():
+    """Stop the executors; they are created again, for the current shard count, on next use"""
+    global _read_executor, _write_executors
+    with _lock:
+        if _read_executor is not None:
+            _read_executor.shutdown(wait=True)
+        for executor in _write_executors:
+            executor.shutdown(wait=True)
+        _read_executor = None
+        _write_executors = []
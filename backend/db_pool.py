@@ -0,0 +1,227 @@
+"""Long-lived SQLite connections shared between requests.
+
+One writer connection serializes all writes in the process; a bounded set of
+reader connections serves queries concurrently thanks to WAL mode.
+
+Write transactions on the writer start with BEGIN IMMEDIATE, so the database
+write lock is taken before anything is read and two processes can never both
+read a balance and then both write it. A unit of work that still hits
+SQLITE_BUSY (another process held the lock longer than the busy timeout) is
+rolled back and retried by ``run_write``.
+"""
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+# Коды ошибок SQLite: база или таблица заблокирована другим соединением
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the checkout timeout"""
+
+
+def is_busy(error: sqlite3.Error) -> bool:
+    """True for SQLITE_BUSY / SQLITE_LOCKED, which are worth retrying"""
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (SQLITE_BUSY, SQLITE_LOCKED)
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+class ConnectionPool:
+    def __init__(self, database_url: str, readers: int = 4, busy_timeout_ms: int = 5000,
+                 cached_statements: int = 256, checkout_timeout: float = 30.0,
+                 busy_retries: int = 5, retry_backoff: float = 0.05, synchronous: str = "NORMAL",
+                 connection_factory: type = sqlite3.Connection):
+        if synchronous.upper() not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError(f"Invalid synchronous mode: {synchronous!r}")
+        self.database_url = database_url
+        self.synchronous = synchronous.upper()
+        self.max_readers = readers
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self.checkout_timeout = checkout_timeout
+        self.busy_retries = busy_retries
+        self.retry_backoff = retry_backoff
+        self.connection_factory = connection_factory
+
+        self._lock = threading.Lock()
+        self._readers = queue.LifoQueue()
+        self._opened_readers = 0
+        self._writer = self._connect()
+        # Неявная транзакция перед первым INSERT/UPDATE открывается как BEGIN IMMEDIATE
+        self._writer.isolation_level = "IMMEDIATE"
+        self._writer_lock = threading.Lock()
+        self._version_conn = None
+        self._version_lock = threading.Lock()
+        self._closed = False
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._in_use = 0
+        self._busy_retries = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.database_url,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=self.connection_factory,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL в WAL не делает fsync на каждый коммит; FULL - делает
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+
+    def _record_checkout(self, waited: float):
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._wait_time += waited
+            if waited > 0.001:
+                self._waits += 1
+
+    def _record_checkin(self):
+        with self._lock:
+            self._in_use -= 1
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        # Открываем новое соединение, пока не достигнут лимит пула
+        with self._lock:
+            if self._opened_readers < self.max_readers:
+                self._opened_readers += 1
+                open_new = True
+            else:
+                open_new = False
+        if open_new:
+            try:
+                return self._connect()
+            except sqlite3.Error:
+                with self._lock:
+                    self._opened_readers -= 1
+                raise
+        try:
+            return self._readers.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            raise PoolTimeout("Timed out waiting for a reader connection")
+
+    @contextmanager
+    def reader(self):
+        """Check out a read-only connection"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        started = time.perf_counter()
+        conn = self._acquire_reader()
+        self._record_checkout(time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._record_checkin()
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        """Check out the single writer connection"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        started = time.perf_counter()
+        if not self._writer_lock.acquire(timeout=self.checkout_timeout):
+            raise PoolTimeout("Timed out waiting for the writer connection")
+        self._record_checkout(time.perf_counter() - started)
+        try:
+            yield self._writer
+        finally:
+            # Незафиксированная транзакция (например, после исключения) откатывается
+            if self._writer.in_transaction:
+                self._writer.rollback()
+            self._record_checkin()
+            self._writer_lock.release()
+
+    def run_write(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run ``fn(conn, *args, **kwargs)`` on the writer, retrying it on SQLITE_BUSY.
+
+        ``fn`` must be safe to repeat after a rollback: it is called again from
+        the start with exponential backoff and jitter between attempts.
+        """
+        for attempt in range(self.busy_retries + 1):
+            try:
+                with self.writer() as conn:
+                    return fn(conn, *args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not is_busy(e) or attempt == self.busy_retries:
+                    raise
+            with self._lock:
+                self._busy_retries += 1
+            time.sleep(self.retry_backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def open_connection(self) -> sqlite3.Connection:
+        """A read-only connection outside the pool for long-running reads such as exports.
+
+        It does not count against the reader limit; the caller closes it.
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        conn = self._connect()
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def data_version(self) -> int:
+        """Commit counter of the database as seen from a dedicated idle connection.
+
+        It changes whenever any connection, in this process or another,
+        commits a write; values are only comparable between calls on the same
+        pool.
+        """
+        with self._version_lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            if self._version_conn is None:
+                self._version_conn = self.open_connection()
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "size": self._opened_readers + 1,
+                "readers_open": self._opened_readers,
+                "readers_max": self.max_readers,
+                "in_use": self._in_use,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_total_ms": round(self._wait_time * 1000, 3),
+                "wait_time_avg_ms": round(self._wait_time * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                "busy_retries": self._busy_retries,
+            }
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._writer_lock:
+            self._writer.close()
+        with self._version_lock:
+            if self._version_conn is not None:
+                self._version_conn.close()
+                self._version_conn = None
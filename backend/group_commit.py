@@ -0,0 +1,165 @@
+"""Group commit for single postings.
+
+With group commit enabled, POST /api/transactions does not commit on its own:
+the posting is queued and a single writer task drains the queue, applying up
+to ``max_batch`` postings in one BEGIN IMMEDIATE transaction. After taking
+the first posting the writer lingers at most ``max_delay_ms`` for more. Every
+posting runs under its own savepoint, so one failing posting does not fail its
+neighbours, and every caller is answered only after its batch has committed.
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import repository
+from db_pool import is_busy
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних замеров хранится для перцентилей
+SAMPLE_SIZE = 10000
+
+Posting = Tuple[str, int, str, Optional[str]]
+
+
+def post_batch(conn: sqlite3.Connection, postings: List[Posting]) -> List[Tuple[bool, object]]:
+    """Apply postings in one transaction; returns (ok, new balance or error) per posting"""
+    conn.execute("BEGIN IMMEDIATE")
+    results = []
+    for account_id, amount, date, comment in postings:
+        conn.execute("SAVEPOINT posting")
+        try:
+            results.append((True, repository.apply_posting(conn, account_id, amount, date, comment)))
+        except Exception as e:
+            # Занятая база - ошибка всей пачки, ее повторит run_write; любая другая - только этой проводки
+            if isinstance(e, sqlite3.Error) and is_busy(e):
+                raise
+            conn.execute("ROLLBACK TO posting")
+            results.append((False, e))
+        conn.execute("RELEASE posting")
+    conn.commit()
+    return results
+
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class GroupCommitWriter:
+    def __init__(self, max_batch: int = 256, max_delay_ms: float = 2.0, write=None):
+        if write is None:
+            from db_executor import run_write as write
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._write = write
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self._batches = 0
+        self._postings = 0
+        self._failed_batches = 0
+        self._max_batch_seen = 0
+        self._batch_sizes = deque(maxlen=SAMPLE_SIZE)
+        self._queue_waits = deque(maxlen=SAMPLE_SIZE)
+        self._commit_times = deque(maxlen=SAMPLE_SIZE)
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Commit everything already queued, then stop the writer task"""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, account_id: str, amount: int, date: str, comment: Optional[str]) -> Optional[int]:
+        """Queue a posting and wait until its batch is committed.
+
+        Returns the new balance in kopecks, or None if the account is missing.
+        """
+        if self._task is None:
+            raise RuntimeError("Group commit writer is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((time.perf_counter(), (account_id, amount, date, comment), future))
+        return await future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.perf_counter() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._commit(batch)
+
+    async def _commit(self, batch):
+        started = time.perf_counter()
+        for enqueued, _, _ in batch:
+            self._queue_waits.append(started - enqueued)
+        try:
+            results = await self._write(post_batch, [posting for _, posting, _ in batch])
+        except Exception as e:
+            # Пачка не зафиксирована: ошибку получает каждый ее участник
+            logger.error(f"Group commit of {len(batch)} postings failed: {str(e)}")
+            self._failed_batches += 1
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._batches += 1
+        self._postings += len(batch)
+        self._max_batch_seen = max(self._max_batch_seen, len(batch))
+        self._batch_sizes.append(len(batch))
+        self._commit_times.append(time.perf_counter() - started)
+        for (_, _, future), (ok, value) in zip(batch, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def stats(self) -> Dict:
+        sizes = list(self._batch_sizes)
+        waits = list(self._queue_waits)
+        commits = list(self._commit_times)
+        return {
+            "max_batch": self.max_batch,
+            "max_delay_ms": self.max_delay * 1000,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self._batches,
+            "postings": self._postings,
+            "failed_batches": self._failed_batches,
+            "batch_size_avg": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            "batch_size_max": self._max_batch_seen,
+            "queue_wait_p50_ms": round(_percentile(waits, 0.5) * 1000, 3),
+            "queue_wait_p99_ms": round(_percentile(waits, 0.99) * 1000, 3),
+            "commit_p50_ms": round(_percentile(commits, 0.5) * 1000, 3),
+            "commit_p99_ms": round(_percentile(commits, 0.99) * 1000, 3),
+        }
@@ -0,0 +1,130 @@
+"""Month-end balance history of accounts, page by page.
+
+The month-end balance of month M is the current balance minus everything
+posted in later months. The monthly snapshots already hold each month's net
+change, so one query computes the history of a whole page of accounts: a grid
+of (account, month) rows is merged with the snapshots and a running SUM of net
+changes over each account, newest month first, gives the amount to subtract.
+The cost depends on the page size and the number of snapshot months, not on
+the number of transactions. With several shards every shard returns its own
+page after the cursor and ``merge_pages`` keeps the first ``limit`` by id.
+"""
+import heapq
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from capitalization import INTEREST_ID_PREFIX
+from money import to_major
+
+DEFAULT_MONTHS = 3
+MAX_MONTHS = 1200
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# {months} - VALUES с месяцами истории, от старых к новым.
+# Строка сетки (shown = 1) идет раньше снимка того же месяца, поэтому
+# нарастающая сумма на ней - движение только за более поздние месяцы
+HISTORY_SQL = """
+    WITH page AS (
+        SELECT id, name, balance FROM accounts
+        WHERE id > :after
+        ORDER BY id
+        LIMIT :limit
+    ),
+    months(month) AS (VALUES {months}),
+    moves AS (
+        SELECT m.account_id, m.month, m.net_change AS net, 0 AS shown, NULL AS name, NULL AS balance
+        FROM page JOIN monthly_balances m ON m.account_id = page.id
+        WHERE m.month >= :first_month
+        UNION ALL
+        SELECT page.id, months.month, 0, 1, page.name, page.balance
+        FROM page CROSS JOIN months
+    ),
+    later AS (
+        SELECT account_id, month, shown, name, balance,
+               SUM(net) OVER (PARTITION BY account_id ORDER BY month DESC, shown DESC) AS later_net
+        FROM moves
+    )
+    SELECT account_id AS id, name, balance, month, balance - later_net AS closing,
+           (SELECT rate FROM interest_rates WHERE month = :current_month) AS rate,
+           CASE WHEN month = :current_month
+                THEN EXISTS (SELECT 1 FROM transactions WHERE id = :interest_prefix || later.account_id)
+           END AS capitalized
+    FROM later
+    WHERE shown = 1
+    ORDER BY account_id, month
+"""
+
+
+def history_months(now: datetime, months: int) -> List[str]:
+    """The ``months`` calendar months before the current one, oldest first"""
+    index = now.year * 12 + now.month - 1
+    return [f"{(index - i) // 12}-{(index - i) % 12 + 1:02d}" for i in range(months, 0, -1)]
+
+
+def history_query(grid: List[str], after: str, limit: int) -> Tuple[str, Dict]:
+    """HISTORY_SQL and its parameters for the months ``grid``, the last one being the current month"""
+    # Запрос с именованными параметрами, поэтому месяцы - :m0, :m1, ...
+    query = HISTORY_SQL.format(months=", ".join(f"(:m{i})" for i in range(len(grid))))
+    params = {f"m{i}": month for i, month in enumerate(grid)}
+    params.update(
+        after=after,
+        limit=limit,
+        first_month=grid[0],
+        current_month=grid[-1],
+        interest_prefix=f"{INTEREST_ID_PREFIX}-{grid[-1]}-",
+    )
+    return query, params
+
+
+def accounts_history(conn: sqlite3.Connection, months: int = DEFAULT_MONTHS, limit: int = DEFAULT_PAGE_SIZE,
+                     cursor: Optional[str] = None,
+                     now: Optional[datetime] = None) -> Tuple[List[Dict], Optional[str]]:
+    """One page of accounts (ordered by id) with month-end balances of the last ``months``
+    months and the current month with its interest, and the cursor of the next page.
+
+    ``balance_with_interest`` adds what capitalization would post for the
+    current month, ROUND(balance * rate / 100 / 12), unless it already has.
+    """
+    if not 1 <= months <= MAX_MONTHS:
+        raise ValueError(f"months must be between 1 and {MAX_MONTHS}")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    now = now or datetime.now()
+    current_month = now.strftime("%Y-%m")
+    grid = history_months(now, months) + [current_month]
+
+    # Лишний счет показывает, есть ли следующая страница
+    query, params = history_query(grid, cursor or "", limit + 1)
+
+    accounts = []
+    for row in conn.execute(query, params):
+        if not accounts or accounts[-1]["id"] != row["id"]:
+            accounts.append({"id": row["id"], "name": row["name"], "history": {}, "current_month": None})
+        account = accounts[-1]
+        if row["month"] != current_month:
+            account["history"][row["month"]] = to_major(row["closing"])
+            continue
+        interest = 0
+        if row["rate"] and not row["capitalized"]:
+            # Как в капитализации: ROUND в SQLite округляет половину от нуля
+            raw = row["closing"] * (row["rate"] / 100 / 12)
+            interest = int(raw + (0.5 if raw >= 0 else -0.5))
+        account["current_month"] = {
+            "balance": to_major(row["closing"]),
+            "balance_with_interest": to_major(row["closing"] + interest),
+        }
+
+    next_cursor = accounts[limit - 1]["id"] if len(accounts) > limit else None
+    return accounts[:limit], next_cursor
+
+
+def merge_pages(pages: List[Tuple[List[Dict], Optional[str]]], limit: int) -> Tuple[List[Dict], Optional[str]]:
+    """One page from the pages of every shard for the same cursor and limit"""
+    if len(pages) == 1:
+        return pages[0]
+    accounts = list(heapq.merge(*(page for page, _ in pages), key=lambda account: account["id"]))
+    more = len(accounts) > limit or any(next_cursor is not None for _, next_cursor in pages)
+    next_cursor = accounts[limit - 1]["id"] if more else None
+    return accounts[:limit], next_cursor
@@ -0,0 +1,424 @@
+"""In-process background jobs persisted in the ``jobs`` table.
+
+A job is a coroutine registered under a ``kind``. The runner executes at most
+``workers`` jobs at a time on the event loop. Each job stores a checkpoint in
+the same transaction as the chunk of work it describes, so cancelled, failed
+or interrupted jobs (e.g. by a restart) continue from their last committed
+chunk.
+
+With several worker processes every job has an owner, the runner executing
+it: ``host:pid:nonce`` with a nonce drawn at every start. A process resumes
+only jobs that are unowned or whose owner has exited, at start and then every
+``reclaim_interval`` seconds, so an interrupted job is picked up by exactly
+one surviving worker. A runner holds an flock on a file named after its owner
+id while it runs; the kernel releases it when the process dies, so a
+restarted container that reuses pid 1 or a recycled pid never passes for the
+previous owner.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import tempfile
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Файлы блокировок владельцев задач, общие для всех процессов машины
+OWNER_LOCK_DIR = os.environ.get("JOB_OWNER_LOCK_DIR", os.path.join(tempfile.gettempdir(), "banking-job-owners"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (COMPLETED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation was requested"""
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="milliseconds")
+
+
+def _job_from_row(row) -> Dict:
+    job = dict(row)
+    for field in ("params", "checkpoint", "result"):
+        job[field] = json.loads(job[field]) if job[field] else None
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    return job
+
+
+def process_owner() -> str:
+    """A new owner id for jobs run by this process"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+
+
+def _owner_lock_path(owner: str) -> str:
+    return os.path.join(OWNER_LOCK_DIR, owner.replace(":", "-") + ".lock")
+
+
+def hold_owner_lock(owner: str):
+    """Lock the file of ``owner`` for the life of the process; None without fcntl"""
+    if fcntl is None:
+        return None
+    os.makedirs(OWNER_LOCK_DIR, mode=0o700, exist_ok=True)
+    lock_file = open(_owner_lock_path(owner), "a")
+    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    return lock_file
+
+
+def release_owner_lock(owner: str, lock_file):
+    if lock_file is None:
+        return
+    try:
+        os.remove(_owner_lock_path(owner))
+    except OSError:
+        pass
+    lock_file.close()
+
+
+def owner_alive(owner: str) -> bool:
+    """False when ``owner`` is a runner of this host that no longer runs"""
+    host, _, rest = owner.partition(":")
+    pid, _, nonce = rest.partition(":")
+    # Процессы другой машины проверить нельзя - считаем живыми
+    if host != socket.gethostname():
+        return True
+    if nonce and fcntl is not None:
+        path = _owner_lock_path(owner)
+        try:
+            lock_file = open(path, "r")
+        except FileNotFoundError:
+            return False
+        with lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            # Блокировку никто не держит: владелец завершился, файл больше не нужен
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return False
+    # Владелец без nonce (до его появления) или без fcntl: проверяется только pid
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError, OverflowError):
+        return True
+    return True
+
+
+def insert_job(conn: sqlite3.Connection, kind: str, params: Dict, owner: Optional[str] = None) -> Dict:
+    job_id = str(uuid.uuid4())
+    now = _now()
+    conn.execute(
+        """
+        INSERT INTO jobs (id, kind, status, params, owner, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (job_id, kind, QUEUED, json.dumps(params, ensure_ascii=False), owner, now, now)
+    )
+    conn.commit()
+    return get_job(conn, job_id)
+
+
+def get_job(conn: sqlite3.Connection, job_id: str) -> Optional[Dict]:
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _job_from_row(row) if row else None
+
+
+def list_jobs(conn: sqlite3.Connection, limit: int = 50) -> List[Dict]:
+    cursor = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+    return [_job_from_row(row) for row in cursor]
+
+
+def unfinished_jobs(conn: sqlite3.Connection) -> List[Dict]:
+    cursor = conn.execute(
+        "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+        (QUEUED, RUNNING)
+    )
+    return [_job_from_row(row) for row in cursor]
+
+
+def claim_jobs(conn: sqlite3.Connection, owner: str,
+               alive: Callable[[str], bool] = owner_alive) -> List[Dict]:
+    """Take over queued and running jobs that have no live owner; returns the claimed jobs"""
+    claimed = []
+    for job in unfinished_jobs(conn):
+        if job["owner"] is not None and (job["owner"] == owner or alive(job["owner"])):
+            continue
+        # Сравнение с прежним владельцем: из двух процессов задачу получит один
+        cursor = conn.execute(
+            "UPDATE jobs SET owner = ?, updated_at = ? WHERE id = ? AND owner IS ?",
+            (owner, _now(), job["id"], job["owner"])
+        )
+        if cursor.rowcount:
+            claimed.append(dict(job, owner=owner))
+    conn.commit()
+    return claimed
+
+
+def mark_running(conn: sqlite3.Connection, job_id: str):
+    now = _now()
+    conn.execute(
+        """
+        UPDATE jobs
+        SET status = ?, started_at = COALESCE(started_at, ?), run_started_at = ?,
+            run_processed_start = processed, error = NULL, updated_at = ?
+        WHERE id = ?
+        """,
+        (RUNNING, now, now, now, job_id)
+    )
+    conn.commit()
+
+
+def save_checkpoint(conn: sqlite3.Connection, job_id: str, checkpoint: Dict, processed: int,
+                    total: Optional[int] = None, unit: Optional[str] = None):
+    """Store job progress; does not commit, so it joins the caller's transaction"""
+    conn.execute(
+        """
+        UPDATE jobs
+        SET checkpoint = ?, processed = ?, total = COALESCE(?, total), unit = COALESCE(?, unit),
+            updated_at = ?
+        WHERE id = ?
+        """,
+        (json.dumps(checkpoint, ensure_ascii=False), processed, total, unit, _now(), job_id)
+    )
+
+
+def finish_job(conn: sqlite3.Connection, job_id: str, status: str,
+               result: Optional[Dict] = None, error: Optional[str] = None):
+    now = _now()
+    conn.execute(
+        """
+        UPDATE jobs
+        SET status = ?, result = ?, error = ?, cancel_requested = 0, updated_at = ?,
+            finished_at = ?
+        WHERE id = ?
+        """,
+        (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+         error, now, now, job_id)
+    )
+    conn.commit()
+
+
+def request_cancel(conn: sqlite3.Connection, job_id: str) -> Optional[Dict]:
+    conn.execute(
+        "UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ? AND status IN (?, ?)",
+        (_now(), job_id, QUEUED, RUNNING)
+    )
+    conn.commit()
+    return get_job(conn, job_id)
+
+
+def requeue_job(conn: sqlite3.Connection, job_id: str, owner: Optional[str] = None) -> Optional[Dict]:
+    conn.execute(
+        """
+        UPDATE jobs SET status = ?, owner = ?, cancel_requested = 0, finished_at = NULL, updated_at = ?
+        WHERE id = ? AND status IN (?, ?)
+        """,
+        (QUEUED, owner, _now(), job_id, FAILED, CANCELLED)
+    )
+    conn.commit()
+    return get_job(conn, job_id)
+
+
+def job_report(job: Dict) -> Dict:
+    """Public view of a job with throughput and ETA of the current run"""
+    report = {
+        key: job[key]
+        for key in ("id", "kind", "status", "params", "processed", "total", "unit", "result",
+                    "error", "created_at", "started_at", "updated_at", "finished_at")
+    }
+    report["cancel_requested"] = job["cancel_requested"]
+    report["progress"] = round(job["processed"] / job["total"], 4) if job["total"] else None
+    throughput = None
+    eta = None
+    if job["status"] == RUNNING and job["run_started_at"]:
+        elapsed = (datetime.now() - datetime.fromisoformat(job["run_started_at"])).total_seconds()
+        done = job["processed"] - job["run_processed_start"]
+        if elapsed > 0 and done > 0:
+            throughput = done / elapsed
+            if job["total"]:
+                eta = max(job["total"] - job["processed"], 0) / throughput
+    report["throughput_per_second"] = round(throughput, 1) if throughput is not None else None
+    report["eta_seconds"] = round(eta, 1) if eta is not None else None
+    return report
+
+
+class JobContext:
+    """What a running job sees: its parameters, checkpoint and cancellation"""
+
+    def __init__(self, job: Dict):
+        self.id = job["id"]
+        self.params = job["params"]
+        self.checkpoint = job["checkpoint"]
+        self.cancel_requested = False
+
+    def save(self, conn: sqlite3.Connection, checkpoint: Dict, processed: int,
+             total: Optional[int] = None, unit: Optional[str] = None):
+        """Checkpoint inside the caller's transaction"""
+        save_checkpoint(conn, self.id, checkpoint, processed, total, unit)
+        self.checkpoint = checkpoint
+        # Отмена могла быть запрошена другим процессом
+        row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.id,)).fetchone()
+        if row and row[0]:
+            self.cancel_requested = True
+
+    def raise_if_cancelled(self):
+        if self.cancel_requested:
+            raise JobCancelled()
+
+
+Handler = Callable[[JobContext], Awaitable[Dict]]
+
+
+class JobRunner:
+    def __init__(self, workers: int = 2, read=None, write=None, reclaim_interval: float = 30.0):
+        self.workers = workers
+        self.reclaim_interval = reclaim_interval
+        self.owner: Optional[str] = None
+        self._owner_lock = None
+        self._read = read
+        self._write = write
+        self._reclaimer: Optional[asyncio.Task] = None
+        self._handlers: Dict[str, Handler] = {}
+        self._contexts: Dict[str, JobContext] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._stopping = False
+
+    async def read(self, fn, *args):
+        if self._read is None:
+            from db_executor import run_read
+            self._read = run_read
+        return await self._read(fn, *args)
+
+    async def write(self, fn, *args):
+        if self._write is None:
+            from db_executor import run_write
+            self._write = run_write
+        return await self._write(fn, *args)
+
+    def register(self, kind: str, handler: Handler):
+        self._handlers[kind] = handler
+
+    async def start(self):
+        """Pick up jobs left queued or running by a previous process"""
+        # pid берется при старте: воркеры uvicorn импортируют приложение каждый в своем процессе
+        self.owner = process_owner()
+        self._owner_lock = hold_owner_lock(self.owner)
+        self._semaphore = asyncio.Semaphore(self.workers)
+        self._stopping = False
+        await self.reclaim()
+        if self.reclaim_interval > 0:
+            self._reclaimer = asyncio.get_running_loop().create_task(self._reclaim_periodically())
+
+    async def reclaim(self):
+        """Schedule jobs whose owner has exited"""
+        for job in await self.write(claim_jobs, self.owner):
+            logger.info(f"Resuming job {job['id']} ({job['kind']}) from its last checkpoint")
+            self._schedule(job)
+
+    async def _reclaim_periodically(self):
+        while True:
+            await asyncio.sleep(self.reclaim_interval)
+            try:
+                await self.reclaim()
+            except sqlite3.Error as e:
+                logger.error(f"Database error: {str(e)}")
+
+    async def shutdown(self):
+        """Stop running jobs; they stay 'running' and resume on the next start"""
+        self._stopping = True
+        if self._reclaimer is not None:
+            self._reclaimer.cancel()
+            await asyncio.gather(self._reclaimer, return_exceptions=True)
+            self._reclaimer = None
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Без блокировки оставшиеся задачи подхватит другой воркер
+        release_owner_lock(self.owner, self._owner_lock)
+        self._owner_lock = None
+
+    async def submit(self, kind: str, params: Dict) -> Dict:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = await self.write(insert_job, kind, params, self.owner)
+        self._schedule(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await self.read(get_job, job_id)
+
+    async def list(self, limit: int = 50) -> List[Dict]:
+        return await self.read(list_jobs, limit)
+
+    async def cancel(self, job_id: str) -> Optional[Dict]:
+        # Флаг в памяти выставляется сразу, не дожидаясь очереди записи
+        context = self._contexts.get(job_id)
+        if context is not None:
+            context.cancel_requested = True
+        return await self.write(request_cancel, job_id)
+
+    async def resume(self, job_id: str) -> Optional[Dict]:
+        job = await self.write(requeue_job, job_id, self.owner)
+        if job is not None and job["status"] == QUEUED:
+            self._schedule(job)
+        return job
+
+    def _schedule(self, job: Dict):
+        if job["id"] in self._tasks:
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        context = JobContext(job)
+        context.cancel_requested = job["cancel_requested"]
+        self._contexts[job["id"]] = context
+        task = asyncio.get_running_loop().create_task(self._run(job["kind"], context))
+        self._tasks[job["id"]] = task
+
+    async def _run(self, kind: str, context: JobContext):
+        try:
+            async with self._semaphore:
+                handler = self._handlers.get(kind)
+                if handler is None:
+                    await self.write(finish_job, context.id, FAILED, None, f"Unknown job kind: {kind}")
+                    return
+                if context.cancel_requested:
+                    await self.write(finish_job, context.id, CANCELLED)
+                    return
+                await self.write(mark_running, context.id)
+                try:
+                    result = await handler(context)
+                except JobCancelled:
+                    logger.info(f"Job {context.id} cancelled")
+                    await self.write(finish_job, context.id, CANCELLED)
+                except asyncio.CancelledError:
+                    # Остановка процесса: задача останется в статусе running и продолжится после рестарта
+                    raise
+                except Exception as e:
+                    logger.error(f"Job {context.id} ({kind}) failed: {str(e)}")
+                    await self.write(finish_job, context.id, FAILED, None, str(e))
+                else:
+                    await self.write(finish_job, context.id, COMPLETED, result)
+        finally:
+            self._tasks.pop(context.id, None)
+            self._contexts.pop(context.id, None)
@@ -0,0 +1,215 @@
+"""Non-blocking logging: records are queued and written by a background thread.
+
+``configure`` replaces the root handlers with a ``QueueHandler``: the thread
+that logs (a request, the event loop, a database thread) only formats the
+message and puts it on a bounded queue, and a ``QueueListener`` thread writes
+it to a size-rotated file and the console. When the queue is full the record
+is dropped and counted rather than blocking the caller.
+
+Settings come from the environment:
+
+- LOG_LEVEL: root level (INFO)
+- LOG_LEVELS: per-module levels, e.g. ``account_import=DEBUG,metrics=WARNING``
+- LOG_FORMAT: ``json`` (one object per line) or ``text``
+- LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT: rotating file (app.log, 50 MB, 5
+  files); an empty LOG_FILE disables the file, ``{pid}`` in it is replaced
+  with the process id
+- LOG_CONSOLE: also write to stderr (on)
+- LOG_QUEUE_SIZE: records waiting for the writer thread (10000); the count of
+  records dropped on a full queue is attached to the next one written
+- LOG_RATE_LIMIT, LOG_RATE_BURST: DEBUG and INFO records allowed per second
+  from one call site (line of code) and the burst above that (20, 100); 0
+  disables the limit. Suppressed records are counted and reported on the
+  next record that passes.
+
+Each uvicorn worker process runs its own listener; several processes
+rotating the same file may lose lines around a rotation, so give workers
+separate files (``LOG_FILE=app-{pid}.log``) or log to the console.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_FILE = os.environ.get("LOG_FILE", "app.log")
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", "5"))
+LOG_CONSOLE = os.environ.get("LOG_CONSOLE", "1").lower() in ("1", "true", "yes")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_RATE_LIMIT = float(os.environ.get("LOG_RATE_LIMIT", "20"))
+LOG_RATE_BURST = int(os.environ.get("LOG_RATE_BURST", "100"))
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and exception"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        for counter in ("suppressed", "dropped"):
+            if getattr(record, counter, 0):
+                entry[counter] = getattr(record, counter)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """TEXT_FORMAT lines with the suppressed and dropped counts appended"""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        if getattr(record, "suppressed", 0):
+            line += f" ({record.suppressed} similar suppressed)"
+        if getattr(record, "dropped", 0):
+            line += f" ({record.dropped} records dropped before this one)"
+        return line
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of waiting when the queue is full.
+
+    The number of dropped records travels with the next record that is queued.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение собирается в вызывающем потоке (аргументы могут измениться),
+        # а исключение превращается в текст; форматирование строки - в потоке записи
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        record.dropped = self.dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        else:
+            self.dropped = 0
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per call site for records below WARNING"""
+
+    def __init__(self, rate: float, burst: int):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            # [токены, время последнего пополнения, подавлено с прошлой записи]
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            record.suppressed, bucket[2] = bucket[2], 0
+        return True
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """``"a=DEBUG, b.c=WARNING"`` -> {"a": "DEBUG", "b.c": "WARNING"}"""
+    levels = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, sep, level = item.partition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"Invalid LOG_LEVELS entry: {item.strip()!r}")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure(level: str = LOG_LEVEL, levels: str = LOG_LEVELS, fmt: str = LOG_FORMAT,
+              filename: Optional[str] = LOG_FILE, console: bool = LOG_CONSOLE,
+              queue_size: int = LOG_QUEUE_SIZE, rate_limit: float = LOG_RATE_LIMIT,
+              rate_burst: int = LOG_RATE_BURST):
+    """Route all logging through a queue to a background writer; safe to call again"""
+    global _listener
+    if fmt not in ("json", "text"):
+        raise ValueError(f"LOG_FORMAT must be json or text, not {fmt!r}")
+    shutdown()
+
+    formatter = JSONFormatter() if fmt == "json" else TextFormatter()
+    handlers = []
+    if filename:
+        # Свой файл на каждый воркер: ротация одного файла несколькими процессами теряет строки
+        filename = filename.replace("{pid}", str(os.getpid()))
+        file_handler = logging.handlers.RotatingFileHandler(
+            filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+        handlers.append(file_handler)
+    if console:
+        handlers.append(logging.StreamHandler(sys.stderr))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(rate_limit, rate_burst))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    for name, module_level in parse_levels(levels).items():
+        logging.getLogger(name).setLevel(module_level)
+    _listener.start()
+
+
+def shutdown():
+    """Write out queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown)
@@ -1,219 +1,262 @@
-from fastapi import FastAPI, HTTPException, File, UploadFile, Body, Depends
+from fastapi import APIRouter, FastAPI, HTTPException, File, UploadFile, Body, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 import csv
-import io
+import functools
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime
+from decimal import Decimal
 import logging
 import sqlite3
 import os
-from contextlib import contextmanager
-import calendar
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("app.log", encoding='utf-8'),  # Указываем кодировку для файла логов
-        logging.StreamHandler()          # Логи выводятся в консоль
-    ]
-)
-
-app = FastAPI()
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins during development
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Database configuration
-DATABASE_URL = "banking.db"
-
-# Database initialization
-def init_db():
-    with sqlite3.connect(DATABASE_URL) as conn:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS accounts (
-                id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                balance REAL NOT NULL DEFAULT 0.0
-            )
-        """)
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                id TEXT PRIMARY KEY,
-                account_id TEXT NOT NULL,
-                amount REAL NOT NULL,
-                date TEXT NOT NULL,
-                comment TEXT,
-                FOREIGN KEY (account_id) REFERENCES accounts (id)
-            )
-        """)
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS interest_rates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                rate REAL NOT NULL,
-                month TEXT NOT NULL,
-                UNIQUE(month)
-            )
-        """)
-        # Инициализируем текущую процентную ставку
-        current_month = datetime.now().strftime("%Y-%m")
-        conn.execute("""
-            INSERT OR IGNORE INTO interest_rates (rate, month) VALUES (0.0, ?)
-        """, (current_month,))
-        conn.commit()
-
-# Initialize database on startup
-init_db()
-
-@contextmanager
-def get_db():
-    conn = sqlite3.connect(DATABASE_URL)
-    try:
-        conn.row_factory = sqlite3.Row
-        yield conn
-    finally:
-        conn.close()
+import time
+
+import account_import
+import balances
+import bulk_ingest
+import cache
+import capitalization
+import dashboard
+import db_executor
+import export
+import group_commit
+import history
+import jobs
+import log_config
+import metrics
+import projections
+import repository
+import serialization
+from database import TRANSACTION_FIELDS, close_pool, get_pools, init_shards, shard_count, shard_for
+from db_executor import (offload, run_read, run_read_all, run_read_for, run_read_scattered, run_write_all,
+                         run_write_for, run_write_on)
+from money import to_major, to_minor
+from streams import aiter_lines
+
+logger = logging.getLogger(__name__)
+
+# Маршруты регистрируются здесь и подключаются к приложению в create_app
+router = APIRouter()
+
+# Фоновые задачи
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# Как часто воркер забирает задачи завершившихся воркеров (0 - только при старте)
+JOB_RECLAIM_SECONDS = float(os.environ.get("JOB_RECLAIM_SECONDS", "30"))
+
+# Групповой коммит проводок (выключен по умолчанию)
+GROUP_COMMIT = os.environ.get("GROUP_COMMIT", "0").lower() in ("1", "true", "yes")
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get("GROUP_COMMIT_MAX_BATCH", "256"))
+GROUP_COMMIT_MAX_DELAY_MS = float(os.environ.get("GROUP_COMMIT_MAX_DELAY_MS", "2"))
 
 # Data models
 class Transaction(BaseModel):
     account_id: str
-    amount: float
+    amount: Decimal
     date: str
     comment: Optional[str] = None
 
-class MonthlyBalance(BaseModel):
-    month: str  # Format: YYYY-MM
-    balance: float
-    interest_rate: float
-
-class Account(BaseModel):
-    id: str
-    name: str
-    balance: float
-    initial_balance: float
-    interest_rate: float = 0.0
-    history: List[Transaction] = []
-    monthly_balances: Dict[str, MonthlyBalance] = {}
-    interest_rates: Dict[str, float] = {}
-
 class AccountUpdate(BaseModel):
     name: str
-    balance: float
+    balance: Decimal
 
 class InterestRate(BaseModel):
     rate: float
 
-# Global variables for interest rate
-global_interest_rate = 0.0
+class BalanceQuery(BaseModel):
+    account_id: str
+    date: str
 
-# In-memory storage
-accounts = {}
-transactions = []
-interest_rates = {}
+class BalanceBatch(BaseModel):
+    queries: List[BalanceQuery]
+
+MAX_BALANCE_QUERIES = 10000
+
+async def lifespan(app: FastAPI):
+    """Set up logging, the schema, group commit writers and jobs; undo it all on shutdown"""
+    # Логирование через очередь и фоновый поток записи, уровни и формат - из окружения (см. log_config.py)
+    log_config.configure()
+    # Все шарды и карта шардов; актуальная схема - одно чтение на шард (см. migrations.py)
+    init_shards()
+
+    job_runner = jobs.JobRunner(workers=JOB_WORKERS, reclaim_interval=JOB_RECLAIM_SECONDS)
+    job_runner.register("capitalization", capitalization.run_job)
+    job_runner.register("account_import", account_import.run_job)
+    # Свой писатель на каждый шард: пачки разных шардов фиксируются параллельно
+    group_writers = [
+        group_commit.GroupCommitWriter(GROUP_COMMIT_MAX_BATCH, GROUP_COMMIT_MAX_DELAY_MS,
+                                       write=functools.partial(run_write_on, shard))
+        for shard in range(shard_count())
+    ] if GROUP_COMMIT else []
+    app.state.job_runner = job_runner
+    app.state.group_writers = group_writers
+
+    for group_writer in group_writers:
+        await group_writer.start()
+    await job_runner.start()
+    try:
+        yield
+    finally:
+        await job_runner.shutdown()
+        for group_writer in group_writers:
+            await group_writer.stop()
+        db_executor.shutdown()
+        close_pool()
+        log_config.shutdown()
+
+# async: синхронные зависимости FastAPI выполняет в пуле потоков
+async def get_job_runner(request: Request) -> jobs.JobRunner:
+    return request.app.state.job_runner
 
-@app.get("/")
+async def get_group_writers(request: Request) -> List[group_commit.GroupCommitWriter]:
+    return request.app.state.group_writers
+
+@router.get("/")
 def read_root():
-    logging.info("Root endpoint accessed")
+    logger.info("Root endpoint accessed")
     return {"message": "Welcome to Banking Service API"}
 
-@app.get("/api/accounts")
-async def get_accounts():
+@router.get("/metrics")
+def get_metrics():
+    """Request, SQL and response metrics in the Prometheus text format"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+def _per_shard(stats: List[Dict]) -> Dict:
+    # Один шард - прежний формат ответа, несколько - список по шардам
+    return stats[0] if len(stats) == 1 else {"shards": stats}
+
+@router.get("/api/db/pool-stats")
+def get_pool_stats():
+    """Connection pool counters"""
+    return _per_shard([pool.stats() for pool in get_pools()])
+
+@router.get("/api/db/cache-stats")
+def get_cache_stats():
+    """Hit/miss counters of the account and interest rate caches"""
+    return cache.stats()
+
+@router.get("/api/db/group-commit-stats")
+def get_group_commit_stats(group_writers: List[group_commit.GroupCommitWriter] = Depends(get_group_writers)):
+    """Batch size, queue wait and commit time of the group commit writer"""
+    if not group_writers:
+        return {"enabled": False}
+    return dict(_per_shard([group_writer.stats() for group_writer in group_writers]), enabled=True)
+
+@router.get("/api/accounts")
+async def get_accounts(request: Request):
+    try:
+        etag, accounts = await dashboard.dashboard_if_changed(request.headers.get("if-none-match"))
+        if accounts is None:
+            return Response(status_code=304, headers={"ETag": etag})
+        # Большой ответ кодируется вне event loop
+        return await offload(
+            serialization.FastJSONResponse,
+            content=accounts,
+            headers={"Content-Type": "application/json; charset=utf-8", "ETag": etag}
+        )
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error")
+
+@router.get("/api/accounts/report")
+async def get_account_report(account_id: str, date: str, limit: int = balances.MAX_REPORT_TRANSACTIONS):
+    """Balance of an account at the end of a date and its latest transactions up to it"""
+    try:
+        if not 1 <= limit <= balances.MAX_REPORT_TRANSACTIONS:
+            raise HTTPException(status_code=400,
+                                detail=f"limit must be between 1 and {balances.MAX_REPORT_TRANSACTIONS}")
+        balances.validate_date(date)
+        report = await run_read_for(account_id, balances.account_report, account_id, date, limit)
+        if report is None:
+            raise HTTPException(status_code=404, detail="Account not found")
+        return JSONResponse(
+            content=report,
+            headers={"Content-Type": "application/json; charset=utf-8"}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error")
+
+@router.post("/api/accounts/report/batch")
+async def get_account_reports(batch: BalanceBatch):
+    """Balances for many (account_id, date) pairs in one call; balance is null for unknown accounts"""
+    try:
+        if len(batch.queries) > MAX_BALANCE_QUERIES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BALANCE_QUERIES} queries per request")
+        results = await run_read_scattered(
+            balances.balances_as_of,
+            [(query.account_id, query.date) for query in batch.queries],
+            lambda query: query[0]
+        )
+        return await offload(
+            serialization.FastJSONResponse,
+            content=results,
+            headers={"Content-Type": "application/json; charset=utf-8"}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error")
+
+@router.get("/api/accounts/history")
+async def get_accounts_history(months: int = history.DEFAULT_MONTHS, limit: int = history.DEFAULT_PAGE_SIZE,
+                               cursor: Optional[str] = None):
+    """Month-end balances of the last ``months`` months and the current month, a page of accounts at a time.
+
+    Accounts are ordered by id; the cursor of the next page is returned in
+    the X-Next-Cursor header, which is absent on the last page.
+    """
     try:
-        with get_db() as conn:
-            cursor = conn.execute("SELECT * FROM accounts")
-            accounts = [dict(row) for row in cursor.fetchall()]
-            
-            # Получаем транзакции за последние 3 месяца для каждого счета
-            three_months_ago = (datetime.now() - timedelta(days=90)).strftime("%Y-%m-%d")
-            
-            for account in accounts:
-                # Получаем транзакции для счета
-                cursor = conn.execute(
-                    """
-                    SELECT * FROM transactions 
-                    WHERE account_id = ? AND date >= ?
-                    ORDER BY date DESC
-                    """,
-                    (account['id'], three_months_ago)
-                )
-                transactions = [dict(row) for row in cursor.fetchall()]
-                account['transactions'] = transactions
-                
-                # Рассчитываем месячные балансы и получаем процентные ставки
-                monthly_balances = {}
-                current_date = datetime.now()
-                for i in range(3):
-                    month_date = current_date - timedelta(days=30 * i)
-                    month_key = month_date.strftime("%Y-%m")
-                    
-                    # Получаем процентную ставку для месяца
-                    cursor = conn.execute(
-                        "SELECT rate FROM interest_rates WHERE month = ?",
-                        (month_key,)
-                    )
-                    rate_result = cursor.fetchone()
-                    interest_rate = rate_result['rate'] if rate_result else 0.0
-                    
-                    cursor = conn.execute(
-                        """
-                        SELECT SUM(amount) as total
-                        FROM transactions
-                        WHERE account_id = ? 
-                        AND strftime('%Y-%m', date) = ?
-                        """,
-                        (account['id'], month_key)
-                    )
-                    result = cursor.fetchone()
-                    monthly_balance = float(result['total'] or 0)
-                    
-                    monthly_balances[month_key] = {
-                        'balance': monthly_balance,
-                        'interest_rate': interest_rate
-                    }
-                
-                account['monthly_balances'] = monthly_balances
-            
-            return JSONResponse(
-                content=accounts,
-                headers={"Content-Type": "application/json; charset=utf-8"}
-            )
-            
+        pages = await run_read_all(history.accounts_history, months, limit, cursor)
+        accounts, next_cursor = history.merge_pages(pages, limit)
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        if next_cursor is not None:
+            headers["X-Next-Cursor"] = next_cursor
+        return await offload(serialization.FastJSONResponse, content=accounts, headers=headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except sqlite3.Error as e:
-        logging.error(f"Database error: {str(e)}")
+        logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error")
 
-@app.get("/api/accounts/{account_id}")
+@router.get("/api/accounts/projections")
+async def get_account_projections(request: Request, format: str = "json"):
+    """Projected month-end and year-end balances of every account at the current rates.
+
+    ``format`` is json or columnar for the accounts table.
+    """
+    try:
+        if format not in ("json", "columnar"):
+            raise HTTPException(status_code=400, detail="format must be one of json, columnar")
+        etag, body = await projections.projections_if_changed(request.headers.get("if-none-match"), format)
+        if body is None:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=body, headers={"Content-Type": "application/json; charset=utf-8", "ETag": etag})
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error")
+
+@router.get("/api/accounts/{account_id}")
 async def get_account(account_id: str):
     """Get account by ID"""
     try:
-        with get_db() as conn:
-            cursor = conn.execute(
-                "SELECT * FROM accounts WHERE id = ?",
-                (account_id,)
-            )
-            account = cursor.fetchone()
-            if account is None:
-                raise HTTPException(status_code=404, detail="Account not found")
-            return JSONResponse(
-                content=dict(account),
-                headers={"Content-Type": "application/json; charset=utf-8"}
-            )
+        account = await run_read_for(account_id, cache.get_account, account_id)
+        if account is None:
+            raise HTTPException(status_code=404, detail="Account not found")
+        return JSONResponse(
+            content=account,
+            headers={"Content-Type": "application/json; charset=utf-8"}
+        )
     except sqlite3.Error as e:
-        logging.error(f"Database error: {str(e)}")
+        logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error")
 
-@app.post("/api/accounts")
+@router.post("/api/accounts")
 async def create_account(account: AccountUpdate):
     """Create a new account"""
     try:
@@ -222,345 +265,329 @@ async def create_account(account: AccountUpdate):
         if account.balance < 0:
             raise HTTPException(status_code=400, detail="Balance cannot be negative")
 
+        # Идентификатор выбирается заранее: от него зависит шард счета
         account_id = str(uuid.uuid4())
-        with get_db() as conn:
-            conn.execute(
-                "INSERT INTO accounts (id, name, balance) VALUES (?, ?, ?)",
-                (account_id, account.name, float(account.balance))
-            )
-            conn.commit()
-
-            # Получаем созданный аккаунт
-            cursor = conn.execute("SELECT * FROM accounts WHERE id = ?", (account_id,))
-            new_account = dict(cursor.fetchone())
-            
-            logging.info(f"Account created successfully: {new_account}")
-            return JSONResponse(
-                content=new_account,
-                headers={"Content-Type": "application/json; charset=utf-8"}
-            )
+        new_account = await run_write_for(
+            account_id, repository.create_account, account.name, to_minor(account.balance), account_id
+        )
+        logger.info(f"Account created: {new_account['id']}")
+        return JSONResponse(
+            content=new_account,
+            headers={"Content-Type": "application/json; charset=utf-8"}
+        )
+    except HTTPException:
+        raise
     except sqlite3.Error as e:
-        logging.error(f"Database error: {str(e)}")
+        logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error")
     except Exception as e:
-        logging.error(f"Error creating account: {str(e)}")
+        logger.error(f"Error creating account: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/api/transactions")
+async def create_transaction(transaction: Transaction,
+                             group_writers: List[group_commit.GroupCommitWriter] = Depends(get_group_writers)):
+    try:
+        # Проверяем дату
+        transaction_date = datetime.strptime(transaction.date, "%Y-%m-%d").date()
+        today = datetime.now().date()
+        if transaction_date > today:
+            raise HTTPException(status_code=400, detail="Transaction date cannot be in the future")
+
+        posting = (transaction.account_id, to_minor(transaction.amount), transaction.date, transaction.comment)
+        if group_writers:
+            # Ответ уходит только после фиксации пачки, в которую попала проводка
+            new_balance = await group_writers[shard_for(transaction.account_id)].submit(*posting)
+        else:
+            new_balance = await run_write_for(transaction.account_id, repository.post_transaction, *posting)
+        if new_balance is None:
+            raise HTTPException(status_code=404, detail="Account not found")
+
+        return {
+            "message": "Transaction successful",
+            "new_balance": to_major(new_balance)
+        }
+
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error")
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/api/transactions")
-async def create_transaction(transaction: Transaction):
+@router.post("/api/transactions/bulk")
+async def create_transactions_bulk(request: Request):
+    """Import many transactions from a JSON array, NDJSON or CSV body"""
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+    started = time.perf_counter()
     try:
-        with get_db() as conn:
-            # Проверяем существование счета
-            cursor = conn.execute(
-                "SELECT * FROM accounts WHERE id = ?",
-                (transaction.account_id,)
-            )
-            account = cursor.fetchone()
-            if account is None:
-                raise HTTPException(status_code=404, detail="Account not found")
-            
-            # Проверяем дату
-            transaction_date = datetime.strptime(transaction.date, "%Y-%m-%d").date()
-            today = datetime.now().date()
-            if transaction_date > today:
-                raise HTTPException(status_code=400, detail="Transaction date cannot be in the future")
-            
-            # Создаем транзакцию
-            transaction_id = str(uuid.uuid4())
-            conn.execute(
-                "INSERT INTO transactions (id, account_id, amount, date, comment) VALUES (?, ?, ?, ?, ?)",
-                (transaction_id, transaction.account_id, transaction.amount, transaction.date, transaction.comment)
-            )
-            
-            # Обновляем баланс счета
-            new_balance = float(account['balance']) + transaction.amount
-            conn.execute(
-                "UPDATE accounts SET balance = ? WHERE id = ?",
-                (new_balance, transaction.account_id)
-            )
-            
-            conn.commit()
-            
-            return {
-                "message": "Transaction successful",
-                "new_balance": new_balance
-            }
-            
+        if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+            records = bulk_ingest.aiter_ndjson(aiter_lines(request.stream()))
+        elif content_type in ("text/csv", "application/csv"):
+            records = bulk_ingest.aiter_csv(aiter_lines(request.stream()))
+        elif content_type == "application/json":
+            records = bulk_ingest.aiter_records(bulk_ingest.iter_json_array(await request.body()))
+        else:
+            raise HTTPException(status_code=415, detail=f"Unsupported content type: {content_type}")
+
+        result = await bulk_ingest.ingest(records)
     except sqlite3.Error as e:
-        logging.error(f"Database error: {str(e)}")
+        logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error")
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    elapsed = time.perf_counter() - started
+    summary = result.to_dict()
+    summary["duration_ms"] = round(elapsed * 1000, 1)
+    summary["rows_per_second"] = round((result.inserted + result.failed) / elapsed) if elapsed > 0 else None
+    logger.info(f"Bulk import finished: {result.inserted} inserted, {result.failed} failed")
+    return summary
+
+@router.get("/api/transactions/export")
+async def export_transactions(
+    request: Request,
+    format: str = "ndjson",
+    account_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+):
+    """Stream transactions of one account or of all accounts as NDJSON or CSV.
+
+    The body is gzip-compressed when the client sends Accept-Encoding: gzip.
+    """
+    try:
+        if format not in export.ENCODERS:
+            raise HTTPException(status_code=400, detail=f"Unsupported format: {format}, expected ndjson or csv")
+        for value in (date_from, date_to):
+            if value is not None:
+                balances.validate_date(value)
+        if account_id is not None and await run_read_for(account_id, cache.get_account, account_id) is None:
+            raise HTTPException(status_code=404, detail="Account not found")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error")
 
-@app.get("/api/interest-rate")
-async def get_interest_rate(month: str = None):
+    gzip = "gzip" in request.headers.get("accept-encoding", "").lower()
+    headers = {
+        "Content-Disposition": f'attachment; filename="transactions.{format}"',
+        "Vary": "Accept-Encoding",
+    }
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export.stream_export(format, account_id, date_from, date_to, gzip=gzip),
+        media_type=export.MEDIA_TYPES[format],
+        headers=headers,
+    )
+
+@router.get("/api/interest-rate")
+async def get_interest_rate(request: Request, month: str = None):
     try:
-        with get_db() as conn:
-            if month is None:
-                month = datetime.now().strftime("%Y-%m")
-            
-            cursor = conn.execute(
-                "SELECT rate FROM interest_rates WHERE month = ?",
-                (month,)
-            )
-            result = cursor.fetchone()
-            return {"rate": result['rate'] if result else 0.0}
+        if month is None:
+            month = datetime.now().strftime("%Y-%m")
+        rate = await run_read(cache.get_interest_rate, month)
+        # ETag зависит только от содержимого и совпадает у всех воркеров
+        etag = f'"{month}:{rate!r}"'
+        if cache.etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        return JSONResponse(content={"rate": rate}, headers={"ETag": etag})
     except sqlite3.Error as e:
-        logging.error(f"Database error: {str(e)}")
+        logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error")
 
-@app.put("/api/interest-rate")
+@router.put("/api/interest-rate")
 async def update_interest_rate(rate: InterestRate, month: str = None):
     try:
         if rate.rate < 0:
             raise HTTPException(status_code=400, detail="Interest rate cannot be negative")
-            
-        with get_db() as conn:
-            if month is None:
-                month = datetime.now().strftime("%Y-%m")
-            
-            conn.execute("""
-                INSERT INTO interest_rates (rate, month) 
-                VALUES (?, ?)
-                ON CONFLICT(month) DO UPDATE SET rate = excluded.rate
-            """, (rate.rate, month))
-            conn.commit()
-            return {"message": "Interest rate updated successfully"}
+
+        if month is None:
+            month = datetime.now().strftime("%Y-%m")
+        # Ставки хранятся в каждом шарде; запись идемпотентна, повтор запроса выравнивает шарды
+        await run_write_all(repository.set_interest_rate, month, rate.rate)
+        return {"message": "Interest rate updated successfully"}
     except sqlite3.Error as e:
-        logging.error(f"Database error: {str(e)}")
+        logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error")
 
-@app.post("/api/capitalize-interest")
-def capitalize_interest():
-    global global_interest_rate
+@router.post("/api/capitalize-interest")
+async def capitalize_interest(month: str = None, job_runner: jobs.JobRunner = Depends(get_job_runner)):
+    """Start interest capitalization as a background job"""
     try:
-        with get_db() as conn:
-            cursor = conn.execute("SELECT id, balance FROM accounts")
-            accounts = cursor.fetchall()
-            
-            for account in accounts:
-                interest = account['balance'] * global_interest_rate
-                new_balance = account['balance'] + interest
-                
-                conn.execute(
-                    "UPDATE accounts SET balance = ? WHERE id = ?",
-                    (new_balance, account['id'])
-                )
-                
-                # Записываем начисление процентов как транзакцию
-                transaction_id = str(uuid.uuid4())
-                conn.execute(
-                    "INSERT INTO transactions (id, account_id, amount, type, date) VALUES (?, ?, ?, ?, ?)",
-                    (transaction_id, account['id'], interest, 'interest', datetime.now().strftime('%Y-%m-%d'))
-                )
-            
-            conn.commit()
-            return {"message": "Interest capitalized successfully"}
+        if month is None:
+            month = datetime.now().strftime("%Y-%m")
+        capitalization.validate_month(month)
+
+        job = await job_runner.submit("capitalization", {"month": month})
+        return JSONResponse(status_code=202, content=jobs.job_report(job))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except sqlite3.Error as e:
-        logging.error(f"Database error: {str(e)}")
+        logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error")
 
-@app.get("/api/accounts/history")
-def get_accounts_history():
+@router.get("/api/jobs")
+async def get_jobs(limit: int = 50, job_runner: jobs.JobRunner = Depends(get_job_runner)):
     try:
-        logging.debug("Fetching accounts history")
-        today = datetime.now()
-        last_three_months = [(today - timedelta(days=30 * i)).strftime("%Y-%m") for i in range(1, 4)]
-        
-        accounts_history = []
-        for account in accounts.values():
-            history_data = {}
-            for month in last_three_months:
-                record = next((h for h in account.history if h["date"].startswith(month)), None)
-                history_data[month] = record["balance"] if record else "Нет данных"
-            
-            current_month = today.strftime("%Y-%m")
-            current_record = next((h for h in account.history if h["date"].startswith(current_month)), None)
-            current_balance = current_record["balance"] if current_record else account.balance
-            interest_amount = current_balance * (global_interest_rate / 100)
-            
-            accounts_history.append({
-                "id": account.id,
-                "name": account.name,
-                "history": history_data,
-                "current_month": {
-                    "balance": current_balance,
-                    "balance_with_interest": current_balance + interest_amount
-                }
-            })
-        
-        logging.info("Accounts history fetched successfully")
-        return accounts_history
-    except Exception as e:
-        logging.error(f"Error fetching accounts history: {str(e)}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+        return [jobs.job_report(job) for job in await job_runner.list(limit)]
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error")
+
+@router.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, job_runner: jobs.JobRunner = Depends(get_job_runner)):
+    """Job status, progress, throughput and ETA"""
+    try:
+        job = await job_runner.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return jobs.job_report(job)
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error")
+
+@router.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, job_runner: jobs.JobRunner = Depends(get_job_runner)):
+    try:
+        job = await job_runner.cancel(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return jobs.job_report(job)
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error")
 
-@app.post("/api/accounts/upload")
-async def upload_accounts(file: UploadFile = File(...)):
+@router.post("/api/jobs/{job_id}/resume")
+async def resume_job(job_id: str, job_runner: jobs.JobRunner = Depends(get_job_runner)):
+    """Continue a cancelled or failed job from its last checkpoint"""
     try:
-        logging.debug(f"Received file: {file.filename}")
+        job = await job_runner.resume(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job["status"] != jobs.QUEUED and job["status"] != jobs.RUNNING:
+            raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+        return jobs.job_report(job)
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error")
+
+@router.post("/api/accounts/upload")
+async def upload_accounts(file: UploadFile = File(...), job_runner: jobs.JobRunner = Depends(get_job_runner)):
+    """Start a background import of accounts from a CSV file"""
+    try:
+        logger.debug("Received file: %s", file.filename)
         if not file.content_type.startswith("text/csv"):
             raise HTTPException(status_code=400, detail="Invalid file type. Only CSV files are allowed.")
-        
-        content = await file.read()
-        decoded_content = content.decode("utf-8")
-        reader = csv.DictReader(io.StringIO(decoded_content))
-        
-        created_accounts = []
-        for row in reader:
-            logging.debug(f"Processing row: {row}")
-            if "name" not in row or "balance" not in row:
-                raise HTTPException(status_code=400, detail=f"Missing required fields in row: {row}")
-            
-            # Проверяем корректность данных
-            try:
-                name = row["name"].strip()
-                balance = float(row["balance"].strip())
-            except ValueError:
-                logging.warning(f"Skipping invalid row: {row}")
-                continue
-            
-            if not name:
-                logging.warning(f"Skipping row with empty name: {row}")
-                continue
-            if balance < 0:
-                logging.warning(f"Skipping row with negative balance: {row}")
-                continue
-            
-            account_id = str(uuid.uuid4())
-            account = Account(
-                id=account_id,
-                name=name,
-                balance=balance,
-                initial_balance=balance
-            )
-            accounts[account_id] = account
-            created_accounts.append(account)
-        
-        logging.info(f"Accounts uploaded successfully: {[a.dict() for a in created_accounts]}")
-        return {"message": "Accounts uploaded successfully", "accounts": [account.dict() for account in created_accounts]}
-    except Exception as e:
-        logging.error(f"Error uploading accounts: {str(e)}")
-        raise HTTPException(status_code=500, detail="Internal server error")
 
-@app.get("/api/accounts/report")
-def get_account_report(account_id: str, date: str):
-    try:
-        logging.debug(f"Fetching account report for account_id={account_id}, date={date}")
-        if account_id not in accounts:
-            raise HTTPException(status_code=404, detail="Account not found")
-        
-        account = accounts[account_id]
-        report_date = datetime.strptime(date, "%Y-%m-%d")
-        
-        closest_record = None
-        for record in account.history:
-            record_date = datetime.strptime(record["date"], "%Y-%m-%d")
-            if record_date <= report_date and (not closest_record or record_date > closest_record["date"]):
-                closest_record = record
-        
-        logging.info(f"Account report fetched successfully for account_id={account_id}")
-        return {
-            "date": date,
-            "balance": closest_record["balance"] if closest_record else "Нет данных",
-            "transactions": [t for t in transactions if t.account_id == account_id]
-        }
+        # Файл сохраняется на диск, чтобы импорт пережил рестарт
+        path = await offload(account_import.spool_upload, file.file, file.filename)
+        try:
+            job = await job_runner.submit("account_import", {"path": path, "filename": file.filename})
+        except Exception:
+            account_import.remove_upload(path)
+            raise
+        return JSONResponse(status_code=202, content=jobs.job_report(job))
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error(f"Error fetching account report: {str(e)}")
+        logger.error(f"Error uploading accounts: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@app.put("/api/accounts/{account_id}")
+@router.put("/api/accounts/{account_id}")
 async def update_account(account_id: str, account_update: AccountUpdate):
     try:
-        with get_db() as conn:
-            cursor = conn.execute(
-                "SELECT * FROM accounts WHERE id = ?",
-                (account_id,)
-            )
-            if not cursor.fetchone():
-                raise HTTPException(status_code=404, detail="Account not found")
-
-            conn.execute(
-                "UPDATE accounts SET name = ? WHERE id = ?",
-                (account_update.name, account_id)
-            )
-            conn.commit()
-
-            # Получаем обновленный аккаунт
-            cursor = conn.execute("SELECT * FROM accounts WHERE id = ?", (account_id,))
-            updated_account = dict(cursor.fetchone())
-            
-            return JSONResponse(
-                content=updated_account,
-                headers={"Content-Type": "application/json; charset=utf-8"}
-            )
+        updated_account = await run_write_for(
+            account_id, repository.update_account_name, account_id, account_update.name
+        )
+        if updated_account is None:
+            raise HTTPException(status_code=404, detail="Account not found")
+
+        return JSONResponse(
+            content=updated_account,
+            headers={"Content-Type": "application/json; charset=utf-8"}
+        )
     except sqlite3.Error as e:
-        logging.error(f"Database error: {str(e)}")
+        logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error")
 
-def get_last_three_months():
-    current_date = datetime.now()
-    months = []
-    for i in range(3, -1, -1):
-        date = current_date - timedelta(days=30*i)
-        months.append(date.strftime("%Y-%m"))
-    return months
-
-def calculate_future_balance(account: Account) -> float:
-    current_date = datetime.now()
-    days_in_month = calendar.monthrange(current_date.year, current_date.month)[1]
-    days_remaining = days_in_month - current_date.day
-    
-    daily_interest = account.interest_rate / 365
-    future_balance = account.balance * (1 + daily_interest) ** days_remaining
-    
-    return round(future_balance, 2)
-
-def update_monthly_balance(account: Account):
-    current_month = datetime.now().strftime("%Y-%m")
-    if current_month not in account.monthly_balances:
-        account.monthly_balances[current_month] = MonthlyBalance(
-            month=current_month,
-            balance=account.balance,
-            interest_rate=account.interest_rate
+@router.get("/api/accounts/{account_id}/transactions")
+async def get_account_transactions(
+    account_id: str,
+    limit: int = repository.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    amount_min: Optional[Decimal] = None,
+    amount_max: Optional[Decimal] = None,
+    comment: Optional[str] = None,
+    format: str = "json",
+):
+    """One page of an account's transactions, newest first.
+
+    The cursor of the next page is returned in the X-Next-Cursor header;
+    the header is absent on the last page. ``format`` is json (an array of
+    objects), columnar (``{"column": [values]}``) or ndjson.
+    """
+    try:
+        if not 1 <= limit <= repository.MAX_PAGE_SIZE:
+            raise HTTPException(status_code=400, detail=f"limit must be between 1 and {repository.MAX_PAGE_SIZE}")
+        if format not in serialization.MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(serialization.MEDIA_TYPES)}")
+        for value in (date_from, date_to):
+            if value is not None:
+                balances.validate_date(value)
+
+        page = await run_read_for(
+            account_id, repository.list_account_transactions, account_id, limit, cursor, date_from, date_to,
+            to_minor(amount_min) if amount_min is not None else None,
+            to_minor(amount_max) if amount_max is not None else None,
+            comment
         )
-    else:
-        account.monthly_balances[current_month].balance = account.balance
-        account.monthly_balances[current_month].interest_rate = account.interest_rate
+        if page is None:
+            raise HTTPException(status_code=404, detail="Account not found")
 
-@app.get("/api/accounts/{account_id}/transactions")
-async def get_account_transactions(account_id: str, limit: Optional[int] = None):
-    """Get transactions for a specific account"""
-    try:
-        with get_db() as conn:
-            # Проверяем существование счета
-            cursor = conn.execute("SELECT id FROM accounts WHERE id = ?", (account_id,))
-            if not cursor.fetchone():
-                raise HTTPException(status_code=404, detail="Account not found")
-            
-            # Получаем транзакции из базы данных
-            query = """
-                SELECT * FROM transactions 
-                WHERE account_id = ? 
-                ORDER BY date DESC
-            """
-            params = [account_id]
-            
-            if limit is not None:
-                query += " LIMIT ?"
-                params.append(limit)
-            
-            cursor = conn.execute(query, params)
-            transactions = [dict(row) for row in cursor.fetchall()]
-            
-            return JSONResponse(
-                content=transactions,
-                headers={"Content-Type": "application/json; charset=utf-8"}
-            )
-            
+        rows, next_cursor = page
+        headers = {"Content-Type": serialization.MEDIA_TYPES[format]}
+        if next_cursor is not None:
+            headers["X-Next-Cursor"] = next_cursor
+        body = await offload(serialization.encode_rows, TRANSACTION_FIELDS, rows, format, {"amount": to_major})
+        return Response(content=body, headers=headers)
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except sqlite3.Error as e:
-        logging.error(f"Database error: {str(e)}")
+        logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error")
     except Exception as e:
-        logging.error(f"Error getting transactions: {str(e)}")
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+        logger.error(f"Error getting transactions: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+def create_app() -> FastAPI:
+    """The service application; nothing is opened or configured until it starts (see lifespan)
+
+        uvicorn main:create_app --factory
+    """
+    app = FastAPI()
+    app.router.lifespan_context = lifespan
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Allow all origins during development
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag"],
+    )
+    # Метрики запросов и X-Profile (см. metrics.py); снаружи CORS, чтобы учитывать все время
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.include_router(router)
+    return app
+
+
+# Для uvicorn main:app; создание приложения не трогает базу и логи
+app = create_app()
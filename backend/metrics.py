@@ -0,0 +1,394 @@
+"""Request and SQL metrics in Prometheus text format, the slow query log and request profiling.
+
+``MetricsMiddleware`` records, per route, the latency of every HTTP request,
+how many SQL statements it ran, how long they took and how many rows they
+returned, the time spent in ``offload`` (encoding large responses), the time
+its work waited for a free database thread, and the response size. ``render``
+returns everything in the Prometheus text exposition format (GET /metrics).
+Counters live in the process: with several workers each one reports its own.
+
+SQL is measured by the connection class the pool opens (``TracedConnection``):
+every ``execute`` and every fetch is timed, and the statement is accounted
+when its cursor is exhausted, re-executed, closed or dropped. Statements
+slower than SLOW_QUERY_MS are logged with their duration.
+
+With PROFILE_REQUESTS enabled, a request sent with an ``X-Profile`` header is
+run under cProfile and answered with a plain-text summary instead of its
+body. The summary covers the database and offload threads that worked for the
+request and the event loop thread while it was served, including whatever
+other requests the loop ran meanwhile.
+"""
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+SQL_METRICS = os.environ.get("SQL_METRICS", "1").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS", "0").lower() in ("1", "true", "yes")
+# Сколько строк статистики cProfile попадает в ответ
+PROFILE_LINES = int(os.environ.get("PROFILE_LINES", "40"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 1000)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10_000, 100_000, 1_000_000)
+SIZE_BUCKETS = (256, 1024, 16_384, 131_072, 1_048_576, 16_777_216, 134_217_728)
+
+# Строки курсора при итерации выбираются пачками через fetchmany
+ITER_BATCH = 256
+
+# Маршрут запросов, не совпавших ни с одним путем (чтобы не плодить метки)
+UNMATCHED = "unmatched"
+
+_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, labels: Tuple = (), value: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+                for labels, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Cumulative buckets, sum and count per label set"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Метки -> [счетчики корзин..., сумма, количество]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, labels: Tuple, value: float):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [0] * len(self.buckets) + [0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, state in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {state[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(state[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {state[-1]}")
+        return lines
+
+
+ROUTE = ("method", "route")
+
+requests_total = Counter("http_requests_total", "HTTP requests by response status", ROUTE + ("status",))
+request_seconds = Histogram("http_request_duration_seconds", "Time to serve a request", ROUTE, LATENCY_BUCKETS)
+request_queries = Histogram("http_request_sql_queries", "SQL statements run per request", ROUTE, QUERY_BUCKETS)
+request_sql_seconds = Histogram("http_request_sql_seconds", "Time in SQL per request", ROUTE, LATENCY_BUCKETS)
+request_rows = Histogram("http_request_sql_rows", "Rows fetched per request", ROUTE, ROW_BUCKETS)
+request_offload_seconds = Histogram("http_request_offload_seconds",
+                                    "Time in offloaded work (response encoding) per request", ROUTE, LATENCY_BUCKETS)
+request_wait_seconds = Histogram("http_request_thread_wait_seconds",
+                                 "Time the request's work waited for a free database thread", ROUTE, LATENCY_BUCKETS)
+response_bytes = Histogram("http_response_size_bytes", "Response body size", ROUTE, SIZE_BUCKETS)
+queries_total = Counter("db_queries_total", "SQL statements run, requests and background jobs")
+query_seconds_total = Counter("db_query_seconds_total", "Time in SQL statements")
+rows_total = Counter("db_rows_fetched_total", "Rows fetched by SQL statements")
+slow_queries_total = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS")
+
+REGISTRY = [
+    requests_total, request_seconds, request_queries, request_sql_seconds, request_rows,
+    request_offload_seconds, request_wait_seconds, response_bytes,
+    queries_total, query_seconds_total, rows_total, slow_queries_total,
+]
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        for metric in REGISTRY:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    """What one request spent; shared with the threads that work for it"""
+    __slots__ = ("queries", "sql_seconds", "rows", "offload_seconds", "wait_seconds", "profiles")
+
+    def __init__(self, profile: bool = False):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.offload_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.profiles: Optional[List[cProfile.Profile]] = [] if profile else None
+
+
+_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def call_in_thread(fn: Callable[..., T], submitted: float, offloaded: bool, *args, **kwargs) -> T:
+    """Run ``fn`` on a worker thread for the current request (see db_executor).
+
+    Records how long the call waited for the thread since ``submitted``,
+    its run time when ``offloaded``, and profiles it for profiled requests.
+    """
+    stats = _request.get()
+    if stats is None:
+        return fn(*args, **kwargs)
+    started = time.perf_counter()
+    stats.wait_seconds += started - submitted
+    try:
+        if stats.profiles is None:
+            return fn(*args, **kwargs)
+        profile = cProfile.Profile()
+        stats.profiles.append(profile)
+        return profile.runcall(fn, *args, **kwargs)
+    finally:
+        if offloaded:
+            stats.offload_seconds += time.perf_counter() - started
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that times its statement and counts the rows it returns"""
+    _statement: Optional[str] = None
+    _elapsed = 0.0
+    _rows = 0
+
+    def _record(self, elapsed: float, rows: int, statement: bool = False):
+        self._elapsed += elapsed
+        self._rows += rows
+        stats = _request.get()
+        if stats is not None:
+            stats.queries += statement
+            stats.sql_seconds += elapsed
+            stats.rows += rows
+
+    def _finish(self):
+        sql = self._statement
+        if sql is None:
+            return
+        self._statement = None
+        elapsed = self._elapsed
+        slow = elapsed * 1000 >= SLOW_QUERY_MS
+        with _lock:
+            queries_total.inc()
+            query_seconds_total.inc(value=elapsed)
+            rows_total.inc(value=self._rows)
+            if slow:
+                slow_queries_total.inc()
+        if slow:
+            logger.warning(f"Slow query ({elapsed * 1000:.1f} ms, {self._rows} rows): {' '.join(sql.split())}")
+
+    def _begin(self, sql: str):
+        self._finish()
+        self._statement = sql
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record(time.perf_counter() - started, 0, statement=True)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._record(time.perf_counter() - started, 0, statement=True)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._record(time.perf_counter() - started, row is not None)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._record(time.perf_counter() - started, len(rows))
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._record(time.perf_counter() - started, len(rows))
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        # next() по строке в Python удвоил бы цену итерации; пачки почти бесплатны
+        while True:
+            rows = self.fetchmany(ITER_BATCH)
+            yield from rows
+            if len(rows) < ITER_BATCH:
+                return
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose cursors are ``TracedCursor``s"""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_factory():
+    """Connection class the pool opens: traced unless SQL_METRICS is off"""
+    return TracedConnection if SQL_METRICS else sqlite3.Connection
+
+
+def _profile_summary(scope, status: int, elapsed: float, size: int, stats: RequestStats,
+                     profiles: List[cProfile.Profile]) -> bytes:
+    out = io.StringIO()
+    out.write(
+        f"{scope['method']} {scope['path']} -> {status} in {elapsed * 1000:.1f} ms, {size} bytes\n"
+        f"sql: {stats.queries} statements, {stats.sql_seconds * 1000:.1f} ms, {stats.rows} rows\n"
+        f"offload: {stats.offload_seconds * 1000:.1f} ms, thread wait: {stats.wait_seconds * 1000:.1f} ms\n\n"
+    )
+    report = pstats.Stats(*profiles, stream=out)
+    report.sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return out.getvalue().encode("utf-8")
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the metrics of every HTTP request; serves X-Profile"""
+
+    def __init__(self, app, profiling: bool = PROFILE_REQUESTS):
+        self.app = app
+        self.profiling = profiling
+        self._routes = None
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED
+        if self._routes is None:
+            # Шаблон пути по обработчику: /api/accounts/{account_id}, а не сам путь
+            self._routes = {route.endpoint: route.path
+                            for route in scope["app"].routes if hasattr(route, "endpoint")}
+        return self._routes.get(endpoint, UNMATCHED)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profiled = self.profiling and any(name == b"x-profile" for name, _ in scope["headers"])
+        stats = RequestStats(profile=profiled)
+        token = _request.set(stats)
+        status = 500
+        size = 0
+
+        async def send_measured(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            # Ответ профилируемого запроса заменяется сводкой
+            if not profiled:
+                await send(message)
+
+        loop_profile = cProfile.Profile() if profiled else None
+        started = time.perf_counter()
+        try:
+            if loop_profile is not None:
+                loop_profile.enable()
+            try:
+                await self.app(scope, receive, send_measured)
+            finally:
+                if loop_profile is not None:
+                    loop_profile.disable()
+        finally:
+            elapsed = time.perf_counter() - started
+            _request.reset(token)
+            labels = (scope["method"], self._route(scope))
+            with _lock:
+                requests_total.inc(labels + (str(status),))
+                request_seconds.observe(labels, elapsed)
+                request_queries.observe(labels, stats.queries)
+                request_sql_seconds.observe(labels, stats.sql_seconds)
+                request_rows.observe(labels, stats.rows)
+                request_offload_seconds.observe(labels, stats.offload_seconds)
+                request_wait_seconds.observe(labels, stats.wait_seconds)
+                response_bytes.observe(labels, size)
+
+        if profiled:
+            body = _profile_summary(scope, status, elapsed, size, stats, [loop_profile] + stats.profiles)
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                            (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,241 @@
+"""Versioned schema migrations.
+
+``MIGRATIONS`` is the ordered list of schema changes; ``schema_version``
+records the ones applied to a database file. ``migrate`` applies the missing
+ones in order and does nothing else when the schema is current: a started
+service costs one query per shard.
+
+Each migration runs in one explicit transaction together with its version
+row, DDL included, so a crash or an error rolls it back whole and the next
+start repeats it from the beginning. Migrations must therefore not commit
+on their own. They are also idempotent (IF NOT EXISTS, column checks),
+because databases created before this table existed start at version 0
+with part of the schema in place. New schema changes are appended with the
+next version number; applied ones are never edited.
+"""
+import sqlite3
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+
+import monthly_balances
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+def _create_tables(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS accounts (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            balance INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS transactions (
+            id TEXT PRIMARY KEY,
+            account_id TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            comment TEXT,
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+    """)
+    # Месяц без строки ставки читается как ставка 0.0 (repository.get_interest_rates)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS interest_rates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rate REAL NOT NULL,
+            month TEXT NOT NULL,
+            UNIQUE(month)
+        )
+    """)
+
+
+def _column_type(conn: sqlite3.Connection, table: str, column: str) -> str:
+    for row in conn.execute(f"PRAGMA table_xinfo({table})"):
+        if row[1] == column:
+            return row[2].upper()
+    return ""
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_xinfo({table})")}
+
+
+def _money_to_minor_units(conn: sqlite3.Connection):
+    """Convert REAL rubles in accounts and transactions to INTEGER kopecks.
+
+    SQLite cannot change a column type in place, so both tables are copied
+    into new ones; indexes and monthly snapshots are recreated afterwards.
+    """
+    if _column_type(conn, "accounts", "balance") != "REAL":
+        return
+    # Остатки прерванной конвертации: деньги еще в REAL, значит копии неполные
+    conn.execute("DROP TABLE IF EXISTS accounts_minor")
+    conn.execute("DROP TABLE IF EXISTS transactions_minor")
+    # Новая таблица переименовывается в старое имя: ссылки внешнего ключа
+    # в transactions остаются на accounts
+    conn.execute("""
+        CREATE TABLE accounts_minor (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            balance INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        INSERT INTO accounts_minor (id, name, balance)
+        SELECT id, name, CAST(ROUND(balance * 100) AS INTEGER) FROM accounts
+    """)
+    conn.execute("DROP TABLE accounts")
+    conn.execute("ALTER TABLE accounts_minor RENAME TO accounts")
+
+    conn.execute("""
+        CREATE TABLE transactions_minor (
+            id TEXT PRIMARY KEY,
+            account_id TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            comment TEXT,
+            month TEXT GENERATED ALWAYS AS (substr(date, 1, 7)) VIRTUAL,
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+    """)
+    conn.execute("""
+        INSERT INTO transactions_minor (id, account_id, amount, date, comment)
+        SELECT id, account_id, CAST(ROUND(amount * 100) AS INTEGER), date, comment FROM transactions
+        ORDER BY rowid
+    """)
+    conn.execute("DROP TABLE transactions")
+    conn.execute("ALTER TABLE transactions_minor RENAME TO transactions")
+    # Снимки пересчитываются из сконвертированной истории
+    conn.execute("DROP TABLE IF EXISTS monthly_balances")
+
+
+def _transaction_month(conn: sqlite3.Connection):
+    # Месяц транзакции хранится как вычисляемая колонка, чтобы по нему можно было строить индекс
+    if "month" not in _columns(conn, "transactions"):
+        conn.execute("""
+            ALTER TABLE transactions
+            ADD COLUMN month TEXT GENERATED ALWAYS AS (substr(date, 1, 7)) VIRTUAL
+        """)
+
+
+def _transaction_indexes(conn: sqlite3.Connection):
+    # (date, id) - порядок страниц выписки; amount в индексе: сумма операций
+    # счета за период считается без обращения к таблице
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_account_date_id
+        ON transactions (account_id, date, id, amount)
+    """)
+    conn.execute("DROP INDEX IF EXISTS idx_transactions_account_date")
+    conn.execute("DROP INDEX IF EXISTS idx_transactions_account_date_amount")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_date
+        ON transactions (date)
+    """)
+    # Покрывающий индекс для месячных сумм: агрегат не обращается к таблице
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_month
+        ON transactions (month, account_id, amount)
+    """)
+
+
+def _monthly_balances(conn: sqlite3.Connection):
+    # Помесячные остатки; при первом создании заполняются из истории
+    has_snapshots = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'monthly_balances'"
+    ).fetchone()
+    monthly_balances.create_table(conn)
+    if not has_snapshots:
+        monthly_balances.rebuild(conn, commit=False)
+
+
+def _jobs(conn: sqlite3.Connection):
+    # Фоновые задачи (капитализация, импорт) и их контрольные точки
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            params TEXT NOT NULL,
+            checkpoint TEXT,
+            result TEXT,
+            error TEXT,
+            processed INTEGER NOT NULL DEFAULT 0,
+            total INTEGER,
+            unit TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            run_started_at TEXT,
+            run_processed_start INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL,
+            finished_at TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_jobs_status
+        ON jobs (status)
+    """)
+
+
+def _job_owner(conn: sqlite3.Connection):
+    # Процесс, выполняющий задачу (несколько воркеров, см. jobs.py)
+    if "owner" not in _columns(conn, "jobs"):
+        conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "accounts, transactions and interest rates", _create_tables),
+    Migration(2, "money in integer kopecks", _money_to_minor_units),
+    Migration(3, "transactions.month generated column", _transaction_month),
+    Migration(4, "transaction indexes", _transaction_indexes),
+    Migration(5, "monthly balance snapshots", _monthly_balances),
+    Migration(6, "background jobs", _jobs),
+    Migration(7, "job owners", _job_owner),
+]
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Last migration applied to the database; 0 for a new or pre-versioning one"""
+    try:
+        return conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+
+def migrate(conn: sqlite3.Connection) -> List[int]:
+    """Apply the migrations the database does not have yet; returns their versions"""
+    version = current_version(conn)
+    if version >= SCHEMA_VERSION:
+        return []
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    """)
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        # Явный BEGIN: иначе CREATE/DROP вне DML выполнились бы в autocommit
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migration.apply(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (migration.version, migration.description, datetime.now().isoformat(timespec="seconds"))
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(migration.version)
+    return applied
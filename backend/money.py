@@ -0,0 +1,52 @@
+"""Money as integer minor units (kopecks).
+
+Balances and amounts are stored, summed and updated as INTEGER kopecks, so
+SQLite aggregates are exact. Rubles exist only at the API boundary:
+``to_minor`` parses incoming amounts and ``to_major`` renders stored ones.
+"""
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+MINOR_UNITS = 100
+# Предел суммы в копейках (10 трлн рублей): остатки из тысяч таких сумм помещаются в INTEGER SQLite
+MAX_MINOR = 10 ** 15
+
+
+def to_minor(value) -> int:
+    """Rubles (number, Decimal or string) to kopecks; more than 2 decimal places is an error"""
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid amount: {value!r}")
+    try:
+        # str() для float: Decimal(0.1) дал бы двоичный хвост, str(0.1) - "0.1"
+        amount = value if isinstance(value, Decimal) else Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"Invalid amount: {value!r}")
+    minor = amount * MINOR_UNITS
+    if minor != minor.to_integral_value():
+        raise ValueError(f"Amount has more than 2 decimal places: {value!r}")
+    if abs(minor) > MAX_MINOR:
+        raise ValueError(f"Amount out of range: {value!r}")
+    return int(minor)
+
+
+def to_major(minor: Optional[int]) -> Optional[float]:
+    """Kopecks to rubles for JSON output"""
+    if minor is None:
+        return None
+    return minor / MINOR_UNITS
+
+
+def account_to_api(row) -> dict:
+    """Account row with its balance in rubles"""
+    account = dict(row)
+    account["balance"] = to_major(account["balance"])
+    return account
+
+
+def transaction_to_api(row) -> dict:
+    """Transaction row with its amount in rubles"""
+    transaction = dict(row)
+    transaction["amount"] = to_major(transaction["amount"])
+    return transaction
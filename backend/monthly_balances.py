@@ -0,0 +1,208 @@
+"""Monthly balance snapshots maintained on every write.
+
+``monthly_balances`` holds one row per account and month with activity:
+opening and closing balance, the month's net change (all in kopecks) and
+the month's rate.
+Writers fold their (account, month, amount) deltas in with ``apply_deltas``
+(or, for large set-based batches, stage them in a temporary table and call
+``apply_staged_deltas``) in the same transaction, *before* updating
+``accounts.balance``. ``rebuild`` backfills the table from history:
+
+    python -m monthly_balances rebuild
+"""
+import argparse
+import sqlite3
+from typing import Iterable, Tuple
+
+
+def create_table(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS monthly_balances (
+            account_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            opening INTEGER NOT NULL,
+            net_change INTEGER NOT NULL,
+            closing INTEGER NOT NULL,
+            rate REAL NOT NULL DEFAULT 0.0,
+            PRIMARY KEY (account_id, month)
+        ) WITHOUT ROWID
+    """)
+    # Покрывающий индекс для выборки месяцев дашборда
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_monthly_balances_month_net
+        ON monthly_balances (month, account_id, net_change)
+    """)
+    conn.execute("DROP INDEX IF EXISTS idx_monthly_balances_month")
+
+
+def _ensure_staging(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS balance_deltas (
+            account_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            amount INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS temp.idx_balance_deltas
+        ON balance_deltas (account_id, month)
+    """)
+
+
+def stage_deltas_from(conn: sqlite3.Connection, select_sql: str, params=()):
+    """Stage deltas produced by a query returning (account_id, month, amount)"""
+    _ensure_staging(conn)
+    conn.execute(f"INSERT INTO balance_deltas (account_id, month, amount) {select_sql}", params)
+
+
+def apply_staged_deltas(conn: sqlite3.Connection):
+    """Fold staged deltas into the snapshots; does not commit.
+
+    Must run before ``accounts.balance`` is updated: an account's first
+    snapshot opens at its current (pre-posting) balance.
+    """
+    _ensure_staging(conn)
+    # Недостающие месяцы открываются остатком соседнего месяца (до применения дельт)
+    conn.execute("""
+        INSERT OR IGNORE INTO monthly_balances (account_id, month, opening, net_change, closing, rate)
+        SELECT d.account_id, d.month, d.opening, 0, d.opening, d.rate
+        FROM (
+            SELECT keys.account_id, keys.month,
+                   COALESCE(
+                       (SELECT m.closing FROM monthly_balances m
+                        WHERE m.account_id = keys.account_id AND m.month < keys.month
+                        ORDER BY m.month DESC LIMIT 1),
+                       (SELECT m.opening FROM monthly_balances m
+                        WHERE m.account_id = keys.account_id AND m.month > keys.month
+                        ORDER BY m.month LIMIT 1),
+                       (SELECT a.balance FROM accounts a WHERE a.id = keys.account_id),
+                       0
+                   ) AS opening,
+                   COALESCE((SELECT r.rate FROM interest_rates r WHERE r.month = keys.month), 0) AS rate
+            FROM (SELECT DISTINCT account_id, month FROM balance_deltas) AS keys
+        ) AS d
+    """)
+    conn.execute("""
+        UPDATE monthly_balances
+        SET net_change = net_change + d.amount,
+            closing = closing + d.amount
+        FROM (
+            SELECT account_id, month, SUM(amount) AS amount
+            FROM balance_deltas
+            GROUP BY account_id, month
+        ) AS d
+        WHERE monthly_balances.account_id = d.account_id
+          AND monthly_balances.month = d.month
+    """)
+    # Движение месяца сдвигает остатки всех следующих месяцев
+    conn.execute("""
+        UPDATE monthly_balances
+        SET opening = opening + later.amount,
+            closing = closing + later.amount
+        FROM (
+            SELECT m.account_id, m.month, SUM(d.amount) AS amount
+            FROM monthly_balances m
+            JOIN balance_deltas d ON d.account_id = m.account_id AND d.month < m.month
+            GROUP BY m.account_id, m.month
+        ) AS later
+        WHERE monthly_balances.account_id = later.account_id
+          AND monthly_balances.month = later.month
+    """)
+    conn.execute("DELETE FROM balance_deltas")
+
+
+_OPEN_MONTH_SQL = """
+    INSERT OR IGNORE INTO monthly_balances (account_id, month, opening, net_change, closing, rate)
+    SELECT :account_id, :month, opening, 0, opening,
+           COALESCE((SELECT rate FROM interest_rates WHERE month = :month), 0)
+    FROM (
+        SELECT COALESCE(
+            (SELECT closing FROM monthly_balances
+             WHERE account_id = :account_id AND month < :month
+             ORDER BY month DESC LIMIT 1),
+            (SELECT opening FROM monthly_balances
+             WHERE account_id = :account_id AND month > :month
+             ORDER BY month LIMIT 1),
+            (SELECT balance FROM accounts WHERE id = :account_id),
+            0
+        ) AS opening
+    )
+"""
+
+_ADD_TO_MONTH_SQL = """
+    UPDATE monthly_balances
+    SET net_change = net_change + :amount, closing = closing + :amount
+    WHERE account_id = :account_id AND month = :month
+"""
+
+_ADD_TO_LATER_MONTHS_SQL = """
+    UPDATE monthly_balances
+    SET opening = opening + :amount, closing = closing + :amount
+    WHERE account_id = :account_id AND month > :month
+"""
+
+
+def apply_deltas(conn: sqlite3.Connection, deltas: Iterable[Tuple[str, str, int]]):
+    """Fold a few (account_id, month, amount) deltas into the snapshots; does not commit.
+
+    Same contract as ``apply_staged_deltas``, without the staging table, for
+    single postings and small batches.
+    """
+    params = [{"account_id": account_id, "month": month, "amount": amount}
+              for account_id, month, amount in deltas]
+    # Сначала открываются все недостающие месяцы, затем применяются дельты
+    conn.executemany(_OPEN_MONTH_SQL, params)
+    conn.executemany(_ADD_TO_MONTH_SQL, params)
+    conn.executemany(_ADD_TO_LATER_MONTHS_SQL, params)
+
+
+def set_month_rate(conn: sqlite3.Connection, month: str, rate: float):
+    conn.execute("UPDATE monthly_balances SET rate = ? WHERE month = ?", (rate, month))
+
+
+def rebuild(conn: sqlite3.Connection, commit: bool = True):
+    """Recompute every snapshot from transactions and current balances"""
+    conn.execute("DELETE FROM monthly_balances")
+    # closing(M) = текущий баланс - движение всех месяцев после M
+    conn.execute("""
+        INSERT INTO monthly_balances (account_id, month, opening, net_change, closing, rate)
+        SELECT account_id, month, closing - net_change, net_change, closing, rate
+        FROM (
+            SELECT totals.account_id, totals.month, totals.net_change,
+                   a.balance - (
+                       SUM(totals.net_change) OVER (
+                           PARTITION BY totals.account_id ORDER BY totals.month DESC
+                           ROWS UNBOUNDED PRECEDING
+                       ) - totals.net_change
+                   ) AS closing,
+                   COALESCE(r.rate, 0) AS rate
+            FROM (
+                SELECT account_id, month, SUM(amount) AS net_change
+                FROM transactions
+                GROUP BY account_id, month
+            ) AS totals
+            JOIN accounts a ON a.id = totals.account_id
+            LEFT JOIN interest_rates r ON r.month = totals.month
+        )
+    """)
+    if commit:
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monthly balance snapshots")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--database", default=None, help="SQLite file (default: DATABASE_URL)")
+    args = parser.parse_args()
+
+    from database import DATABASE_URL, init_db
+    database_url = args.database or DATABASE_URL
+    init_db(database_url)
+    with sqlite3.connect(database_url) as conn:
+        rebuild(conn)
+        rows = conn.execute("SELECT COUNT(*) FROM monthly_balances").fetchone()[0]
+    print(f"monthly_balances rebuilt: {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
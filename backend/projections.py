@@ -0,0 +1,183 @@
+"""Projected month-end and year-end balances of the whole book.
+
+The projection replays what interest capitalization will do: at the end of
+every remaining month of the year each account gains
+``ROUND(balance * rate / 100 / 12)`` kopecks, where ``rate`` is that month's
+annual rate in percent (0 when no rate is set, as in capitalization) and the
+rounding is SQLite's, half away from zero. Months an account was already
+capitalized for are skipped for that account.
+
+Balances are loaded into NumPy arrays and every month is applied to all
+accounts at once; without NumPy the same arithmetic runs as a Python loop.
+Every shard projects its own accounts in parallel. The result for a given
+database state is computed once and reused until the next commit (see
+``cache.etag``).
+"""
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cache
+from capitalization import INTEREST_ID_PREFIX
+from money import to_major
+from serialization import dumps, encode_rows
+
+# NumPy загружается при первой проекции, а не при импорте: это ~70 ms старта процесса
+np = None
+_numpy_checked = False
+
+COLUMNS = ["id", "balance", "month_end", "year_end"]
+
+_lock = asyncio.Lock()
+_computed: Optional[Tuple[str, Dict]] = None
+
+
+def remaining_months(today: datetime) -> List[str]:
+    """Current month and the rest of the year"""
+    return [f"{today.year}-{month:02d}" for month in range(today.month, 13)]
+
+
+def capitalized_months(conn, months: Sequence[str]) -> List[str]:
+    """Months with at least one interest posting (ids ``interest-YYYY-MM-<account>``)"""
+    found = []
+    for month in months:
+        prefix = f"{INTEREST_ID_PREFIX}-{month}-"
+        # Диапазон по первичному ключу ("~" больше любого символа UUID), без сканирования таблицы
+        row = conn.execute(
+            "SELECT 1 FROM transactions WHERE id > ? AND id < ? LIMIT 1", (prefix, prefix + "~")
+        ).fetchone()
+        if row is not None:
+            found.append(month)
+    return found
+
+
+def load_book(conn, months: Sequence[str]) -> Tuple[List[str], List[int], Dict[str, List[bool]]]:
+    """Account ids, balances in kopecks and, for each month in ``months``, capitalized flags"""
+    flags = "".join(", EXISTS (SELECT 1 FROM transactions WHERE id = ? || a.id)" for _ in months)
+    cursor = conn.cursor()
+    # Кортежи вместо sqlite3.Row: на миллионе строк это заметная часть загрузки
+    cursor.row_factory = None
+    rows = cursor.execute(
+        f"SELECT a.id, a.balance{flags} FROM accounts a ORDER BY a.rowid",
+        [f"{INTEREST_ID_PREFIX}-{month}-" for month in months]
+    ).fetchall()
+    columns = list(zip(*rows)) if rows else [()] * (2 + len(months))
+    done = {month: columns[2 + i] for i, month in enumerate(months)}
+    return list(columns[0]), list(columns[1]), done
+
+
+def load_numpy():
+    """The numpy module, imported on first use; None when it is not installed"""
+    global np, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = None
+        _numpy_checked = True
+    return np
+
+
+def _round_half_away(values):
+    # ROUND() в SQLite: усечение x + 0.5 со знаком x
+    return np.trunc(values + np.copysign(0.5, values)).astype(np.int64)
+
+
+def project_numpy(balances: Sequence[int], rates: Sequence[float],
+                  done: Sequence[Optional[Sequence[bool]]]) -> Tuple[List[int], List[int]]:
+    """Month-end (after the first month) and year-end balances, vectorized over accounts"""
+    load_numpy()
+    current = np.asarray(balances, dtype=np.int64)
+    month_end = current
+    for i, (rate, skip) in enumerate(zip(rates, done)):
+        interest = _round_half_away(current * (rate / 100 / 12))
+        if skip is not None:
+            interest[np.asarray(skip, dtype=bool)] = 0
+        current = current + interest
+        if i == 0:
+            month_end = current
+    return month_end.tolist(), current.tolist()
+
+
+def project_python(balances: Sequence[int], rates: Sequence[float],
+                   done: Sequence[Optional[Sequence[bool]]]) -> Tuple[List[int], List[int]]:
+    """Same as ``project_numpy`` account by account"""
+    month_end = []
+    year_end = []
+    for position, balance in enumerate(balances):
+        for i, (rate, skip) in enumerate(zip(rates, done)):
+            if skip is None or not skip[position]:
+                interest = balance * (rate / 100 / 12)
+                balance += int(interest + (0.5 if interest >= 0 else -0.5))
+            if i == 0:
+                month_end.append(balance)
+        year_end.append(balance)
+    return month_end, year_end
+
+
+def project(balances: Sequence[int], rates: Sequence[float],
+            done: Sequence[Optional[Sequence[bool]]]) -> Tuple[List[int], List[int]]:
+    """``project_numpy`` when NumPy is installed, ``project_python`` otherwise"""
+    if load_numpy() is not None:
+        return project_numpy(balances, rates, done)
+    return project_python(balances, rates, done)
+
+
+def compute(conn, today: Optional[datetime] = None) -> Dict:
+    """Rates used and projected balances (kopecks) of every account"""
+    months = remaining_months(today or datetime.now())
+    rates = cache.get_interest_rates(conn, months)
+    capitalized = capitalized_months(conn, months)
+    ids, balances, done = load_book(conn, capitalized)
+    month_end, year_end = project(balances, [rates[month] for month in months],
+                                  [done.get(month) for month in months])
+    return {
+        "rates": rates,
+        "ids": ids,
+        "balances": balances,
+        "month_end": month_end,
+        "year_end": year_end,
+    }
+
+
+def merge(parts: List[Dict]) -> Dict:
+    """One result from the ``compute`` results of every shard"""
+    if len(parts) == 1:
+        return parts[0]
+    merged = {"rates": parts[0]["rates"]}
+    for column in ("ids", "balances", "month_end", "year_end"):
+        merged[column] = [value for part in parts for value in part[column]]
+    return merged
+
+
+def encode(result: Dict, fmt: str) -> bytes:
+    table = encode_rows(
+        COLUMNS,
+        list(zip(result["ids"], result["balances"], result["month_end"], result["year_end"])),
+        fmt,
+        {"balance": to_major, "month_end": to_major, "year_end": to_major},
+    )
+    return b'{"rates":' + dumps(result["rates"]) + b',"accounts":' + table + b"}"
+
+
+async def projections_if_changed(if_none_match: Optional[str], fmt: str = "json",
+                                 today: Optional[datetime] = None) -> Tuple[str, Optional[bytes]]:
+    """ETag and encoded projections, or None when the client's copy is current.
+
+    The body is ``{"rates": {month: rate}, "accounts": <table in fmt>}``
+    with amounts in rubles.
+    """
+    from db_executor import offload, run_read_all
+
+    global _computed
+    today = today or datetime.now()
+    tag = await offload(cache.etag, today.strftime("%Y-%m"))
+    if cache.etag_matches(if_none_match, tag):
+        return tag, None
+    # Одновременные запросы ждут один расчет, а не считают каждый свой
+    async with _lock:
+        if _computed is None or _computed[0] != tag:
+            _computed = (tag, merge(await run_read_all(compute, today)))
+        result = _computed[1]
+    return tag, await offload(encode, result, fmt)
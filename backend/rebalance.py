@@ -0,0 +1,189 @@
+"""Move accounts between shards (see shards.py).
+
+    python -m rebalance --shards 4 [--database banking.db] [--dry-run]
+
+Spreads the slots evenly over the given number of shards, moving as few as
+possible. The count may grow (new shard files are created, with the interest
+rates of shard 0) or shrink (the last shards are emptied and dropped from the
+map; their files are left on disk). Run it while the service is stopped.
+
+Slots move one (source, target) pair at a time:
+
+1. the slots' accounts, transactions and monthly snapshots are copied into
+   the target in one transaction;
+2. the shard map is saved with the slots on the target;
+3. the rows are deleted from the source.
+
+The shard that owns a slot in the saved map always has all of its rows, so an
+interrupted run is finished by starting it again: rows found in a shard that
+does not own their slot are copies and are deleted first.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List
+
+import shards
+from database import TRANSACTION_COLUMNS, init_db
+from shards import ShardMap, balanced_slots, slot_of
+
+MONTHLY_BALANCE_COLUMNS = "account_id, month, opening, net_change, closing, rate"
+
+# (таблица, колонки, колонка со счетом)
+TABLES = [
+    ("accounts", "id, name, balance", "id"),
+    ("transactions", TRANSACTION_COLUMNS, "account_id"),
+    ("monthly_balances", MONTHLY_BALANCE_COLUMNS, "account_id"),
+]
+
+
+@contextmanager
+def connect(path: str):
+    """Connection to a shard with the ``slot_of`` SQL function"""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.create_function("slot_of", 1, slot_of, deterministic=True)
+        yield conn
+    finally:
+        conn.close()
+
+
+def _stage_slots(conn: sqlite3.Connection, slots: Iterable[int]):
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS rebalance_slots (slot INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM rebalance_slots")
+    conn.executemany("INSERT INTO rebalance_slots (slot) VALUES (?)", ((slot,) for slot in slots))
+
+
+def copy_slots(conn: sqlite3.Connection, source_path: str, slots: List[int]) -> int:
+    """Copy the rows of ``slots`` from ``source_path`` into ``conn``'s database; returns accounts copied"""
+    conn.execute("ATTACH DATABASE ? AS source", (source_path,))
+    try:
+        _stage_slots(conn, slots)
+        copied = 0
+        for table, columns, account_column in TABLES:
+            cursor = conn.execute(
+                f"""
+                INSERT OR REPLACE INTO main.{table} ({columns})
+                SELECT {columns} FROM source.{table}
+                WHERE slot_of({account_column}) IN (SELECT slot FROM rebalance_slots)
+                """
+            )
+            if table == "accounts":
+                copied = cursor.rowcount
+        conn.commit()
+    finally:
+        conn.rollback()
+        conn.execute("DETACH DATABASE source")
+    return copied
+
+
+def delete_slots(conn: sqlite3.Connection, slots: Iterable[int]) -> int:
+    """Delete the rows of ``slots``; returns accounts deleted"""
+    _stage_slots(conn, slots)
+    deleted = 0
+    # Сначала зависимые таблицы, счета - последними
+    for table, _, account_column in reversed(TABLES):
+        cursor = conn.execute(
+            f"DELETE FROM {table} WHERE slot_of({account_column}) IN (SELECT slot FROM rebalance_slots)"
+        )
+        if table == "accounts":
+            deleted = cursor.rowcount
+    conn.commit()
+    return deleted
+
+
+def copy_rates(conn: sqlite3.Connection, source_path: str):
+    """Make the interest rates of ``conn``'s database equal to those of ``source_path``"""
+    conn.execute("ATTACH DATABASE ? AS source", (source_path,))
+    try:
+        conn.execute("""
+            INSERT INTO main.interest_rates (rate, month)
+            SELECT rate, month FROM source.interest_rates WHERE true
+            ON CONFLICT(month) DO UPDATE SET rate = excluded.rate
+        """)
+        conn.commit()
+    finally:
+        conn.rollback()
+        conn.execute("DETACH DATABASE source")
+
+
+def plan_moves(current: List[int], target: List[int]) -> Dict[tuple, List[int]]:
+    """(source, target) shard pair -> slots to move"""
+    moves = defaultdict(list)
+    for slot, (source, destination) in enumerate(zip(current, target)):
+        if source != destination:
+            moves[(source, destination)].append(slot)
+    return dict(sorted(moves.items()))
+
+
+def rebalance(database_url: str, count: int, dry_run: bool = False,
+              log: Callable[[str], None] = print) -> Dict[tuple, List[int]]:
+    """Move slots so that ``count`` shards own equal shares; returns the moves"""
+    shard_map = ShardMap.load(database_url)
+    target = balanced_slots(shard_map.slots, count)
+    moves = plan_moves(shard_map.slots, target)
+    for (source, destination), slots in moves.items():
+        log(f"shard {source} -> shard {destination}: {len(slots)} slots")
+    if dry_run:
+        return moves
+
+    if count > len(shard_map):
+        for index in range(len(shard_map), count):
+            path = shards.shard_path(database_url, index)
+            init_db(path)
+            with connect(path) as conn:
+                copy_rates(conn, shard_map.paths[0])
+            shard_map.paths.append(path)
+        shard_map.save(database_url)
+
+    # Остатки прерванного запуска: строки, слот которых принадлежит другому шарду
+    for shard, path in enumerate(shard_map.paths):
+        foreign = set(range(shards.SLOTS)) - set(shard_map.slots_of(shard))
+        if foreign:
+            with connect(path) as conn:
+                deleted = delete_slots(conn, foreign)
+            if deleted:
+                log(f"shard {shard}: removed {deleted} accounts owned by other shards")
+
+    for (source, destination), slots in moves.items():
+        started = time.perf_counter()
+        with connect(shard_map.paths[destination]) as conn:
+            copied = copy_slots(conn, shard_map.paths[source], slots)
+        for slot in slots:
+            shard_map.slots[slot] = destination
+        shard_map.save(database_url)
+        with connect(shard_map.paths[source]) as conn:
+            delete_slots(conn, slots)
+        log(f"shard {source} -> shard {destination}: moved {copied} accounts "
+            f"in {time.perf_counter() - started:.2f} s")
+
+    if count < len(shard_map):
+        for path in shard_map.paths[count:]:
+            log(f"{path} is no longer used and can be removed")
+        shard_map.paths = shard_map.paths[:count]
+        shard_map.save(database_url)
+    return moves
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Move accounts between shards")
+    parser.add_argument("--shards", type=int, required=True, help="number of shards after the move")
+    parser.add_argument("--database", default=None, help="SQLite file of shard 0 (default: DATABASE_URL)")
+    parser.add_argument("--dry-run", action="store_true", help="print the moves without changing anything")
+    args = parser.parse_args()
+
+    from database import DATABASE_URL
+    try:
+        rebalance(args.database or DATABASE_URL, args.shards, args.dry_run)
+    except (ValueError, sqlite3.Error) as e:
+        print(f"rebalance failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
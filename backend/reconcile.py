@@ -0,0 +1,105 @@
+"""Ledger reconciliation: balances, monthly snapshots and transactions must agree.
+
+    python -m reconcile [--database banking.db]
+
+Exits with a non-zero status and prints the discrepancies when any of the
+checks below fails. Without ``--database`` every shard of DATABASE_URL is
+checked. Money is integer kopecks, so every comparison is exact.
+"""
+import argparse
+import sqlite3
+import sys
+from typing import Dict, List
+
+MAX_REPORTED = 100
+
+# название проверки: запрос, возвращающий (account_id, month, expected, actual)
+CHECKS = {
+    # Денежные колонки содержат только целые копейки
+    "non-integer amount": """
+        SELECT account_id, month, NULL, amount FROM transactions
+        WHERE typeof(amount) != 'integer'
+    """,
+    "non-integer balance": """
+        SELECT id, NULL, NULL, balance FROM accounts
+        WHERE typeof(balance) != 'integer'
+    """,
+    # Движение месяца в снимке равно сумме транзакций месяца
+    "month total": """
+        SELECT totals.account_id, totals.month, totals.amount, COALESCE(m.net_change, 0)
+        FROM (
+            SELECT account_id, month, SUM(amount) AS amount
+            FROM transactions
+            GROUP BY account_id, month
+        ) AS totals
+        LEFT JOIN monthly_balances m ON m.account_id = totals.account_id AND m.month = totals.month
+        WHERE m.net_change IS NULL OR m.net_change != totals.amount
+    """,
+    "snapshot without transactions": """
+        SELECT m.account_id, m.month, 0, m.net_change
+        FROM monthly_balances m
+        WHERE m.net_change != 0
+          AND NOT EXISTS (
+              SELECT 1 FROM transactions t WHERE t.month = m.month AND t.account_id = m.account_id
+          )
+    """,
+    # Закрытие месяца = открытие + движение; открытие = закрытие предыдущего месяца
+    "closing": """
+        SELECT account_id, month, opening + net_change, closing FROM monthly_balances
+        WHERE closing != opening + net_change
+    """,
+    "opening": """
+        SELECT account_id, month, previous_closing, opening FROM (
+            SELECT account_id, month, opening,
+                   LAG(closing) OVER (PARTITION BY account_id ORDER BY month) AS previous_closing
+            FROM monthly_balances
+        )
+        WHERE previous_closing IS NOT NULL AND previous_closing != opening
+    """,
+    # Последний снимок счета закрывается текущим балансом
+    "balance": """
+        SELECT a.id, m.month, m.closing, a.balance
+        FROM accounts a
+        JOIN monthly_balances m ON m.account_id = a.id
+        WHERE m.month = (SELECT MAX(month) FROM monthly_balances WHERE account_id = a.id)
+          AND m.closing != a.balance
+    """,
+}
+
+
+def find_discrepancies(conn: sqlite3.Connection, limit: int = MAX_REPORTED) -> List[Dict]:
+    """Run every check and return at most ``limit`` discrepancies per check"""
+    discrepancies = []
+    for check, sql in CHECKS.items():
+        for account_id, month, expected, actual in conn.execute(f"{sql} LIMIT ?", (limit,)):
+            discrepancies.append({
+                "check": check,
+                "account_id": account_id,
+                "month": month,
+                "expected": expected,
+                "actual": actual,
+            })
+    return discrepancies
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Ledger reconciliation")
+    parser.add_argument("--database", default=None, help="SQLite file (default: DATABASE_URL)")
+    args = parser.parse_args()
+
+    from database import DATABASE_URL
+    from shards import ShardMap
+    paths = [args.database] if args.database else ShardMap.load(DATABASE_URL).paths
+    discrepancies = []
+    for path in paths:
+        with sqlite3.connect(path) as conn:
+            discrepancies.extend(find_discrepancies(conn))
+    for item in discrepancies:
+        print(f"{item['check']:>30}  {item['account_id']}  {item['month'] or '':>7}  "
+              f"expected {item['expected']}  actual {item['actual']}")
+    print(f"{len(discrepancies)} discrepancies")
+    return 1 if discrepancies else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
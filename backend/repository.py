@@ -0,0 +1,169 @@
+"""Synchronous data-access functions.
+
+Each function takes an open connection as its first argument and is meant to
+be called through ``db_executor.run_read`` / ``db_executor.run_write`` (or
+their per-account ``_for`` variants, which pick the account's shard) so the
+blocking sqlite3 work happens off the event loop.
+"""
+import base64
+import binascii
+import json
+import sqlite3
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import monthly_balances
+from database import ACCOUNT_TRANSACTIONS_SQL
+from money import account_to_api
+
+# Размер страницы выписки по умолчанию и максимальный
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def get_account(conn: sqlite3.Connection, account_id: str) -> Optional[Dict]:
+    row = conn.execute("SELECT * FROM accounts WHERE id = ?", (account_id,)).fetchone()
+    return account_to_api(row) if row else None
+
+
+def create_account(conn: sqlite3.Connection, name: str, balance: int, account_id: Optional[str] = None) -> Dict:
+    """Create an account with an opening balance in kopecks.
+
+    ``account_id`` is generated when not given; with several shards the
+    caller picks it first, since the id decides the shard.
+    """
+    row = conn.execute(
+        "INSERT INTO accounts (id, name, balance) VALUES (?, ?, ?) RETURNING *",
+        (account_id or str(uuid.uuid4()), name, balance)
+    ).fetchall()[0]
+    conn.commit()
+    return account_to_api(row)
+
+
+def update_account_name(conn: sqlite3.Connection, account_id: str, name: str) -> Optional[Dict]:
+    rows = conn.execute("UPDATE accounts SET name = ? WHERE id = ? RETURNING *", (name, account_id)).fetchall()
+    if not rows:
+        return None
+    conn.commit()
+    return account_to_api(rows[0])
+
+
+def apply_posting(conn: sqlite3.Connection, account_id: str, amount: int, date: str,
+                  comment: Optional[str]) -> Optional[int]:
+    """Post ``amount`` kopecks inside the caller's transaction; does not commit.
+
+    Returns the new balance in kopecks, or None if the account is missing.
+    """
+    if conn.execute("SELECT id FROM accounts WHERE id = ?", (account_id,)).fetchone() is None:
+        return None
+
+    transaction_id = str(uuid.uuid4())
+    conn.execute(
+        "INSERT INTO transactions (id, account_id, amount, date, comment) VALUES (?, ?, ?, ?, ?)",
+        (transaction_id, account_id, amount, date, comment)
+    )
+
+    # Помесячный остаток обновляется до баланса счета, в той же транзакции
+    monthly_balances.apply_deltas(conn, [(account_id, date[:7], amount)])
+
+    # Баланс меняется дельтой в базе, а не записью посчитанного в Python значения
+    return conn.execute(
+        "UPDATE accounts SET balance = balance + ? WHERE id = ? RETURNING balance",
+        (amount, account_id)
+    ).fetchall()[0][0]
+
+
+def post_transaction(conn: sqlite3.Connection, account_id: str, amount: int, date: str,
+                     comment: Optional[str]) -> Optional[int]:
+    """Record a transaction of ``amount`` kopecks and return the new balance in kopecks,
+    or None if the account is missing"""
+    # Блокировка записи берется до чтения: проверка счета и проводка - одна транзакция
+    conn.execute("BEGIN IMMEDIATE")
+    new_balance = apply_posting(conn, account_id, amount, date, comment)
+    if new_balance is None:
+        conn.rollback()
+        return None
+    conn.commit()
+    return new_balance
+
+
+def encode_cursor(row: Dict) -> str:
+    """Opaque cursor pointing after ``row`` in (date, id) order"""
+    raw = json.dumps([row["date"], row["id"]], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        date, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(date, str) or not isinstance(transaction_id, str):
+            raise ValueError(cursor)
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return date, transaction_id
+
+
+def list_account_transactions(conn: sqlite3.Connection, account_id: str,
+                              limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                              date_from: Optional[str] = None, date_to: Optional[str] = None,
+                              amount_min: Optional[int] = None, amount_max: Optional[int] = None,
+                              comment: Optional[str] = None) -> Optional[Tuple[List[sqlite3.Row], Optional[str]]]:
+    """One page of an account's transactions, newest first, and the cursor of the next page.
+
+    Rows are returned as read (TRANSACTION_FIELDS, amounts in kopecks) for
+    ``serialization.encode_rows``. Returns None if the account is missing.
+    Amount bounds are in kopecks.
+    Pages are keyed on (date, id), so a page costs the same however deep
+    into the history it is.
+    """
+    if conn.execute("SELECT id FROM accounts WHERE id = ?", (account_id,)).fetchone() is None:
+        return None
+
+    filters = []
+    params = [account_id]
+    if cursor is not None:
+        filters.append("(date, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    if date_from is not None:
+        filters.append("date >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        filters.append("date <= ?")
+        params.append(date_to)
+    if amount_min is not None:
+        filters.append("amount >= ?")
+        params.append(amount_min)
+    if amount_max is not None:
+        filters.append("amount <= ?")
+        params.append(amount_max)
+    if comment:
+        # Подстрока без учета регистра; спецсимволы LIKE экранируются
+        escaped = comment.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        filters.append("comment LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+
+    query = ACCOUNT_TRANSACTIONS_SQL.format(filters="".join(f" AND {f}" for f in filters))
+    # Лишняя строка показывает, есть ли следующая страница
+    params.append(limit + 1)
+    rows = conn.execute(query, params).fetchall()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def get_interest_rates(conn: sqlite3.Connection, months: List[str]) -> Dict[str, float]:
+    """Rates of ``months``; 0.0 for months without a rate"""
+    placeholders = ", ".join("?" for _ in months)
+    cursor = conn.execute(f"SELECT month, rate FROM interest_rates WHERE month IN ({placeholders})", months)
+    rates = dict.fromkeys(months, 0.0)
+    rates.update((row["month"], row["rate"]) for row in cursor)
+    return rates
+
+
+def set_interest_rate(conn: sqlite3.Connection, month: str, rate: float):
+    conn.execute("""
+        INSERT INTO interest_rates (rate, month)
+        VALUES (?, ?)
+        ON CONFLICT(month) DO UPDATE SET rate = excluded.rate
+    """, (rate, month))
+    monthly_balances.set_month_rate(conn, month, rate)
+    conn.commit()
@@ -0,0 +1,119 @@
+"""JSON encoding of API responses.
+
+``dumps`` uses orjson when it is installed and the stdlib json module
+otherwise (JSON_ENCODER=json forces the fallback); both produce the same
+compact UTF-8 JSON. Tables - lists of rows of one shape, such as transaction
+pages and exports - are encoded by ``encode_rows`` straight from sqlite3 row
+tuples: the columnar format and the stdlib encoder work column by column and
+never build a dict per row (orjson encodes objects only from dicts). Table
+formats:
+
+* ``json``: an array of objects, the usual response shape;
+* ``columnar``: ``{"column": [value, ...], ...}``, which names every column
+  once and is noticeably smaller and faster to encode and parse;
+* ``ndjson``: one object per line, for streaming.
+"""
+import json
+import os
+from json.encoder import encode_basestring
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MEDIA_TYPES = {
+    "json": "application/json; charset=utf-8",
+    "columnar": "application/json; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _json_dumps(content) -> bytes:
+    # Те же параметры, что у starlette JSONResponse
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def _orjson_dumps(content) -> bytes:
+    return orjson.dumps(content)
+
+
+DUMPS = {"json": _json_dumps}
+if orjson is not None:
+    DUMPS["orjson"] = _orjson_dumps
+
+JSON_ENCODER = os.environ.get("JSON_ENCODER", "orjson" if orjson is not None else "json")
+if JSON_ENCODER not in DUMPS:
+    raise RuntimeError(f"JSON encoder {JSON_ENCODER!r} is not available, choose from {sorted(DUMPS)}")
+
+dumps = DUMPS[JSON_ENCODER]
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the configured encoder"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def _null(value) -> str:
+    return "null"
+
+
+# Кодировщики значений SQLite для stdlib-пути; float всегда конечен (деньги - копейки / 100)
+_VALUE_ENCODERS = {
+    str: encode_basestring,
+    int: int.__repr__,
+    float: float.__repr__,
+    type(None): _null,
+}
+
+
+def _encode_value(value) -> str:
+    encode = _VALUE_ENCODERS.get(type(value))
+    return encode(value) if encode is not None else json.dumps(value, ensure_ascii=False, allow_nan=False)
+
+
+def _columns(rows: Sequence[Sequence], width: int, converters: Dict[int, Callable]) -> List[Iterable]:
+    """Transpose rows into columns, applying ``converters`` by column position"""
+    columns = list(zip(*rows)) if rows else [()] * width
+    for position, convert in converters.items():
+        columns[position] = map(convert, columns[position])
+    return columns
+
+
+def encode_rows(columns: Sequence[str], rows: Sequence[Sequence], fmt: str = "json",
+                converters: Optional[Dict[str, Callable]] = None) -> bytes:
+    """Encode rows (tuples or sqlite3.Row) as ``fmt``: json, columnar or ndjson.
+
+    ``converters`` maps a column name to a function applied to its values,
+    e.g. ``{"amount": to_major}``.
+    """
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unknown format: {fmt!r}")
+    converters = converters or {}
+
+    if dumps is _orjson_dumps and fmt != "columnar":
+        # orjson кодирует объекты только из dict, зато сам словарь - самая дорогая часть
+        objects = [dict(zip(columns, row)) for row in rows]
+        for name, convert in converters.items():
+            for obj in objects:
+                obj[name] = convert(obj[name])
+        if fmt == "json":
+            return orjson.dumps(objects)
+        return b"".join(orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE) for obj in objects)
+
+    by_position = {columns.index(name): convert for name, convert in converters.items()}
+    values = _columns(rows, len(columns), by_position)
+    if fmt == "columnar":
+        return dumps({name: list(column) for name, column in zip(columns, values)})
+
+    # Объект строки собирается по шаблону из заранее закодированных значений
+    template = "{" + ",".join(f"{encode_basestring(name)}:%s" for name in columns) + "}"
+    objects = map(template.__mod__, zip(*[map(_encode_value, column) for column in values]))
+    if fmt == "json":
+        return ("[" + ",".join(objects) + "]").encode("utf-8")
+    return "".join(obj + "\n" for obj in objects).encode("utf-8")
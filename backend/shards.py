@@ -0,0 +1,126 @@
+"""Account-sharded storage layout.
+
+Accounts are spread over several SQLite files (shards), each with the full
+schema and its own writer, so postings to accounts in different shards
+commit in parallel. An account id is hashed to one of SLOTS fixed slots and
+the shard map assigns every slot to a shard; moving accounts between shards
+(see rebalance.py) changes the map, never the hash.
+
+An account, its transactions and its monthly snapshots always live in the
+same shard, so every per-account query runs on one file. Interest rates are
+copied to every shard; jobs live in shard 0, the ``DATABASE_URL`` file.
+Other shards are ``banking-1.db``, ``banking-2.db``, ... next to it.
+
+The map is stored next to shard 0 as ``<DATABASE_URL>.shards.json``. A
+database without a map is a single shard, as before sharding.
+"""
+import json
+import os
+import zlib
+from typing import List
+
+SLOTS = 4096
+
+
+def slot_of(account_id: str) -> int:
+    """Slot of an account id; stable across processes and releases"""
+    return zlib.crc32(account_id.encode("utf-8")) % SLOTS
+
+
+def shard_path(database_url: str, index: int) -> str:
+    """File of shard ``index``: the database itself for shard 0"""
+    if index == 0:
+        return database_url
+    root, ext = os.path.splitext(database_url)
+    return f"{root}-{index}{ext}"
+
+
+def map_path(database_url: str) -> str:
+    return database_url + ".shards.json"
+
+
+class ShardMap:
+    """Shard files and the shard of every slot"""
+
+    def __init__(self, paths: List[str], slots: List[int], saved: bool = False):
+        if len(slots) != SLOTS:
+            raise ValueError(f"Shard map must assign {SLOTS} slots, got {len(slots)}")
+        if any(not 0 <= shard < len(paths) for shard in slots):
+            raise ValueError("Shard map assigns a slot to an unknown shard")
+        self.paths = paths
+        self.slots = slots
+        # Карта прочитана из файла или уже записана в него
+        self.saved = saved
+
+    @classmethod
+    def default(cls, database_url: str, count: int) -> "ShardMap":
+        """``count`` shards with the slots dealt out round-robin"""
+        if count < 1:
+            raise ValueError("At least one shard is required")
+        return cls([shard_path(database_url, i) for i in range(count)], [slot % count for slot in range(SLOTS)])
+
+    @classmethod
+    def load(cls, database_url: str, count: int = 1) -> "ShardMap":
+        """The stored map of the database, or the default one for ``count`` shards"""
+        path = map_path(database_url)
+        if not os.path.exists(path):
+            return cls.default(database_url, count)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("slot_count") != SLOTS:
+            raise ValueError(f"{path} was written for {data.get('slot_count')} slots, expected {SLOTS}")
+        # Пути в файле относительно каталога базы: каталог можно переносить целиком
+        directory = os.path.dirname(database_url)
+        return cls([os.path.join(directory, name) for name in data["shards"]], data["slots"], saved=True)
+
+    def save(self, database_url: str):
+        """Write the map atomically: readers see the old or the new map, never a partial one"""
+        path = map_path(database_url)
+        directory = os.path.dirname(database_url)
+        data = {
+            "slot_count": SLOTS,
+            "shards": [os.path.relpath(shard, directory or ".") for shard in self.paths],
+            "slots": self.slots,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self.saved = True
+
+    def shard_of(self, account_id: str) -> int:
+        return self.slots[slot_of(account_id)]
+
+    def slots_of(self, shard: int) -> List[int]:
+        return [slot for slot, owner in enumerate(self.slots) if owner == shard]
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+
+def balanced_slots(slots: List[int], count: int) -> List[int]:
+    """Assignment of SLOTS over ``count`` shards, as even as possible, moving as few slots as possible.
+
+    ``slots`` is the current assignment; slots of shards ``count`` and above
+    are always moved.
+    """
+    if count < 1:
+        raise ValueError("At least one shard is required")
+    quota = [SLOTS // count + (1 if i < SLOTS % count else 0) for i in range(count)]
+    target = list(slots)
+    released = []
+    owned = [0] * count
+    for slot, shard in enumerate(slots):
+        if shard < count and owned[shard] < quota[shard]:
+            owned[shard] += 1
+        else:
+            released.append(slot)
+    shard = 0
+    for slot in released:
+        while owned[shard] >= quota[shard]:
+            shard += 1
+        target[slot] = shard
+        owned[shard] += 1
+    return target
@@ -0,0 +1,76 @@
+"""Incremental decoding of request bodies and uploads."""
+import codecs
+import csv
+from typing import AsyncIterable, AsyncIterator, List
+
+# Предел длины одной записи CSV; совпадает с csv.field_size_limit() по умолчанию
+MAX_CSV_RECORD_SIZE = 128 * 1024
+
+
+async def aiter_lines(chunks: AsyncIterable[bytes], encoding: str = "utf-8") -> AsyncIterator[str]:
+    """Yield decoded lines (without line endings) from a stream of byte chunks"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    buffer = ""
+    first = True
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        if first and buffer:
+            # BOM из выгрузок Excel не должен попасть в первый заголовок
+            buffer = buffer.lstrip("﻿")
+            first = False
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+def _parse_record(lines: List[str], line_number: int) -> List[str]:
+    try:
+        return next(csv.reader(["\n".join(lines)]))
+    except csv.Error as e:
+        raise ValueError(f"Malformed CSV record at line {line_number}: {str(e)}")
+
+
+async def aiter_csv_rows(lines: AsyncIterator[str],
+                         max_record_size: int = MAX_CSV_RECORD_SIZE) -> AsyncIterator[List[str]]:
+    """Parse CSV records from lines; quoted fields may span several lines.
+
+    A record longer than ``max_record_size`` characters (usually an unbalanced
+    quote swallowing the rest of the file) raises ValueError.
+    """
+    pending: List[str] = []
+    size = 0
+    open_quote = False
+    line_number = 0
+    first_line = 0
+    async for line in lines:
+        line_number += 1
+        if not pending:
+            first_line = line_number
+        pending.append(line)
+        size += len(line) + 1
+        # Четность кавычек считается по новой строке, а не по всей записи заново
+        if line.count('"') % 2:
+            open_quote = not open_quote
+        if size > max_record_size:
+            raise ValueError(f"CSV record at line {first_line} is longer than {max_record_size} characters"
+                             + (" (unbalanced quote?)" if open_quote else ""))
+        if open_quote:
+            continue
+        if len(pending) > 1 or line.strip():
+            yield _parse_record(pending, first_line)
+        pending = []
+        size = 0
+    if pending:
+        yield _parse_record(pending, first_line)
+
+
+async def aiter_upload(file, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    """Read an UploadFile chunk by chunk"""
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
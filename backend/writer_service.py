@@ -0,0 +1,242 @@
+"""Single writer process for multi-worker deployments.
+
+    python -m writer_service [--socket banking.db.writer.sock]
+    DB_WRITER_SOCKET=banking.db.writer.sock uvicorn main:app --workers 8
+
+Every uvicorn worker is a separate process with its own connection pools, so
+by default each one writes on its own and the workers queue for the SQLite
+write lock, retrying on SQLITE_BUSY (see db_pool.py). With DB_WRITER_SOCKET
+set, ``db_executor.run_write`` and its variants send the write to this
+process over a unix socket instead: it owns the only writer connection of
+every shard, so writes from all workers are serialized in one place without
+lock contention, and the workers only read.
+
+A request is a header with the payload length and the shard (big-endian
+uint32, uint16) followed by the pickled ``(fn, args, kwargs)``; the reply is
+the pickled ``(True, result)`` or ``(False, exception)`` after its uint32
+length. ``fn`` travels by reference, so it must be a module-level
+function; writes that cannot be pickled (job checkpoints are closures) and
+writes made while the writer is not reachable run in the worker as before.
+Pickle executes code on load, so the socket is created readable and
+writable by its owner only.
+
+Multi-worker mode in general: the schema is created under a file lock
+(``database.migration_lock``), jobs are owned by one worker at a time (see
+jobs.py), and the per-process caches are checked against the database commit
+counter on every lookup, so no worker serves state another has changed.
+Metrics (/metrics) and log files are per worker.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import pickle
+import socket
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_REQUEST = struct.Struct(">IH")
+_REPLY = struct.Struct(">I")
+
+
+class WriterUnavailable(ConnectionError):
+    """The writer process is not reachable and the write was not sent: it may run locally"""
+
+
+def default_socket_path(database_url: str) -> str:
+    return database_url + ".writer.sock"
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Writer process closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class WriterClient:
+    """Worker side: one blocking connection per thread (db_executor has one writer thread per shard)"""
+
+    def __init__(self, path: str, connect_timeout: float = 1.0, retry_interval: float = 5.0):
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self.retry_interval = retry_interval
+        self._local = threading.local()
+
+    def encode(self, shard: int, fn, args, kwargs) -> Optional[bytes]:
+        """The request for a write, or None when it cannot be sent to another process"""
+        try:
+            payload = pickle.dumps((fn, args, kwargs), protocol=pickle.HIGHEST_PROTOCOL)
+            return _REQUEST.pack(len(payload), shard) + payload
+        except (pickle.PicklingError, AttributeError, TypeError):
+            return None
+
+    def _socket(self) -> Optional[socket.socket]:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            # После неудачного подключения следующая попытка - не раньше чем через retry_interval
+            if time.monotonic() < getattr(self._local, "retry_at", 0.0):
+                return None
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.connect_timeout)
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                sock.close()
+                self._local.retry_at = time.monotonic() + self.retry_interval
+                logger.warning(f"Writer process at {self.path} is not reachable, writing locally: {str(e)}")
+                return None
+            sock.settimeout(None)
+            self._local.sock = sock
+        return sock
+
+    def send(self, request: bytes):
+        """Run an encoded write in the writer process and return its result.
+
+        Raises WriterUnavailable when the writer is not reachable, so the
+        caller can write locally; a connection lost after sending is an
+        sqlite3.OperationalError, since the write may have been committed.
+        """
+        for attempt in range(2):
+            sock = self._socket()
+            if sock is None:
+                raise WriterUnavailable(f"Writer process at {self.path} is not reachable")
+            try:
+                sock.sendall(request)
+                break
+            except OSError:
+                # Запрос не отправлен (писатель перезапущен): повтор на новом соединении
+                self._drop(sock)
+        else:
+            raise WriterUnavailable(f"Writer process at {self.path} is not reachable")
+        try:
+            size, = _REPLY.unpack(_recv_exactly(sock, _REPLY.size))
+            ok, value = pickle.loads(_recv_exactly(sock, size))
+        except OSError as e:
+            self._drop(sock)
+            raise sqlite3.OperationalError(f"Lost connection to the writer process: {str(e)}")
+        if ok:
+            return value
+        raise value
+
+    def _drop(self, sock: socket.socket):
+        self._local.sock = None
+        sock.close()
+
+
+_client: Optional[WriterClient] = None
+_client_lock = threading.Lock()
+
+
+def client(path: str) -> WriterClient:
+    """Process-wide client of the writer at ``path``"""
+    global _client
+    if _client is None or _client.path != path:
+        with _client_lock:
+            if _client is None or _client.path != path:
+                _client = WriterClient(path)
+    return _client
+
+
+class WriterServer:
+    """Writer side: runs writes on the writer connection of their shard, one thread per shard"""
+
+    def __init__(self, path: str):
+        from database import shard_count
+
+        self.path = path
+        self._executors = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"db-write-{shard}")
+            for shard in range(shard_count())
+        ]
+        self._server = None
+
+    def _run(self, shard: int, payload: bytes) -> bytes:
+        from database import get_pool
+
+        try:
+            fn, args, kwargs = pickle.loads(payload)
+            reply = (True, get_pool(shard).run_write(fn, *args, **kwargs))
+        except Exception as e:
+            reply = (False, e)
+        try:
+            return pickle.dumps(reply, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            return pickle.dumps((False, sqlite3.OperationalError(f"Unpicklable write result: {str(e)}")))
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    size, shard = _REQUEST.unpack(await reader.readexactly(_REQUEST.size))
+                    payload = await reader.readexactly(size)
+                except asyncio.IncompleteReadError:
+                    break
+                if shard < len(self._executors):
+                    # Записи одного шарда выполняются по очереди его потоком
+                    reply = await loop.run_in_executor(self._executors[shard], self._run, shard, payload)
+                else:
+                    reply = pickle.dumps((False, ValueError(f"No shard {shard}")))
+                writer.write(_REPLY.pack(len(reply)) + reply)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        # Сокет доступен только владельцу: запросы - pickle
+        old_umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        finally:
+            os.umask(old_umask)
+        logger.info(f"Writer process listening on {self.path}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        for executor in self._executors:
+            executor.shutdown(wait=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Single writer process")
+    parser.add_argument("--socket", default=None, help="unix socket path (default: DB_WRITER_SOCKET or <DATABASE_URL>.writer.sock)")
+    args = parser.parse_args()
+
+    import log_config
+    from database import DATABASE_URL, DB_WRITER_SOCKET, close_pool, init_shards
+
+    log_config.configure()
+    init_shards()
+    server = WriterServer(args.socket or DB_WRITER_SOCKET or default_socket_path(DATABASE_URL))
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        close_pool()
+        log_config.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())